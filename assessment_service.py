@@ -1,28 +1,74 @@
 import os
 import json
+import hashlib
 import random
 import time
-from typing import List, Dict, Optional
-from typing import List, Dict, Optional
+import uuid
+import queue
+import threading
+import concurrent.futures
+from collections import Counter
+import numpy as np
+from typing import Callable, List, Dict, Optional
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_chroma import Chroma
 from dotenv import load_dotenv
 from unstructured.partition.pdf import partition_pdf
+import progress_store
+import question_bank
+import mistake_clusters
+import remedial_cache
+import corpus_store
+import response_cache
+import metrics
+import tracing
+from rate_limiter import api_semaphore
+from clustering import kmeans, normalize_rows
+from json_stream import JsonArrayStream, extract_items, requires
 
 load_dotenv(override=True)
 
 # CONFIG
 UPLOAD_ROOT = "uploads"
 DATA_ROOT = "data"
-ASSESSMENT_DIR = os.path.join(DATA_ROOT, "assessments")
-PROGRESS_FILE = os.path.join(DATA_ROOT, "user_progress.json")
+PROMPT_VERSION = "v3" # Bump when the prompt or context building changes; old banks are then ignored
+CHROMA_PATH = "./chroma_db"
+CONTEXT_TOKEN_BUDGET = 10000 # ~40k characters, the old hard cut-off, but spread across the whole chapter
+CHARS_PER_TOKEN = 4
 COOLDOWN_SECONDS = 600 # 10 Minutes
-
-os.makedirs(ASSESSMENT_DIR, exist_ok=True)
+DEADLINE_SECONDS = 5 * 24 * 3600 # 5 Days per chapter
+STUCK_DAYS = 3 # Students on the same level this long count as stuck
+TIME_AT_LEVEL_BUCKETS = [(1, "<1d"), (3, "1-3d"), (7, "3-7d"), (float("inf"), "7d+")]
+REMEDIAL_RETRY_SECONDS = 120 # A pending plan with no live job (e.g. after a restart) is re-queued after this
+# Question bank: one larger pool per (chapter, level), attempts are sampled from it
+ATTEMPT_SIZE = {1: 10, 2: 10, 3: 5}
+POOL_SIZE = {1: 30, 2: 30, 3: 12}
+MAX_BANK_SIZE = {1: 120, 2: 120, 3: 48}
+QUESTION_SCHEMA = requires(question=str) # Questions without text can't be served
+RESPONSE_CACHE_MB = int(os.getenv("ASSESSMENT_RESPONSE_CACHE_MB", "16"))
+PROGRESS_ETAG_SECONDS = 60 # Progress ETags roll over at least this often (deadline status is time-based)
 
 # Initialize Gemini
 llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.3)
 
+# Background pre-generation (after ingest, and next-chapter prefetch)
+_prefetch_pool = metrics.MeteredThreadPool(max_workers=2, thread_name_prefix="assessment-prefetch")
+# Teacher preview fan-out; actual LLM concurrency is still capped by api_semaphore
+_generation_pool = metrics.MeteredThreadPool(max_workers=8, thread_name_prefix="assessment-gen")
+# Remedial plans are built off the submit path; plan ids currently being worked on
+_remedial_pool = metrics.MeteredThreadPool(max_workers=2, thread_name_prefix="remedial-plan")
+_remedial_jobs = set()
+_remedial_lock = threading.Lock()
+# Single-flight: one in-progress generation per question bank, shared by every caller that asks for it
+_inflight = {}
+_inflight_lock = threading.Lock()
+# Serialized teacher previews per session, stamped with chapter hashes and bank revisions
+_response_cache = response_cache.get_cache("teacher_assessments", RESPONSE_CACHE_MB * 1024 * 1024)
+metrics.register_collector("cote_inflight_jobs", "gauge", "Generations currently running or queued",
+                           lambda: {(("kind", "question_bank"),): len(_inflight),
+                                    (("kind", "remedial_plan"),): len(_remedial_jobs)})
+
 def get_session_text(session_id: str) -> str:
     """
     Extracts text from all PDFs in the session directory.
@@ -44,6 +90,7 @@ def get_session_text(session_id: str) -> str:
     
     return full_text[:50000] # Limit context window for safety
 
+@tracing.traced("get_sorted_files")
 def get_sorted_files(session_id: str):
     """Returns a list of PDF dictionaries sorted by creation time (Oldest First)."""
     session_dir = os.path.join(UPLOAD_ROOT, session_id)
@@ -63,28 +110,105 @@ def get_sorted_files(session_id: str):
     # Sort: Oldest -> Newest
     return sorted(files, key=lambda x: x["timestamp"])
 
-def get_current_chapter_context(session_id: str, chapter_file: dict) -> str:
-    """Extracts text ONLY from the specific chapter file."""
+def get_chapter_hash(chapter_file: dict) -> str:
+    """SHA-256 of the chapter PDF (the same content hash ingestion records in the corpus store)."""
+    return corpus_store.file_hash(chapter_file["path"])
+
+def get_bank_key(session_id: str, chapter_file: dict, level: int) -> tuple:
+    """Bank key = (session, chapter content hash, level, prompt version)."""
+    return (session_id, get_chapter_hash(chapter_file), level, PROMPT_VERSION)
+
+def get_chapter_chunks(session_id: str, chapter_file: dict) -> Dict:
+    """Indexed chunks (topic + AI summary + text) and their embeddings for one chapter, in ingestion order."""
+    # Reads stored vectors only, so no embedding model is needed here
+    db = Chroma(persist_directory=CHROMA_PATH, collection_name="hackathon_collection")
+    return db.get(
+        where={"$and": [{"session_id": session_id}, {"source": chapter_file["filename"]}]},
+        include=["documents", "embeddings"]
+    )
+
+def select_chunks_for_coverage(documents: List[str], embeddings, token_budget: int = CONTEXT_TOKEN_BUDGET) -> List[int]:
+    """
+    Clusters chunk embeddings and takes chunks round-robin across clusters (closest to
+    the centroid first) until the token budget is full. Returns indices in document order.
+    """
+    estimated_tokens = [len(d) // CHARS_PER_TOKEN + 1 for d in documents]
+    if sum(estimated_tokens) <= token_budget:
+        return list(range(len(documents)))
+
+    # Roughly as many clusters as chunks that fit, so every region of the chapter gets a slot
+    avg_tokens = sum(estimated_tokens) / len(documents)
+    k = max(1, min(len(documents), int(token_budget / avg_tokens)))
+    labels, centroids = kmeans(embeddings, k)
+
+    X = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+    closeness = np.sum(X * centroids[labels], axis=1)
+    queues = []
+    for c in range(len(centroids)):
+        members = np.where(labels == c)[0]
+        queues.append(list(members[np.argsort(-closeness[members])]))
+    # Bigger clusters (more material) pick first in each round
+    queues.sort(key=len, reverse=True)
+
+    selected, used = [], 0
+    while any(queues):
+        for chunk_queue in queues:
+            if not chunk_queue:
+                continue
+            idx = int(chunk_queue.pop(0))
+            if used + estimated_tokens[idx] <= token_budget:
+                selected.append(idx)
+                used += estimated_tokens[idx]
+        if used >= token_budget * 0.98:
+            break
+    return sorted(selected)
+
+def _partition_chapter_text(chapter_file: dict) -> str:
+    """Fallback when the chapter isn't indexed yet: raw text, cut at the budget."""
     try:
-        from unstructured.partition.pdf import partition_pdf
         elements = partition_pdf(filename=chapter_file["path"], strategy="fast")
-        return "\n".join([str(e) for e in elements])[:40000]
+        return "\n".join([str(e) for e in elements])[:CONTEXT_TOKEN_BUDGET * CHARS_PER_TOKEN]
     except Exception as e:
         print(f"Error reading chapter {chapter_file['filename']}: {e}")
         return ""
 
-def get_assessment_prompt(level: int, context: str) -> str:
+def _indexed_chapter_context(session_id: str, chapter_file: dict) -> str:
+    """Context built from the chapter's indexed chunks to cover the whole chapter ("" if it isn't indexed yet)."""
+    try:
+        chunks = get_chapter_chunks(session_id, chapter_file)
+        documents = chunks.get("documents") or []
+        embeddings = chunks.get("embeddings")
+        if documents and embeddings is not None and len(embeddings) == len(documents):
+            selected = select_chunks_for_coverage(documents, embeddings)
+            print(f"📚 Assessment context: {len(selected)}/{len(documents)} chunks of {chapter_file['filename']}")
+            return "\n\n".join(documents[i] for i in selected)
+    except Exception as e:
+        print(f"⚠️ Chunk lookup failed for {chapter_file['filename']}, re-parsing PDF: {e}")
+    return ""
+
+@tracing.traced("get_current_chapter_context")
+def get_current_chapter_context(session_id: str, chapter_file: dict) -> str:
+    """Context for ONLY the specific chapter, built from its indexed chunks to cover the whole chapter."""
+    return _indexed_chapter_context(session_id, chapter_file) or _partition_chapter_text(chapter_file)
+
+def get_assessment_prompt(level: int, context: str, count: int = None, avoid: List[str] = None) -> str:
+    count = count or POOL_SIZE.get(level, 10)
+    # Refills must not repeat what the bank already holds
+    avoid_text = ""
+    if avoid:
+        avoid_text = "\n        Do NOT repeat or rephrase these existing questions:\n        " + "\n        ".join(f"- {q[:160]}" for q in avoid[:60])
     if level == 1:
         return f"""
         You are an educational AI. Create a Level 1 Assessment (Recall & Understanding) based on the text below.
         
         Rules:
-        1. Generate 10 Multiple Choice Questions (MCQs).
+        1. Generate {count} Multiple Choice Questions (MCQs).
         2. Focus strictly on DEFINITIONS, DIRECT FACTS, and basic UNDERSTANDING from the text.
         3. Do not ask complex analysis questions yet.
         4. Provide 4 options for each question.
-        5. Output JSON format only.
-
+        5. Tag each question with the "topic" it tests and a "difficulty" (easy, medium or hard). Spread questions across ALL topics in the text.
+        6. Output JSON format only.
+{avoid_text}
         Text Context:
         {context}
 
@@ -92,6 +216,8 @@ def get_assessment_prompt(level: int, context: str) -> str:
         [
             {{
                 "id": 1,
+                "topic": "Section or concept name",
+                "difficulty": "easy",
                 "question": "What is...",
                 "options": ["A", "B", "C", "D"],
                 "correct_answer": "A",
@@ -106,12 +232,13 @@ def get_assessment_prompt(level: int, context: str) -> str:
         You are an educational AI. Create a Level 2 Assessment (Application & Analysis) based on the text below.
         
         Rules:
-        1. Generate 10 Multiple Choice Questions (MCQs).
+        1. Generate {count} Multiple Choice Questions (MCQs).
         2. Focus on SCENARIOS, CASE STUDIES, and APPLICATION of concepts.
         3. Questions should start like "A student observes that..." or "If X happens...", asking the user to apply knowledge.
         4. Provide 4 options for each question.
-        5. Output JSON format only.
-
+        5. Tag each question with the "topic" it tests and a "difficulty" (easy, medium or hard). Spread questions across ALL topics in the text.
+        6. Output JSON format only.
+{avoid_text}
         Text Context:
         {context}
 
@@ -119,6 +246,8 @@ def get_assessment_prompt(level: int, context: str) -> str:
         [
             {{
                 "id": 1,
+                "topic": "Section or concept name",
+                "difficulty": "medium",
                 "question": "Scenario...",
                 "options": ["A", "B", "C", "D"],
                 "correct_answer": "B",
@@ -133,11 +262,12 @@ def get_assessment_prompt(level: int, context: str) -> str:
         You are an educational AI. Create a Level 3 Assessment (Creation & Evaluation) based on the text below.
         
         Rules:
-        1. Generate 5 Short Answer / Thought-Provoking Questions.
+        1. Generate {count} Short Answer / Thought-Provoking Questions.
         2. Focus on "Create a solution", "Critique this method", "Propose an alternative".
         3. These are Open-Ended questions requiring synthesis of newer case studies or concepts.
-        4. Output JSON format only.
-
+        4. Tag each question with the "topic" it tests and a "difficulty" (easy, medium or hard). Spread questions across ALL topics in the text.
+        5. Output JSON format only.
+{avoid_text}
         Text Context:
         {context}
 
@@ -145,6 +275,8 @@ def get_assessment_prompt(level: int, context: str) -> str:
         [
             {{
                 "id": 1,
+                "topic": "Section or concept name",
+                "difficulty": "hard",
                 "question": "Propose a method to...",
                 "type": "short_answer",
                 "explanation": "Key elements that should be in the student's answer.",
@@ -155,107 +287,378 @@ def get_assessment_prompt(level: int, context: str) -> str:
         """
     return ""
 
-def generate_assessment(session_id: str, level: int):
-    # 1. Check Cache
-    cache_file = os.path.join(ASSESSMENT_DIR, f"{session_id}_lvl{level}.json")
-    if os.path.exists(cache_file):
-        with open(cache_file, "r") as f:
-            return json.load(f)
-
-    # 2. Determine Current Chapter
-    progress = load_user_progress().get(session_id, {})
+def _current_chapter(session_id: str, student_id: str):
+    """(chapter_file, None) for the chapter the student is on, or (None, error dict)."""
+    progress = progress_store.get_state(session_id, student_id) or {}
     chapter_index = progress.get("current_chapter_index", 0)
     
     files = get_sorted_files(session_id)
     if not files:
-        return {"error": "No documents found for this session."}
+        return None, {"error": "No documents found for this session."}
         
     if chapter_index >= len(files):
-         return {"error": "All chapters completed! You are a master."}
-         
-    current_file = files[chapter_index]
-    
-    # 3. Get Context for THIS Chapter ONLY
-    context = get_current_chapter_context(session_id, current_file)
+         return None, {"error": "All chapters completed! You are a master."}
+
+    return files[chapter_index], None
+
+def _maybe_refill(session_id: str, chapter_file: dict, level: int, key: tuple, student_id: str):
+    # Running low on fresh questions for this student: top the bank up in the background
+    if question_bank.count_unseen(key, student_id) < 2 * ATTEMPT_SIZE.get(level, 10):
+        _prefetch_pool.submit(refill_bank, session_id, chapter_file, level)
+
+@tracing.traced("generate_assessment")
+def generate_assessment(session_id: str, level: int, student_id: str = progress_store.DEFAULT_STUDENT):
+    """
+    Assessment for the chapter the student is currently on, sampled from the chapter's
+    question bank. Each attempt (including retries) gets questions the student hasn't seen yet.
+    """
+    chapter_file, error = _current_chapter(session_id, student_id)
+    if error:
+        return error
+
+    error = ensure_bank(session_id, chapter_file, level)
+    if error:
+        return error
+
+    key = get_bank_key(session_id, chapter_file, level)
+    questions = question_bank.sample_for_student(key, student_id, ATTEMPT_SIZE.get(level, 10))
+    for i, q in enumerate(questions):
+        q["id"] = i + 1
+
+    _maybe_refill(session_id, chapter_file, level, key, student_id)
+
+    return {
+        "level": level,
+        "timer_seconds": 600,
+        "questions": questions,
+        "chapter_name": chapter_file['filename']
+    }
+
+def stream_assessment(session_id: str, level: int, student_id: str = progress_store.DEFAULT_STUDENT):
+    """
+    Same assessment as generate_assessment, as a stream of events:
+    {"type": "meta"}, then one {"type": "question"} per question, then {"type": "done"} (or {"type": "error"}).
+    On a cold bank, questions are forwarded while the LLM is still writing the pool,
+    and the full pool is saved to the bank when generation finishes.
+    """
+    chapter_file, error = _current_chapter(session_id, student_id)
+    if error:
+        yield {"type": "error", "detail": error["error"]}
+        return
+
+    count = ATTEMPT_SIZE.get(level, 10)
+    key = get_bank_key(session_id, chapter_file, level)
+    yield {"type": "meta", "level": level, "timer_seconds": 600, "count": count,
+           "chapter_name": chapter_file['filename']}
+
+    streamed, seen = [], set()
+    if question_bank.count_items(key) == 0:
+        # Joins an in-flight generation for this bank if there is one; items only arrive if we lead it
+        items = queue.Queue()
+        future = _generation_pool.submit(
+            tracing.bind(_single_flight), repr(key),
+            lambda: _fill_bank(session_id, chapter_file, level, key, only_if_empty=True, on_item=items.put)
+        )
+        while len(streamed) < count:
+            try:
+                q = items.get(timeout=0.1)
+            except queue.Empty:
+                if future.done() and items.empty():
+                    break
+                continue
+            if not q.get("question") or progress_store.question_hash(q["question"]) in seen:
+                continue
+            seen.add(progress_store.question_hash(q["question"]))
+            q["id"] = len(streamed) + 1
+            streamed.append(q)
+            yield {"type": "question", "question": q}
+
+        error = future.result()
+        if error and not streamed:
+            yield {"type": "error", "detail": error["error"]}
+            return
+        question_bank.mark_served(key, student_id, streamed)
+
+    # Warm bank (or the stream ended short): the rest comes from the bank
+    if len(streamed) < count:
+        for q in question_bank.sample_for_student(key, student_id, count - len(streamed), exclude=seen):
+            q["id"] = len(streamed) + 1
+            streamed.append(q)
+            yield {"type": "question", "question": q}
+
+    _maybe_refill(session_id, chapter_file, level, key, student_id)
+    yield {"type": "done", "count": len(streamed)}
+
+def _single_flight(key: str, fn):
+    """Runs fn once per key at a time; concurrent callers for the same key wait for and share its result."""
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = concurrent.futures.Future()
+            _inflight[key] = future
+
+    if not is_leader:
+        return future.result()
+
+    try:
+        result = fn()
+        future.set_result(result)
+        return result
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+def ensure_bank(session_id: str, chapter_file: dict, level: int) -> Optional[Dict]:
+    """Makes sure the chapter/level bank has questions. Returns an error dict, or None when ready."""
+    key = get_bank_key(session_id, chapter_file, level)
+    ready = question_bank.count_items(key) > 0
+    metrics.cache_result("question_bank", ready)
+    if ready:
+        return None
+    # Two teachers, or a teacher and a student, never pay for the same generation twice
+    return _single_flight(repr(key), lambda: _fill_bank(session_id, chapter_file, level, key, only_if_empty=True))
+
+def refill_bank(session_id: str, chapter_file: dict, level: int):
+    """Adds another pool of new questions, up to MAX_BANK_SIZE."""
+    key = get_bank_key(session_id, chapter_file, level)
+    if question_bank.count_items(key) >= MAX_BANK_SIZE.get(level, 120):
+        return None
+    return _single_flight(repr(key), lambda: _fill_bank(session_id, chapter_file, level, key, only_if_empty=False))
+
+@tracing.traced("fill_bank")
+def _fill_bank(session_id: str, chapter_file: dict, level: int, key: tuple, only_if_empty: bool,
+               on_item: Optional[Callable[[Dict], None]] = None, indexed_only: bool = False) -> Optional[Dict]:
+    """
+    Generates one pool into the bank. With on_item, the LLM output is streamed and each question is passed on as it completes.
+    With indexed_only, nothing is generated while the chapter isn't indexed.
+    """
+    # Another caller may have filled it while we waited for the flight slot
+    if only_if_empty and question_bank.count_items(key) > 0:
+        return None
+
+    # 1. Get Context for THIS Chapter ONLY. Before the chapter is indexed only a truncated raw parse
+    # is available: that pool is stored as provisional and replaced once pre-generation runs on the index.
+    context = _indexed_chapter_context(session_id, chapter_file)
+    provisional = not context
+    if provisional and indexed_only:
+        return None
+    if provisional:
+        context = _partition_chapter_text(chapter_file)
     if not context:
-        return {"error": f"Failed to load content for {current_file['filename']}"}
+        return {"error": f"Failed to load content for {chapter_file['filename']}"}
 
-    # 3. Generate
-    prompt = get_assessment_prompt(level, context)
+    # 2. Generate a pool, avoiding what the bank already has (provisional questions are about to be replaced)
+    existing = [] if not provisional and question_bank.is_provisional(key) else \
+        [q["question"] for q in question_bank.get_items(key)]
+    prompt = get_assessment_prompt(level, context, POOL_SIZE.get(level, 10), avoid=existing)
     messages = [HumanMessage(content=prompt)]
     
     try:
-        response = llm.invoke(messages)
-        content = response.content.strip()
-        
-        # Clean Markdown
-        if content.startswith("```json"):
-            content = content[7:-3]
-        elif content.startswith("```"):
-            content = content[3:-3]
-            
-        assessment_data = json.loads(content)
-        
-        # Add metadata like timer
-        result = {
-            "level": level,
-            "timer_seconds": 600,
-            "questions": assessment_data,
-            "chapter_name": current_file['filename']
-        }
-        
-        # Save to Cache
-        with open(cache_file, "w") as f:
-            json.dump(result, f, indent=4)
-            
-        return result
+        if on_item:
+            parser = JsonArrayStream("assessment.pool", QUESTION_SCHEMA)
+            with api_semaphore:
+                start, received = time.perf_counter(), []
+                with tracing.span("llm.stream", subsystem="assessment", level=level):
+                    for chunk in llm.stream(messages):
+                        received.append(chunk.content)
+                        for item in parser.feed(chunk.content):
+                            on_item(item)
+                metrics.record_llm_call("assessment", messages, received, time.perf_counter() - start)
+            pool = parser.close()
+        else:
+            with api_semaphore:
+                start = time.perf_counter()
+                with tracing.span("llm.invoke", subsystem="assessment", level=level):
+                    response = llm.invoke(messages)
+                metrics.record_llm_call("assessment", messages, response.content, time.perf_counter() - start)
+            # A truncated pool still yields every complete question
+            pool, _ = extract_items(response.content, "assessment.pool", QUESTION_SCHEMA)
+        added = question_bank.add_items(key, pool, provisional=provisional)
+        print(f"🏦 Question bank {chapter_file['filename']} L{level}: +{added} questions")
+        if not added and not existing:
+            return {"error": "Failed to generate assessment."}
+        return None
         
     except Exception as e:
         print(f"Assessment Generation Failed: {e}")
         return {"error": "Failed to generate assessment."}
 
-def generate_remedial_plan(mistakes: List[Dict]) -> Dict:
+@tracing.traced("generate_chapter_assessment")
+def generate_chapter_assessment(session_id: str, chapter_file: dict, level: int):
+    """The full bank for one chapter/level (teacher preview and pre-generation)."""
+    error = ensure_bank(session_id, chapter_file, level)
+    if error:
+        return error
+    questions = question_bank.get_items(get_bank_key(session_id, chapter_file, level))
+    for i, q in enumerate(questions):
+        q["id"] = i + 1
+    return {
+        "level": level,
+        "timer_seconds": 600,
+        "questions": questions,
+        "chapter_name": chapter_file['filename']
+    }
+
+def pregenerate_chapter(session_id: str, chapter_file: dict):
+    """Fills the question bank for all three levels of one chapter, replacing banks built before it was indexed."""
+    for level in [1, 2, 3]:
+        try:
+            key = get_bank_key(session_id, chapter_file, level)
+            if question_bank.count_items(key) == 0:
+                print(f"🧪 Pre-generating L{level} question bank for {chapter_file['filename']}")
+                ensure_bank(session_id, chapter_file, level)
+            elif question_bank.is_provisional(key):
+                print(f"🧪 Regenerating provisional L{level} question bank for {chapter_file['filename']}")
+                _single_flight(repr(key), lambda: _fill_bank(session_id, chapter_file, level, key,
+                                                             only_if_empty=False, indexed_only=True))
+        except Exception as e:
+            print(f"⚠️ Pre-generation failed for {chapter_file['filename']} L{level}: {e}")
+
+def pregenerate_session_assessments(session_id: str):
+    """Background stage after ingestion: every chapter with an empty bank gets all three levels."""
+    files = get_sorted_files(session_id)
+    for chapter_file in files:
+        pregenerate_chapter(session_id, chapter_file)
+
+def list_cached_sessions() -> List[str]:
+    return question_bank.list_sessions()
+
+def reap_stale_assessments(session_id: str) -> int:
+    """Drops question banks and remedial entries of chapter versions (or prompts) the session no longer uses."""
+    keep = [get_chapter_hash(f) for f in get_sorted_files(session_id)]
+    return question_bank.reap(session_id, keep, PROMPT_VERSION) + \
+        remedial_cache.invalidate(session_id, keep, PROMPT_VERSION)
+
+def prefetch_chapters(session_id: str, chapter_index: int):
+    """Queues chapter i (if still cold) and chapter i+1 so the student never waits on generation."""
+    files = get_sorted_files(session_id)
+    for idx in (chapter_index, chapter_index + 1):
+        if idx < len(files):
+            _prefetch_pool.submit(pregenerate_chapter, session_id, files[idx])
+
+@tracing.traced("diagnose_mistakes")
+def diagnose_mistakes(mistakes: List[Dict]) -> Dict[tuple, Dict]:
     """
-    Analyzes mistakes and generates a diagnostic remedial plan.
+    One LLM call diagnosing each (question, wrong answer) separately, so every diagnosis
+    can be cached and reused on its own. Returns {mistake_key: diagnosis}.
     """
-    if not mistakes:
-        return {}
-
     mistakes_text = json.dumps([{
+        "index": i,
         "question": m["question"], 
         "user_answer": m.get("user_answer"), 
         "correct_answer": m.get("correct_answer")
-    } for m in mistakes], indent=2)
+    } for i, m in enumerate(mistakes)], indent=2)
 
     prompt = f"""
-    You are an expert tutor. A student failed an assessment. Analyze their mistakes and provide a remedial plan.
+    You are an expert tutor. A student got the questions below wrong. Diagnose EACH mistake separately.
     
     Mistakes:
     {mistakes_text}
 
-    Task:
-    1. **Diagnosis**: Classify the primary gap (Concept Gap, Application Gap, or Overgeneralization).
-    2. **Explanation**: Provide a clear, guided explanation to correct the misunderstanding (keep it under 100 words).
-    3. **Practice Question**: Create 1 single-choice practice question to verify understanding.
-
-    Output JSON ONLY:
-    {{
-        "diagnosis": "Concept Gap: Misunderstood the definition of X",
-        "explanation": "Here is why...",
-        "practice_question": {{
-            "question": "...",
-            "options": ["A", "B", "C", "D"],
-            "correct_answer": "A",
-            "explanation": "..."
+    Task, for every mistake:
+    1. **Gap**: Classify it as exactly one of: Concept Gap, Application Gap, Overgeneralization.
+    2. **Diagnosis**: One line naming the misunderstanding.
+    3. **Explanation**: A clear, guided explanation to correct it (keep it under 60 words).
+    4. **Practice Question**: 1 single-choice practice question to verify understanding.
+
+    Output a JSON array ONLY, one entry per mistake, in the same order:
+    [
+        {{
+            "index": 0,
+            "gap": "Concept Gap",
+            "diagnosis": "Concept Gap: Misunderstood the definition of X",
+            "explanation": "Here is why...",
+            "practice_question": {{
+                "question": "...",
+                "options": ["A", "B", "C", "D"],
+                "correct_answer": "A",
+                "explanation": "..."
+            }}
         }}
-    }}
+    ]
+    """
+    messages = [HumanMessage(content=prompt)]
+    with api_semaphore:
+        start = time.perf_counter()
+        with tracing.span("llm.invoke", subsystem="remedial"):
+            response = llm.invoke(messages)
+        metrics.record_llm_call("remedial", messages, response.content, time.perf_counter() - start)
+    items, _ = extract_items(response.content, "remedial.diagnoses", requires(index=int, diagnosis=str))
+
+    diagnoses = {}
+    for d in items:
+        idx = d["index"]
+        if 0 <= idx < len(mistakes):
+            diagnoses[remedial_cache.mistake_key(mistakes[idx])] = d
+    return diagnoses
+
+def compose_remedial_plan(mistakes: List[Dict], diagnoses: Dict[tuple, Dict]) -> Dict:
+    """Builds the plan from per-question diagnoses: the most common gap leads, the rest are listed to review."""
+    ordered = []
+    for m in mistakes:
+        d = diagnoses.get(remedial_cache.mistake_key(m))
+        if d and d not in ordered:
+            ordered.append(d)
+    if not ordered:
+        return {}
+
+    primary_gap = Counter(d.get("gap", "Concept Gap") for d in ordered).most_common(1)[0][0]
+    lead = next(d for d in ordered if d.get("gap", "Concept Gap") == primary_gap)
+    others = [d.get("diagnosis") for d in ordered if d is not lead and d.get("diagnosis")]
+
+    explanation = lead.get("explanation", "")
+    if others:
+        explanation += " Also review: " + "; ".join(others[:2]) + "."
+    return {
+        "diagnosis": lead.get("diagnosis", primary_gap),
+        "explanation": explanation,
+        "practice_question": lead.get("practice_question"),
+        "details": [{"question": m["question"], **diagnoses[remedial_cache.mistake_key(m)]}
+                    for m in mistakes if remedial_cache.mistake_key(m) in diagnoses]
+    }
+
+def generate_remedial_plan(mistakes: List[Dict], scope: Optional[tuple] = None) -> Dict:
+    """
+    Analyzes mistakes and generates a diagnostic remedial plan.
+    With a scope (session, chapter hash, prompt version), whole plans and per-question diagnoses
+    are shared across the class through remedial_cache; only unseen (question, wrong answer) pairs reach the LLM.
     """
+    mistakes = [m for m in mistakes or [] if m.get("question")]
+    if not mistakes:
+        return {}
+
+    set_hash = remedial_cache.mistake_set_hash(mistakes)
+    if scope:
+        cached = remedial_cache.get_plan(scope, set_hash)
+        metrics.cache_result("remedial_plans", bool(cached))
+        if cached:
+            return cached
+
     try:
-        response = llm.invoke([HumanMessage(content=prompt)])
-        content = response.content.strip()
-        if content.startswith("```json"): content = content[7:-3]
-        elif content.startswith("```"): content = content[3:-3]
-        return json.loads(content)
+        diagnoses = remedial_cache.get_diagnoses(scope, mistakes) if scope else {}
+        missing, keys = [], set(diagnoses)
+        for m in mistakes:
+            key = remedial_cache.mistake_key(m)
+            if key not in keys:
+                keys.add(key)
+                missing.append(m)
+        if missing:
+            fresh = diagnose_mistakes(missing)
+            if scope and fresh:
+                remedial_cache.put_diagnoses(scope, fresh)
+            diagnoses.update(fresh)
+        print(f"🩺 Remedial plan: {len(mistakes) - len(missing)}/{len(mistakes)} diagnoses from cache")
+
+        plan = compose_remedial_plan(mistakes, diagnoses)
+        if not plan:
+            raise ValueError("No usable diagnoses")
+        if scope:
+            remedial_cache.put_plan(scope, set_hash, plan)
+        return plan
     except Exception as e:
         print(f"Remedial Plan Generation Failed: {e}")
         return {
@@ -264,50 +667,69 @@ def generate_remedial_plan(mistakes: List[Dict]) -> Dict:
             "practice_question": None
         }
 
-def spend_xp(session_id: str, amount: int) -> bool:
+def queue_remedial_plan(session_id: str, student_id: str, pending: Dict):
+    """Builds the plan for a pending marker in the background (once per plan id)."""
+    with _remedial_lock:
+        if pending["plan_id"] in _remedial_jobs:
+            return
+        _remedial_jobs.add(pending["plan_id"])
+    _remedial_pool.submit(_build_remedial_plan, session_id, student_id, pending)
+
+def _build_remedial_plan(session_id: str, student_id: str, pending: Dict):
+    try:
+        scope = tuple(pending["scope"]) if pending.get("scope") else None
+        plan = generate_remedial_plan(pending.get("mistakes") or [], scope)
+        plan.update({"status": "ready", "plan_id": pending["plan_id"]})
+        if progress_store.set_remedial_plan(session_id, pending["plan_id"], plan, student_id):
+            print(f"🩺 Remedial plan ready for {student_id} in {session_id}")
+    except Exception as e:
+        print(f"⚠️ Remedial plan job failed for {student_id} in {session_id}: {e}")
+    finally:
+        with _remedial_lock:
+            _remedial_jobs.discard(pending["plan_id"])
+
+def _remedial_plan_for_submit(session_id: str, student_id: str, mistakes: List[Dict]) -> Dict:
+    """A class-mate already made the same mistakes on this chapter: the cached plan is ready now. Otherwise a pending marker."""
+    mistakes = [{
+        "question": m.get("question"),
+        "user_answer": m.get("user_answer"),
+        "correct_answer": m.get("correct_answer")
+    } for m in mistakes if m.get("question")]
+    plan_id = uuid.uuid4().hex
+
+    scope = None
+    chapter_file, _ = _current_chapter(session_id, student_id)
+    if chapter_file:
+        scope = (session_id, get_chapter_hash(chapter_file), PROMPT_VERSION)
+        cached = remedial_cache.get_plan(scope, remedial_cache.mistake_set_hash(mistakes))
+        if cached:
+            return {**cached, "status": "ready", "plan_id": plan_id}
+
+    return {
+        "status": "pending",
+        "plan_id": plan_id,
+        "requested_at": time.time(),
+        "scope": scope,
+        "mistakes": mistakes
+    }
+
+def spend_xp(session_id: str, amount: int, student_id: str = progress_store.DEFAULT_STUDENT) -> bool:
     """Deducts XP if sufficient balance exists. Returns True if successful."""
-    progress = load_user_progress()
-    if session_id not in progress:
-        return False
-    
-    if progress[session_id].get("xp", 0) >= amount:
-        progress[session_id]["xp"] -= amount
-        save_user_progress(progress)
-        return True
-    return False
+    return progress_store.spend_xp(session_id, amount, student_id)
+
+def add_xp(session_id: str, amount: int, student_id: str = progress_store.DEFAULT_STUDENT) -> int:
+    """Adds XP (e.g. for viewing flashcards). Returns the new total."""
+    return progress_store.add_xp(session_id, amount, student_id)
 
 def load_user_progress():
-    if os.path.exists(PROGRESS_FILE):
-        with open(PROGRESS_FILE, "r") as f:
-            return json.load(f)
-    return {}
+    """Full progress document, {session_id: {student_id: {...}}}. Request paths use progress_store row reads instead."""
+    return progress_store.load_all()
 
 def save_user_progress(progress):
-    with open(PROGRESS_FILE, "w") as f:
-        json.dump(progress, f, indent=4)
+    progress_store.save_all(progress)
 
-def submit_assessment_result(session_id: str, level: int, score: int, max_score: int, mistakes: List[Dict] = None):
-    progress = load_user_progress()
-    
-    if session_id not in progress:
-        progress[session_id] = {
-            "xp": 0, 
-            "unlocked_level": 1, 
-            "current_chapter_index": 0,
-            "history": [], 
-            "mistakes": []
-        }
-    
-    user_data = progress[session_id]
-    
-    # Validation: Ensure they are submitting for the CORRECT chapter level
-    # (Simplified: Frontend handles most checks, backend updates pointers)
-    
-    if "mistakes" not in progress[session_id]:
-        progress[session_id]["mistakes"] = []
-        
-    user_data = progress[session_id]
-    
+def submit_assessment_result(session_id: str, level: int, score: int, max_score: int, mistakes: List[Dict] = None,
+                             student_id: str = progress_store.DEFAULT_STUDENT):
     # Calculate XP
     xp_gained = 0
     passed = False
@@ -317,110 +739,77 @@ def submit_assessment_result(session_id: str, level: int, score: int, max_score:
         if score >= 8: 
             xp_gained = random.randint(50, 100)
             passed = True
-            if user_data["unlocked_level"] < 2:
-                user_data["unlocked_level"] = 2
-                
                 
     elif level == 2:
         if score >= 7:
             xp_gained = random.randint(100, 150)
             passed = True
-            if user_data["unlocked_level"] < 3:
-                user_data["unlocked_level"] = 3
 
     elif level == 3:
         if score > 0: # Strict passing for L3
             xp_gained = random.randint(150, 200) + 500 # Bonus for Chapter Clear
             passed = True
-            
-            # --- CHAPTER MASTERED ---
-            # Move to next chapter, Reset level to 1
-            user_data["current_chapter_index"] = user_data.get("current_chapter_index", 0) + 1
-            user_data["unlocked_level"] = 1 
-
-    if passed:
-        user_data["xp"] += xp_gained
-        # clear remedial plan if passed
-        if "remedial_plan" in user_data:
-            del user_data["remedial_plan"]
-        if "retry_available_at" in user_data:
-            del user_data["retry_available_at"]
-    else:
-        # FAILED - Trigger Cooldown & Remedial Plan
-        user_data["retry_available_at"] = time.time() + COOLDOWN_SECONDS
+
+    # FAILED - Trigger Cooldown & Remedial Plan. The plan is stored as pending and built in the
+    # background, so the student gets their result without waiting on the LLM.
+    remedial_plan = None
+    retry_available_at = None
+    if not passed:
+        retry_available_at = time.time() + COOLDOWN_SECONDS
         if mistakes:
-            user_data["remedial_plan"] = generate_remedial_plan(mistakes)
-    
-    # Update History
-    user_data["history"].append({
-        "level": level,
-        "score": score,
-        "max_score": max_score,
-        "passed": passed,
-        "xp_gained": xp_gained,
-        "timestamp": str(os.path.getmtime(PROGRESS_FILE) if os.path.exists(PROGRESS_FILE) else 0) 
-    })
+            remedial_plan = _remedial_plan_for_submit(session_id, student_id, mistakes)
 
-    # Update Mistakes
+    # Level unlocks, chapter advance, history and mistakes are applied atomically
+    user_data = progress_store.record_attempt(
+        session_id, level, score, max_score, passed, xp_gained,
+        mistakes=mistakes,
+        remedial_plan=remedial_plan,
+        retry_available_at=retry_available_at,
+        student_id=student_id
+    )
+    if remedial_plan and remedial_plan["status"] == "pending":
+        queue_remedial_plan(session_id, student_id, remedial_plan)
     if mistakes:
-        for m in mistakes:
-            # Check if mistake already exists to avoid duplicates
-            if not any(dm["question"] == m["question"] for dm in user_data["mistakes"]):
-                user_data["mistakes"].append({
-                    "question": m["question"],
-                    "correct_answer": m.get("correct_answer"),
-                    "explanation": m.get("explanation"),
-                    "user_answer": m.get("user_answer"),
-                    "level": level,
-                    "comments": "",
-                    "timestamp": str(os.path.getmtime(PROGRESS_FILE) if os.path.exists(PROGRESS_FILE) else 0)
-                })
-    
-    save_user_progress(progress)
+        mistake_clusters.queue_new_mistakes(session_id, mistakes)
+
+    # Chapter mastered: warm the new chapter and the one after it
+    if passed and level == 3:
+        prefetch_chapters(session_id, user_data["current_chapter_index"])
     
     return {
         "passed": passed,
         "xp_gained": xp_gained,
         "new_total_xp": user_data["xp"],
         "unlocked_level": user_data["unlocked_level"],
-        "score": score
+        "score": score,
+        "remedial_status": remedial_plan["status"] if remedial_plan else None
     }
 
-def get_mistakes(session_id: str):
-    progress = load_user_progress()
+def get_mistakes(session_id: str, student_id: str = progress_store.DEFAULT_STUDENT, cursor: Optional[str] = None,
+                 limit: int = 50, level: Optional[int] = None, chapter_index: Optional[int] = None):
+    """Cursor-paginated mistakes, newest first: {"items": [...], "next_cursor": ...}. Raises ValueError on a malformed cursor."""
+    limit = min(limit, 200)
     if session_id == "all":
-        all_mistakes = []
-        for sid, data in progress.items():
-            if isinstance(data, dict) and "mistakes" in data:
-                # Add session_id to each mistake for context in global view
-                for m in data["mistakes"]:
-                    m_with_sid = m.copy()
-                    m_with_sid["session_id"] = sid
-                    all_mistakes.append(m_with_sid)
-        return all_mistakes
-        
-    if session_id not in progress:
-        return []
-    return progress[session_id].get("mistakes", [])
-
-def update_mistake_comment(session_id: str, question_text: str, comment: str):
-    progress = load_user_progress()
-    if session_id in progress and "mistakes" in progress[session_id]:
-        for m in progress[session_id]["mistakes"]:
-            if m["question"] == question_text:
-                m["comments"] = comment
-                save_user_progress(progress)
-                return True
-    return False
-
-def get_progress(session_id: str):
-    progress = load_user_progress()
-    user_data = progress.get(session_id, {
+        # session_id is added to each mistake for context in global view
+        return progress_store.get_all_mistakes_page(student_id, cursor, limit, level, chapter_index)
+    if cursor and not (cursor.isascii() and cursor.isdigit()):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return progress_store.get_mistakes_page(
+        session_id, student_id, int(cursor) if cursor else None, limit, level, chapter_index
+    )
+
+def update_mistake_comment(session_id: str, question_text: str, comment: str,
+                           student_id: str = progress_store.DEFAULT_STUDENT):
+    return progress_store.update_mistake_comment(session_id, question_text, comment, student_id)
+
+def get_progress(session_id: str, student_id: str = progress_store.DEFAULT_STUDENT):
+    user_data = progress_store.get_state(session_id, student_id) or {
         "xp": 0, 
         "unlocked_level": 1, 
-        "current_chapter_index": 0,
-        "history": []
-    })
+        "current_chapter_index": 0
+    }
+    # Snapshot read; only the latest attempts are attached (full log: get_history)
+    user_data["history"] = progress_store.get_recent_attempts(session_id, student_id)
     
     # Calculate Lagging Status
     files = get_sorted_files(session_id)
@@ -433,7 +822,7 @@ def get_progress(session_id: str):
         current_file = files[current_idx]
         user_data["current_chapter_title"] = current_file['filename'] # Added for Frontend
         upload_time = current_file["timestamp"]
-        deadline = upload_time + (5 * 24 * 3600) # 5 Days in seconds
+        deadline = upload_time + DEADLINE_SECONDS
         
         if current_idx + 1 < len(files):
              user_data["next_chapter_title"] = files[current_idx + 1]['filename']
@@ -457,73 +846,147 @@ def get_progress(session_id: str):
             user_data["cooldown_remaining"] = int(remaining)
         else:
             # Cleanup expired cooldown
+            progress_store.clear_cooldown(session_id, student_id)
             del user_data["retry_available_at"]
             if "remedial_plan" in user_data:
                 del user_data["remedial_plan"]
+
+    # Remedial plan: "pending" while the background job runs, then "ready" (older plans have no status)
+    plan = user_data.get("remedial_plan")
+    if plan:
+        user_data["remedial_status"] = plan.get("status", "ready")
+        if user_data["remedial_status"] == "pending":
+            if time.time() - plan.get("requested_at", 0) > REMEDIAL_RETRY_SECONDS:
+                queue_remedial_plan(session_id, student_id, plan)
+            user_data["remedial_plan"] = {"status": "pending"}
     
     return user_data
 
+def progress_etag(session_id: str, student_id: str = progress_store.DEFAULT_STUDENT) -> Optional[str]:
+    """
+    Version ETag for get_progress without building it: the student's revision, the classroom's
+    chapter directory and a time bucket (deadline status is time-based). None while the response
+    changes on its own (cooldown countdown, pending remedial plan).
+    """
+    revision = progress_store.get_revision(session_id, student_id)
+    if revision and (revision["retry_available_at"] is not None or revision["remedial_status"] == "pending"):
+        return None
+    try:
+        chapters = os.stat(os.path.join(UPLOAD_ROOT, session_id)).st_mtime_ns
+    except OSError:
+        chapters = None
+    return response_cache.make_etag("progress", session_id, student_id, revision and revision["revision"],
+                                    chapters, int(time.time() // PROGRESS_ETAG_SECONDS))
+
+def mistakes_etag(session_id: str, student_id: str = progress_store.DEFAULT_STUDENT, *query) -> str:
+    """Version ETag for a get_mistakes page: the student's revision(s) plus the page's query."""
+    if session_id == "all":
+        revision = progress_store.get_process_revision(student_id)
+    else:
+        revision = progress_store.get_revision(session_id, student_id)
+        revision = revision and revision["revision"]
+    return response_cache.make_etag("mistakes", session_id, student_id, revision, query)
+
+def get_history(session_id: str, student_id: str = progress_store.DEFAULT_STUDENT,
+                cursor: Optional[int] = None, limit: int = 50, event_type: Optional[str] = None):
+    """Paginated attempt / XP event log for a student, newest first."""
+    return progress_store.get_history_page(session_id, student_id, cursor, min(limit, 200), event_type)
+
 def get_teacher_analytics(session_id: str):
     """
-    Generates class-wide analytics.
-    For demo purposes, generates synthetic data for 'other students' 
-    and blends with the real user's progress.
+    Generates class-wide analytics from the classroom's rollups, which the submit path keeps up to date.
+    Cost depends on the number of chapters, levels and reported items, not on class size.
     """
-    progress = load_user_progress().get(session_id, {})
-    
-    # Real User Data
-    user_level = progress.get("unlocked_level", 1)
-    user_xp = progress.get("xp", 0)
-    user_mistakes = progress.get("mistakes", [])
-    
-    # Synthetic Class Data (Mocking 20 students)
-    total_students = 20
+    files = get_sorted_files(session_id)
+    total_students = progress_store.count_students(session_id)
     
-    # Distribution of levels (Mock)
+    # Distribution of levels; students past the last chapter count as completed
     level_dist = {1: 0, 2: 0, 3: 0, "completed": 0}
-    
-    # Randomly assign 19 other students
-    import random
-    for _ in range(19):
-        lvl = random.choice([1, 1, 1, 2, 2, 3, "completed"]) # weighted towards 1 & 2
-        level_dist[lvl] += 1
-    
-    # Add real user
-    if progress.get("current_chapter_index", 0) > 0: # simplifiction
-        level_dist["completed"] += 1
-    else:
-        level_dist[user_level] += 1
-
-    # Calculate Stuck % (Students at L1/L2 for > 3 days - mock)
-    stuck_percent = random.randint(15, 30)
-
-    # Common Mistakes (Clustered from real mistakes + mock)
-    common_mistakes = []
-    if user_mistakes:
-        for m in user_mistakes[:3]:
-            common_mistakes.append({
-                "concept": m.get("question", "Unknown Concept")[:50] + "...",
-                "frequency": random.randint(3, 12)
-            })
-    else:
-        common_mistakes = [
-            {"concept": "Difference between Supervised and Unsupervised Learning", "frequency": 8},
-            {"concept": "Overfitting vs Underfitting definitions", "frequency": 6},
-            {"concept": "Calculus chain rule application", "frequency": 5}
-        ]
+    for pos in progress_store.get_position_counts(session_id):
+        if pos["current_chapter_index"] >= len(files):
+            level_dist["completed"] += pos["students"]
+        else:
+            level_dist[pos["unlocked_level"]] = level_dist.get(pos["unlocked_level"], 0) + pos["students"]
+
+    # Time at current level (students who finished every chapter are not waiting on anything)
+    now = time.time()
+    time_at_level = {label: 0 for _, label in TIME_AT_LEVEL_BUCKETS}
+    stuck = 0
+    for entry in progress_store.get_time_at_position(session_id):
+        if entry["current_chapter_index"] >= len(files):
+            continue
+        days = (now - entry["entered_at"]) / (24 * 3600)
+        label = next(label for limit, label in TIME_AT_LEVEL_BUCKETS if days < limit)
+        time_at_level[label] += entry["students"]
+        if days >= STUCK_DAYS:
+            stuck += entry["students"]
+    stuck_percent = round(100 * stuck / total_students) if total_students else 0
+
+    # Past deadline = students still on a chapter whose deadline has passed
+    overdue_chapters = [idx for idx, f in enumerate(files) if now > f["timestamp"] + DEADLINE_SECONDS]
+    past_deadline = progress_store.count_students_on_chapters(session_id, overdue_chapters)
+
+    # Attempts per level = attempts / (student, chapter) pairs that tried the level
+    average_attempts, pass_rate = {}, {}
+    for row in progress_store.get_level_attempt_stats(session_id):
+        average_attempts[f"level_{row['level']}"] = round(row["attempts"] / row["students"], 1) if row["students"] else 0
+        pass_rate[f"level_{row['level']}"] = round(100 * row["passes"] / row["attempts"]) if row["attempts"] else 0
+
+    # Common Mistakes = misconception clusters (frequency = total misses of their questions).
+    # Until the classroom has been clustered, fall back to the most-missed questions.
+    common_mistakes = mistake_clusters.get_top_concepts(session_id, limit=3) or [{
+        "concept": q["question"][:50] + ("..." if len(q["question"]) > 50 else ""),
+        "frequency": q["misses"]
+    } for q in progress_store.get_most_missed_questions(session_id, limit=3)]
 
     return {
         "total_students": total_students,
         "level_distribution": level_dist,
         "stuck_percent": stuck_percent,
-        "average_attempts": {
-            "level_1": 1.2,
-            "level_2": 2.5,
-            "level_3": 3.1
-        },
+        "stuck_students": stuck,
+        "students_past_deadline": past_deadline,
+        "time_at_level": time_at_level,
+        "average_attempts": average_attempts,
+        "pass_rate": pass_rate,
         "common_mistakes": common_mistakes
     }
 
+def iter_teacher_assessments(session_id: str):
+    """
+    Generates every (chapter, level) concurrently and yields each chapter as soon as
+    its three quests are ready (completion order, not chapter order).
+    """
+    files = get_sorted_files(session_id)
+    futures = {}
+    for idx, file_info in enumerate(files):
+        for level in [1, 2, 3]:
+            future = _generation_pool.submit(tracing.bind(generate_chapter_assessment), session_id, file_info, level)
+            futures[future] = (idx, level)
+
+    pending = {idx: 3 for idx in range(len(files))}
+    quests = {idx: {} for idx in range(len(files))}
+    for future in concurrent.futures.as_completed(futures):
+        idx, level = futures[future]
+        try:
+            assessment = future.result()
+        except Exception as e:
+            print(f"⚠️ Preview generation failed for chapter {idx} L{level}: {e}")
+            assessment = {"error": str(e)}
+        if "error" not in assessment:
+            quests[idx][level] = {
+                "level": level,
+                "questions": assessment.get("questions", []),
+                "timer_seconds": assessment.get("timer_seconds", 600)
+            }
+
+        pending[idx] -= 1
+        if pending[idx] == 0:
+            yield {
+                "chapter_name": files[idx]['filename'],
+                "chapter_index": idx,
+                "quests": [quests[idx][lvl] for lvl in sorted(quests[idx])]
+            }
+
 def get_all_assessments_for_teacher(session_id: str):
     """
     Returns all assessments organized by chapter and quest level for teacher preview.
@@ -542,29 +1005,58 @@ def get_all_assessments_for_teacher(session_id: str):
         ]
     }
     """
+    chapters = list(iter_teacher_assessments(session_id))
+    return {"chapters": sorted(chapters, key=lambda c: c["chapter_index"])}
+
+def _teacher_assessments_stamp(session_id: str) -> tuple:
+    # The corpus version moves once ingestion has indexed a new chapter, after which its banks are rebuilt
     files = get_sorted_files(session_id)
-    if not files:
-        return {"chapters": []}
-    
+    return (tuple((f["filename"], get_chapter_hash(f)) for f in files), corpus_store.get_version(session_id),
+            question_bank.session_revision(session_id, PROMPT_VERSION))
+
+def teacher_assessments_etag(session_id: str, stream: bool = False) -> str:
+    """ETag of the complete preview (JSON, or NDJSON with stream) for the current chapters and question banks."""
+    return response_cache.make_etag("teacher_assessments", session_id, stream, _teacher_assessments_stamp(session_id))
+
+def _teacher_preview_payloads(session_id: str, stamp: tuple, chapters: List[Dict]) -> tuple:
+    """
+    (JSON payload, NDJSON payload) of a preview. Complete previews are kept in the response cache
+    under `stamp`; previews with a missing quest aren't, and get a body-derived ETag instead.
+    """
+    chapters = sorted(chapters, key=lambda c: c["chapter_index"])
+    body = json.dumps({"chapters": chapters}).encode("utf-8")
+    lines = "".join(json.dumps(c) + "\n" for c in chapters).encode("utf-8")
+    if not all(len(c["quests"]) == 3 for c in chapters):
+        digest = hashlib.sha1(body).hexdigest()
+        return (response_cache.Payload(body, response_cache.make_etag("teacher_assessments", digest)),
+                response_cache.Payload(lines, response_cache.make_etag("teacher_assessments", True, digest)))
+    payload = response_cache.Payload(body, response_cache.make_etag("teacher_assessments", session_id, False, stamp))
+    stream_payload = response_cache.Payload(lines, response_cache.make_etag("teacher_assessments", session_id, True, stamp))
+    _response_cache.put(session_id, stamp, payload)
+    _response_cache.put((session_id, "ndjson"), stamp, stream_payload)
+    return payload, stream_payload
+
+def get_teacher_assessments_payload(session_id: str) -> response_cache.Payload:
+    """
+    Serialized teacher preview, served from the in-memory response cache while the session's
+    chapters and question banks are unchanged.
+    """
+    stamp = _teacher_assessments_stamp(session_id)
+    payload = _response_cache.get(session_id, stamp)
+    if payload is not None:
+        return payload
+    # Stamped with the state before the build: if generation filled banks meanwhile, the next call rebuilds once
+    return _teacher_preview_payloads(session_id, stamp, get_all_assessments_for_teacher(session_id)["chapters"])[0]
+
+def get_cached_teacher_assessments_stream(session_id: str) -> Optional[response_cache.Payload]:
+    """The complete preview as NDJSON (one chapter per line) if it is cached for the current stamp."""
+    return _response_cache.get((session_id, "ndjson"), _teacher_assessments_stamp(session_id))
+
+def iter_teacher_assessments_stream(session_id: str):
+    """NDJSON lines as chapters complete; once every chapter is in, the preview is cached for later loads."""
+    stamp = _teacher_assessments_stamp(session_id)
     chapters = []
-    
-    for idx, file_info in enumerate(files):
-        chapter_data = {
-            "chapter_name": file_info['filename'],
-            "chapter_index": idx,
-            "quests": []
-        }
-        
-        # Generate assessments for all 3 levels
-        for level in [1, 2, 3]:
-            assessment = generate_assessment(session_id, level)
-            if "error" not in assessment:
-                chapter_data["quests"].append({
-                    "level": level,
-                    "questions": assessment.get("questions", []),
-                    "timer_seconds": assessment.get("timer_seconds", 600)
-                })
-        
-        chapters.append(chapter_data)
-    
-    return {"chapters": chapters}
+    for chapter in iter_teacher_assessments(session_id):
+        chapters.append(chapter)
+        yield json.dumps(chapter) + "\n"
+    _teacher_preview_payloads(session_id, stamp, chapters)
@@ -0,0 +1 @@
+# Offline benchmarks: stub Gemini / embedding backends, synthetic PDFs and load generators.
@@ -0,0 +1,284 @@
+"""
+Ingestion stage micro-benchmark: partition, topic mapping, chunking, content separation,
+summarization, embedding and vector write, timed separately per document, with peak memory.
+
+    python -m benchmarks.ingestion --pages 20 --table-density 0.3 --image-density 0.2 --json out.json
+    python -m benchmarks.ingestion --pdf "docs/attention is all you need.pdf" --strategy fast --repeat 3
+    python -m benchmarks.ingestion --chunking 3000:2400:500 2000:1600:300 --batch-sizes 3 5 8
+
+Runs offline: Gemini summaries are replayed from --replay (recorded earlier with --record, which
+does call Gemini), unrecorded prompts get a synthesized answer, and embeddings are a fast fake
+unless --real-embeddings. Every combination of strategy, chunking and batch size is one run per
+document; the JSON output (with the git commit) is meant to be compared across commits.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import resource
+import statistics
+import subprocess
+import tracemalloc
+import concurrent.futures
+from contextlib import contextmanager
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks import stubs
+from benchmarks.pdfs import make_pdf
+
+# --- CONFIG ---
+DEFAULT_REPLAY = os.path.join(REPO_ROOT, "benchmarks", "recordings", "summaries.json")
+STAGES = ("partition", "topic_mapping", "chunking", "content_separation", "summarization", "embedding", "vector_write")
+
+class StageTimer:
+    """Wall time per stage, plus Python peak allocation per stage when tracemalloc is on."""
+
+    def __init__(self, trace_memory: bool):
+        self.trace_memory = trace_memory
+        self.seconds = {}
+        self.peak_bytes = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1] - base
+                self.peak_bytes[name] = max(self.peak_bytes.get(name, 0), peak)
+
+class _Precomputed:
+    """Hands Chroma the vectors from the embedding stage, so vector_write times only the write."""
+
+    def __init__(self, documents: List, vectors: List[List[float]]):
+        self.by_text = {d.page_content: v for d, v in zip(documents, vectors)}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.by_text[t] for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.by_text.get(text) or next(iter(self.by_text.values()))
+
+def _rss_peak_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return ""
+
+def run_document(pipeline, path: str, strategy: str, chunking: Dict, batch_size: int,
+                 trace_memory: bool, vector_dir: str) -> Dict:
+    """One pass of the ingestion stages over one PDF, using the pipeline's own building blocks."""
+    timer = StageTimer(trace_memory)
+
+    with timer.stage("partition"):
+        if strategy == "auto":
+            elements = pipeline.partitioning_documents(path) # Production path: hi_res, falling back to fast
+        else:
+            elements = pipeline.partition_pdf(filename=path, strategy=strategy, **pipeline.PARTITION_OPTIONS[strategy])
+
+    with timer.stage("topic_mapping"):
+        topics = pipeline.group_elements_by_topic(elements)
+
+    chunks_per_topic = []
+    with timer.stage("chunking"):
+        for topic in topics:
+            chunks_per_topic.append((topic["title"], pipeline.create_chunks_by_title(topic["elements"], chunking)))
+
+    contents = []
+    with timer.stage("content_separation"):
+        for title, chunks in chunks_per_topic:
+            for chunk in chunks:
+                content = pipeline.separate_content_types(chunk)
+                content["parent_topic"] = title
+                contents.append(content)
+
+    # Same batching as process_files_to_docs: multimodal chunks of a topic, batch_size per call
+    batches = []
+    for title, _ in chunks_per_topic:
+        multimodal = [c for c in contents if c["parent_topic"] == title and len(c["types"]) > 1]
+        batches += [multimodal[i:i + batch_size] for i in range(0, len(multimodal), batch_size)]
+    with timer.stage("summarization"):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=pipeline.SUMMARY_WORKERS) as executor:
+            summaries = list(executor.map(pipeline.create_batch_ai_summaries, batches))
+    for batch, batch_summaries in zip(batches, summaries):
+        for content, summary in zip(batch, batch_summaries):
+            content["ai_summary"] = summary
+
+    documents = []
+    for content in contents:
+        text = f"TOPIC: {content['parent_topic']}\n"
+        text += f"SUMMARY: {content['ai_summary']}\n\nORIGINAL TEXT: {content['text']}" if content.get("ai_summary") else f"\n{content['text']}"
+        documents.append(pipeline.Document(page_content=text, metadata={"source": os.path.basename(path),
+                                                                         "parent_topic": content["parent_topic"]}))
+
+    with timer.stage("embedding"):
+        vectors = pipeline.LOCAL_EMBEDDINGS.embed_documents([d.page_content for d in documents]) if documents else []
+
+    if documents:
+        with timer.stage("vector_write"):
+            db = pipeline.Chroma.from_documents(
+                documents=documents,
+                embedding=_Precomputed(documents, vectors),
+                persist_directory=vector_dir,
+                collection_name="benchmark"
+            )
+        db.delete_collection()
+
+    return {
+        "seconds": {stage: round(timer.seconds.get(stage, 0.0), 4) for stage in STAGES},
+        "peak_bytes": timer.peak_bytes if trace_memory else None,
+        "rss_peak_mb": _rss_peak_mb(),
+        "counts": {
+            "elements": len(elements),
+            "tables": sum(1 for e in elements if type(e).__name__ == "Table"),
+            "images": sum(1 for e in elements if type(e).__name__ == "Image"),
+            "topics": len(topics),
+            "chunks": len(contents),
+            "multimodal_chunks": sum(len(b) for b in batches),
+            "summary_calls": len(batches),
+        },
+    }
+
+def summarize_runs(runs: List[Dict]) -> Dict:
+    """Median and min per stage over repeats (the first run also pays model loading)."""
+    stages = {}
+    for stage in STAGES:
+        values = [r["seconds"][stage] for r in runs]
+        stages[stage] = {"median": round(statistics.median(values), 4), "min": round(min(values), 4)}
+    stages["total"] = {
+        "median": round(statistics.median(sum(r["seconds"].values()) for r in runs), 4),
+        "min": round(min(sum(r["seconds"].values()) for r in runs), 4),
+    }
+    summary = {"stages": stages, "counts": runs[-1]["counts"], "rss_peak_mb": max(r["rss_peak_mb"] for r in runs)}
+    if runs[0]["peak_bytes"] is not None:
+        summary["peak_bytes"] = {stage: max(r["peak_bytes"].get(stage, 0) for r in runs) for stage in STAGES}
+    return summary
+
+def build_corpus(args, scratch: str) -> List[Dict]:
+    """Synthetic documents for every (pages, table density, image density) plus the given PDFs."""
+    corpus = []
+    for pages in args.pages:
+        for tables in args.table_density:
+            for images in args.image_density:
+                name = f"synthetic-p{pages}-t{tables}-i{images}-s{args.seed}.pdf"
+                path = os.path.join(scratch, name)
+                make_pdf(path, pages=pages, table_density=tables, image_density=images, seed=args.seed)
+                corpus.append({"name": name, "path": path, "synthetic": True, "pages": pages,
+                               "table_density": tables, "image_density": images, "bytes": os.path.getsize(path)})
+    for path in args.pdf:
+        corpus.append({"name": os.path.basename(path), "path": os.path.abspath(path), "synthetic": False,
+                       "bytes": os.path.getsize(path)})
+    return corpus
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Ingestion stage micro-benchmark (offline).")
+    parser.add_argument("--pages", type=int, nargs="*", default=[10], help="Synthetic document sizes (pages)")
+    parser.add_argument("--table-density", type=float, nargs="*", default=[0.2], help="Share of pages with a table")
+    parser.add_argument("--image-density", type=float, nargs="*", default=[0.1], help="Share of pages with an image")
+    parser.add_argument("--pdf", nargs="*", default=[], help="Sample documents, e.g. 'docs/attention is all you need.pdf'")
+    parser.add_argument("--no-synthetic", action="store_true", help="Only benchmark the --pdf documents")
+    parser.add_argument("--strategy", nargs="*", default=["auto"], choices=["auto", "hi_res", "fast"],
+                        help="Partition strategies (auto = production: hi_res with fast fallback)")
+    parser.add_argument("--chunking", nargs="*", default=None,
+                        help="chunk_by_title settings as max:new_after:combine_under (default: the pipeline's)")
+    parser.add_argument("--batch-sizes", type=int, nargs="*", default=None, help="Summary batch sizes (default: the pipeline's)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per combination (median and min are reported)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per summary call")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Simulated summary output rate (0 = instant)")
+    parser.add_argument("--replay", default=DEFAULT_REPLAY, help="Recorded summary responses to replay")
+    parser.add_argument("--record", default=None, help="Call Gemini for real and save its responses here (needs GOOGLE_API_KEY)")
+    parser.add_argument("--real-embeddings", action="store_true", help="Use the sentence-transformer model (must be cached locally)")
+    parser.add_argument("--tracemalloc", action="store_true", help="Per-stage Python peak memory (slows the stages down)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="Write the results to this file (default: stdout)")
+    parser.add_argument("--verbose", action="store_true", help="Keep the pipeline's own logging")
+    args = parser.parse_args(argv)
+    if args.no_synthetic:
+        args.pages = []
+
+    stubs.install(fake_embeddings=not args.real_embeddings, fake_llm=not args.record,
+                  latency=args.latency, tokens_per_second=args.tokens_per_second)
+    scratch = tempfile.mkdtemp(prefix="cote-ingest-bench-")
+    quiet = None if args.verbose else open(os.devnull, "w")
+    real_stdout = sys.stdout
+    try:
+        if quiet:
+            sys.stdout = quiet
+        import ingestion_pipeline as pipeline
+        if args.record:
+            recorder = stubs.RecordingChatModel(pipeline.llm)
+            pipeline.llm = recorder
+        else:
+            replay = stubs.ReplayChatModel(args.replay)
+            pipeline.llm = replay
+
+        chunkings = [dict(zip(("max_characters", "new_after_n_chars", "combine_text_under_n_chars"),
+                              map(int, spec.split(":")))) for spec in args.chunking] if args.chunking else [pipeline.CHUNKING]
+        batch_sizes = args.batch_sizes or [pipeline.SUMMARY_BATCH_SIZE]
+        corpus = build_corpus(args, scratch)
+        if args.tracemalloc:
+            tracemalloc.start()
+
+        results = []
+        for doc in corpus:
+            for strategy in args.strategy:
+                for chunking in chunkings:
+                    for batch_size in batch_sizes:
+                        runs = [run_document(pipeline, doc["path"], strategy, chunking, batch_size, args.tracemalloc,
+                                             os.path.join(scratch, "chroma")) for _ in range(args.repeat)]
+                        result = {"document": {k: v for k, v in doc.items() if k != "path"}, "strategy": strategy,
+                                  "chunking": chunking, "batch_size": batch_size, "runs": [r["seconds"] for r in runs]}
+                        result.update(summarize_runs(runs))
+                        results.append(result)
+                        print(f"⏱️ {doc['name']} [{strategy}, {chunking}, batch {batch_size}]: "
+                              f"{result['stages']['total']['median']:.2f}s", file=real_stdout)
+    finally:
+        sys.stdout = real_stdout
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    report = {
+        "commit": _git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"repeat": args.repeat, "seed": args.seed, "latency": args.latency,
+                   "tokens_per_second": args.tokens_per_second, "fake_embeddings": not args.real_embeddings,
+                   "tracemalloc": args.tracemalloc},
+        "results": results,
+    }
+    if args.record:
+        recorder.save(args.record)
+        report["llm"] = {"recorded": len(recorder.recordings), "path": args.record}
+    else:
+        report["llm"] = {"replayed": replay.hits, "synthesized": replay.misses,
+                         "recordings": args.replay if os.path.exists(args.replay) else None}
+
+    output = json.dumps(report, indent=2)
+    if args.json:
+        with open(args.json, "w") as f:
+            f.write(output)
+        print(f"💾 Results written to {args.json}")
+    else:
+        print(output)
+    return report
+
+if __name__ == "__main__":
+    main_cli()
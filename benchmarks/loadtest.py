@@ -0,0 +1,332 @@
+"""
+Offline HTTP load test of main.py with stubbed Gemini (and optionally a fake embedder).
+
+    python -m benchmarks.loadtest --concurrency 16 --duration 60 --latency 0.8 --tokens-per-second 150
+    python -m benchmarks.loadtest --mix ask=1,progress=6,assessment=2,submit=2,upload=0 --json report.json
+
+Boots the app with uvicorn on a local port, in a scratch working directory (uploads, data and
+chroma_db never touch the real ones), seeds one classroom from docs/*.pdf or synthetic PDFs,
+then drives a weighted mix of endpoints from --concurrency virtual students and reports
+throughput and p50/p95/p99 latency per endpoint.
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import contextlib
+import http.client
+from collections import defaultdict
+from typing import Dict, List, Optional
+from urllib.parse import quote, urlencode
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks import stubs
+from benchmarks.pdfs import make_text_pdf
+
+# --- CONFIG ---
+SESSION_ID = "loadtest"
+DEFAULT_MIX = "ask=2,assessment=3,submit=2,progress=5,upload=1"
+QUESTIONS = ["What is attention?", "Explain the encoder stack", "How does softmax work here?",
+             "Summarize the main concepts", "Why are residual connections used?"]
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in VirtualStudent.OPERATIONS:
+            raise ValueError(f"Unknown endpoint in --mix: {name!r} (known: {', '.join(VirtualStudent.OPERATIONS)})")
+        mix[name.strip()] = float(weight or 1)
+    return {k: v for k, v in mix.items() if v > 0}
+
+def _multipart(fields: Dict[str, str], files: List[tuple]):
+    """(body, content type) for a multipart/form-data request; files are (field, filename, bytes)."""
+    boundary = uuid.uuid4().hex
+    body = bytearray()
+    for name, value in fields.items():
+        body += (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n").encode()
+    for name, filename, data in files:
+        body += (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"; filename=\"{filename}\"\r\n"
+                 f"Content-Type: application/pdf\r\n\r\n").encode() + data + b"\r\n"
+    body += f"--{boundary}--\r\n".encode()
+    return bytes(body), f"multipart/form-data; boundary={boundary}"
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint: str, status: int, seconds: float):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+
+    def report(self, elapsed: float) -> Dict:
+        endpoints = {}
+        for endpoint in sorted(self.latencies):
+            values = sorted(self.latencies[endpoint])
+            statuses = dict(self.statuses[endpoint])
+            endpoints[endpoint] = {
+                "requests": len(values),
+                "errors": sum(n for status, n in statuses.items() if status >= 400 or status == 0),
+                "statuses": {str(k): v for k, v in sorted(statuses.items())},
+                "throughput_rps": round(len(values) / elapsed, 3) if elapsed else 0.0,
+                "mean_ms": round(sum(values) / len(values) * 1000, 1),
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p95_ms": round(percentile(values, 95) * 1000, 1),
+                "p99_ms": round(percentile(values, 99) * 1000, 1),
+                "max_ms": round(values[-1] * 1000, 1),
+            }
+        total = sum(e["requests"] for e in endpoints.values())
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 3) if elapsed else 0.0,
+            "endpoints": endpoints,
+        }
+
+class VirtualStudent:
+    """One keep-alive connection issuing a weighted random mix of requests, with per-student state."""
+
+    OPERATIONS = ("ask", "assessment", "submit", "progress", "upload")
+
+    def __init__(self, index: int, port: int, mix: Dict[str, float], recorder: Recorder,
+                 upload_pdf: bytes, seed: int):
+        self.index = index
+        self.student_id = f"student-{index}"
+        self.port = port
+        self.recorder = recorder
+        self.upload_pdf = upload_pdf
+        self.rng = random.Random(seed * 1000 + index)
+        self.names = list(mix)
+        self.weights = [mix[n] for n in self.names]
+        self.conn = None
+        self.last_assessment = None
+        self.progress_etag = None
+        self.uploads = 0
+
+    def _request(self, endpoint: str, method: str, path: str, body: bytes = None, headers: Dict = None):
+        headers = dict(headers or {})
+        start = time.perf_counter()
+        status, data, response_headers = 0, b"", {}
+        for attempt in range(2): # One reconnect if the keep-alive connection was dropped
+            try:
+                if self.conn is None:
+                    self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=600)
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                status, response_headers = response.status, dict(response.getheaders())
+                break
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                self.conn = None
+        self.recorder.record(endpoint, status, time.perf_counter() - start)
+        return status, data, response_headers
+
+    def _json(self, endpoint: str, path: str, payload: Dict):
+        return self._request(endpoint, "POST", path, json.dumps(payload).encode(), {"Content-Type": "application/json"})
+
+    def ask(self):
+        query = urlencode({"session_id": SESSION_ID, "query": self.rng.choice(QUESTIONS), "language": "english"})
+        self._request("POST /ask", "POST", f"/ask?{query}")
+
+    def assessment(self):
+        status, data, _ = self._json("POST /api/assessment/generate", "/api/assessment/generate",
+                                     {"session_id": SESSION_ID, "level": 1, "student_id": self.student_id})
+        if status == 200:
+            self.last_assessment = json.loads(data)
+
+    def submit(self):
+        if not self.last_assessment:
+            return self.assessment()
+        questions = self.last_assessment.get("questions", [])
+        wrong = questions[:self.rng.randint(0, min(3, len(questions)))]
+        mistakes = [{"question": q["question"], "user_answer": "B", "correct_answer": q.get("correct_answer", "A"),
+                     "topic": q.get("topic", "")} for q in wrong]
+        self._json("POST /api/assessment/submit", "/api/assessment/submit", {
+            "session_id": SESSION_ID, "level": 1, "score": len(questions) - len(wrong),
+            "max_score": len(questions), "mistakes": mistakes, "student_id": self.student_id
+        })
+        self.last_assessment = None
+
+    def progress(self):
+        headers = {"Accept-Encoding": "gzip"}
+        if self.progress_etag:
+            headers["If-None-Match"] = self.progress_etag # Polling clients revalidate
+        path = f"/api/progress/{quote(SESSION_ID)}?student_id={quote(self.student_id)}"
+        status, _, response_headers = self._request("GET /api/progress", "GET", path, headers=headers)
+        if status == 200:
+            self.progress_etag = response_headers.get("etag") or response_headers.get("ETag")
+
+    def upload(self):
+        # Each upload is new content in the student's own scratch classroom, so it is saved and ingested
+        self.uploads += 1
+        pdf = self.upload_pdf + f"\n% {self.student_id}-{self.uploads}\n".encode()
+        body, content_type = _multipart({"session_id": f"{SESSION_ID}-up-{self.index}"},
+                                        [("files", f"upload-{self.uploads}.pdf", pdf)])
+        self._request("POST /upload", "POST", "/upload", body, {"Content-Type": content_type})
+
+    def run(self, deadline: float, budget: Optional[list]):
+        try:
+            while time.perf_counter() < deadline:
+                if budget is not None:
+                    with budget[1]:
+                        if budget[0] <= 0:
+                            return
+                        budget[0] -= 1
+                getattr(self, self.rng.choices(self.names, self.weights)[0])()
+        finally:
+            if self.conn is not None:
+                self.conn.close()
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(app, port: int):
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True, name="uvicorn")
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("uvicorn failed to start")
+        time.sleep(0.05)
+    return server, thread
+
+def drain_background_work():
+    """
+    Waits for the app's background pools so nothing writes into the scratch directory after it is
+    removed (queued work is cancelled). Pools that submit into other pools are shut down first.
+    """
+    import assessment_service, flashcard_service, mistake_clusters
+    for pool in (assessment_service._prefetch_pool, assessment_service._remedial_pool, mistake_clusters._assign_pool,
+                 assessment_service._generation_pool, flashcard_service._map_pool):
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def seed_classroom(main, pdfs: List[str], synthetic: int) -> float:
+    """Copies (or generates) the classroom's PDFs and ingests them before the load starts. Returns seconds."""
+    session_dir = os.path.join("uploads", SESSION_ID)
+    os.makedirs(session_dir, exist_ok=True)
+    for path in pdfs:
+        shutil.copy(path, session_dir)
+    for i in range(synthetic):
+        make_text_pdf(os.path.join(session_dir, f"chapter-{i + 1}.pdf"), pages=6, sections=4, seed=i)
+    start = time.perf_counter()
+    main.ingest_and_prepare(session_dir)
+    return time.perf_counter() - start
+
+def print_report(report: Dict):
+    print(f"\n{'endpoint':<32}{'reqs':>7}{'err':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for endpoint, e in report["endpoints"].items():
+        print(f"{endpoint:<32}{e['requests']:>7}{e['errors']:>6}{e['throughput_rps']:>9.2f}"
+              f"{e['p50_ms']:>10.1f}{e['p95_ms']:>10.1f}{e['p99_ms']:>10.1f}{e['max_ms']:>10.1f}")
+    print(f"\nTotal: {report['requests']} requests in {report['elapsed_seconds']}s "
+          f"({report['throughput_rps']:.2f} req/s), {report['stub']['calls']} stub LLM calls")
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Offline HTTP load test with stubbed Gemini.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Virtual students sending requests in parallel")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load")
+    parser.add_argument("--requests", type=int, default=None, help="Stop after this many requests instead")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Endpoint weights (default {DEFAULT_MIX})")
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub LLM seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Stub LLM output rate (0 = instant)")
+    parser.add_argument("--real-embeddings", action="store_true", help="Use the sentence-transformer model (must be cached locally)")
+    parser.add_argument("--pdf", nargs="*", default=None, help="Classroom PDFs (default: docs/*.pdf)")
+    parser.add_argument("--synthetic-chapters", type=int, default=2, help="Generated chapters added to the classroom")
+    parser.add_argument("--workdir", default=None, help="Scratch directory (default: a new temp dir, removed afterwards)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="Also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's own logging")
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    if args.pdf is None:
+        docs = os.path.join(REPO_ROOT, "docs")
+        args.pdf = [os.path.join(docs, f) for f in sorted(os.listdir(docs)) if f.lower().endswith(".pdf")] if os.path.isdir(docs) else []
+    pdfs = [os.path.abspath(p) for p in args.pdf]
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    stubs.install(fake_embeddings=not args.real_embeddings, latency=args.latency,
+                  tokens_per_second=args.tokens_per_second)
+    scratch = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="cote-loadtest-")
+    os.makedirs(scratch, exist_ok=True)
+    os.chdir(scratch) # The app writes uploads/, data/ and chroma_db/ relative to the working directory
+    quiet = open(os.devnull, "w") if not args.verbose else None
+
+    try:
+        with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext():
+            import main
+            server, thread = start_server(main.app, _free_port())
+        port = server.config.port
+        print(f"🧪 App running on 127.0.0.1:{port} in {scratch}")
+
+        with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext():
+            seed_seconds = seed_classroom(main, pdfs, args.synthetic_chapters)
+        print(f"📚 Seeded classroom '{SESSION_ID}' ({len(pdfs)} PDFs + {args.synthetic_chapters} synthetic) in {seed_seconds:.1f}s")
+
+        upload_path = os.path.join(scratch, "upload-template.pdf")
+        make_text_pdf(upload_path, pages=3, sections=2, seed=999)
+        with open(upload_path, "rb") as f:
+            upload_pdf = f.read()
+
+        recorder = Recorder()
+        budget = [args.requests, threading.Lock()] if args.requests else None
+        students = [VirtualStudent(i, port, mix, recorder, upload_pdf, args.seed) for i in range(args.concurrency)]
+        print(f"🚦 {args.concurrency} virtual students for {args.duration}s, mix {mix}")
+        start = time.perf_counter()
+        deadline = start + args.duration if not args.requests else float("inf")
+        with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext():
+            workers = [threading.Thread(target=s.run, args=(deadline, budget), name=f"student-{s.index}") for s in students]
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+        report = recorder.report(time.perf_counter() - start)
+        report["config"] = {"concurrency": args.concurrency, "mix": mix, "latency": args.latency,
+                            "tokens_per_second": args.tokens_per_second, "fake_embeddings": not args.real_embeddings,
+                            "seed_seconds": round(seed_seconds, 2)}
+        report["stub"] = stubs.get_stats()
+
+        print_report(report)
+        if json_path:
+            with open(json_path, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"💾 Report written to {json_path}")
+        # Uploads leave ingestion and question banks running; finish them at stub speed 0 rather than waiting minutes
+        stubs.configure(latency=0, tokens_per_second=0)
+        server.should_exit = True
+        with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext():
+            thread.join() # Graceful shutdown also waits for background ingestion started by uploads
+        return report
+    finally:
+        if "main" in sys.modules:
+            with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext():
+                drain_background_work()
+        os.chdir(REPO_ROOT)
+        if not args.workdir:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+if __name__ == "__main__":
+    main_cli()
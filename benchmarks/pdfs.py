@@ -0,0 +1,138 @@
+import zlib
+import random
+from typing import List
+
+from benchmarks.stubs import filler
+
+# Minimal synthetic PDFs (no PDF library needed): numbered section headings and body text,
+# so partitioning and topic mapping have real structure to work on, plus optional ruled
+# tables and raster images (which only the hi_res partition strategy extracts).
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792
+LINES_PER_PAGE = 40
+TABLE_ROWS, TABLE_COLS = 6, 4
+TABLE_HEIGHT = TABLE_ROWS * 20 + 20
+IMAGE_SIZE = (256, 192) # Pixels; large enough to pass ingestion's small-image filter
+IMAGE_HEIGHT = 200
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def _page_stream(lines: List[tuple]) -> bytes:
+    """lines: (font_size, text). One text object, top to bottom."""
+    ops = ["BT", "72 740 Td"]
+    for size, text in lines:
+        ops.append(f"/F1 {size} Tf")
+        ops.append(f"0 -{size + 4} Td")
+        ops.append(f"({_escape(text)}) Tj")
+    ops.append("ET")
+    return "\n".join(ops).encode("latin-1", "replace")
+
+def write_pdf(path: str, pages: List[bytes], extra_objects: List[bytes] = None, resources: str = ""):
+    """
+    Writes page content streams as a PDF. extra_objects are appended after the font (object 3)
+    and can be referenced from `resources` (e.g. image XObjects).
+    """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    objects += extra_objects or []
+    page_ids = []
+    for stream in pages:
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append((f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+                        f"/Resources << /Font << /F1 3 0 R >> {resources} >> /Contents {content_id} 0 R >>").encode())
+        page_ids.append(len(objects))
+    kids = " ".join(f"{i} 0 R" for i in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+def _table_ops(top: float, seed: str) -> List[str]:
+    """A ruled TABLE_ROWS x TABLE_COLS grid with a header row, its top edge at y=top."""
+    x0, width, height = 72, 110, 20
+    ops = ["0.5 w"]
+    for r in range(TABLE_ROWS + 1):
+        y = top - r * height
+        ops.append(f"{x0} {y} m {x0 + TABLE_COLS * width} {y} l S")
+    for c in range(TABLE_COLS + 1):
+        x = x0 + c * width
+        ops.append(f"{x} {top} m {x} {top - TABLE_ROWS * height} l S")
+    for r in range(TABLE_ROWS):
+        for c in range(TABLE_COLS):
+            text = f"Column {c + 1}" if r == 0 else (filler(f"{seed}-{r}-{c}", 1) if c == 0 else f"{(r * 7 + c * 13) % 97}.{r}")
+            ops.append(f"BT /F1 9 Tf {x0 + c * width + 4} {top - (r + 1) * height + 6} Td ({_escape(text)}) Tj ET")
+    return ops
+
+def _image_object(seed: int) -> bytes:
+    """An RGB image XObject: a gradient with noise, Flate-compressed."""
+    rng = random.Random(seed)
+    w, h = IMAGE_SIZE
+    pixels = bytearray()
+    for y in range(h):
+        for x in range(w):
+            pixels += bytes(((x + seed * 37) % 256, (y * 2) % 256, rng.randrange(256)))
+    data = zlib.compress(bytes(pixels), 6)
+    return (f"<< /Type /XObject /Subtype /Image /Width {w} /Height {h} /ColorSpace /DeviceRGB "
+            f"/BitsPerComponent 8 /Filter /FlateDecode /Length {len(data)} >>\nstream\n").encode() + data + b"\nendstream"
+
+def make_pdf(path: str, pages: int = 10, table_density: float = 0.0, image_density: float = 0.0,
+             sections: int = None, seed: int = 0):
+    """
+    A chapter of `pages` pages with numbered sections. table_density / image_density are the
+    probability that a page carries a table / an image (0..1), drawn from `seed`.
+    """
+    rng = random.Random(seed)
+    sections = sections or max(pages // 3, 1)
+    section_starts = {round(i * pages / sections): i + 1 for i in range(sections)}
+    images, streams, section = [], [], 0
+    for page in range(pages):
+        has_table = rng.random() < table_density
+        has_image = rng.random() < image_density
+        free_lines = LINES_PER_PAGE - (9 if has_table else 0) - (14 if has_image else 0)
+        lines = []
+        if page in section_starts:
+            section = section_starts[page]
+            lines.append((16, f"{section}. {filler(f'{seed}-{section}', 3).title()}"))
+        elif page % 2 == 0:
+            lines.append((13, f"{section}.{page} {filler(f'{seed}-{page}', 2).title()}"))
+        lines += [(10, filler(f"{seed}-{page}-{i}", 14) + ".") for i in range(free_lines - len(lines))]
+
+        ops = [_page_stream(lines).decode("latin-1")]
+        y = 740 - sum(size + 4 for size, _ in lines) - 20
+        if has_table:
+            ops += _table_ops(y, f"{seed}-{page}")
+            y -= TABLE_HEIGHT
+        if has_image:
+            ops.append(f"q 256 0 0 192 72 {y - 192} cm /Im{len(images)} Do Q")
+            images.append(_image_object(seed * 1000 + page))
+        streams.append("\n".join(ops).encode("latin-1"))
+
+    # Image objects follow the font (object 3)
+    xobjects = " ".join(f"/Im{i} {4 + i} 0 R" for i in range(len(images)))
+    write_pdf(path, streams, images, f"/XObject << {xobjects} >>" if images else "")
+
+def make_text_pdf(path: str, pages: int = 4, sections: int = 3, seed: int = 0):
+    """A chapter with numbered sections ("1. Heading", "1.1 Sub-heading") and filler paragraphs."""
+    rng = random.Random(seed)
+    streams, lines = [], []
+    per_section = max(pages * LINES_PER_PAGE // max(sections, 1), 4)
+    for s in range(1, sections + 1):
+        lines.append((16, f"{s}. {filler(f'{seed}-{s}', 3).title()}"))
+        for i in range(per_section - 1):
+            if i and i % 12 == 0:
+                lines.append((13, f"{s}.{i // 12} {filler(f'{seed}-{s}-{i}', 2).title()}"))
+            lines.append((10, filler(f"{seed}-{s}-{i}-{rng.random()}", 14) + "."))
+    for start in range(0, len(lines), LINES_PER_PAGE):
+        streams.append(_page_stream(lines[start:start + LINES_PER_PAGE]))
+    write_pdf(path, streams[:pages] or [_page_stream([])])
@@ -0,0 +1,238 @@
+import os
+import re
+import json
+import math
+import time
+import hashlib
+import itertools
+import threading
+from typing import Dict, Iterator, List
+
+# Deterministic stand-ins for ChatGoogleGenerativeAI and HuggingFaceEmbeddings, so the app can be
+# benchmarked offline without spending Gemini quota. install() must run before the app modules are
+# imported: they build their clients at import time.
+#
+# The chat stub recognizes each prompt the app sends (summaries, question pools, flashcards,
+# translations, diagnoses, doubt answers) and answers with well-formed output of the right size,
+# after a configurable first-token latency plus output tokens / tokens_per_second.
+
+# --- CONFIG ---
+SETTINGS = {
+    "latency": 0.5,            # Seconds before the first token
+    "tokens_per_second": 200.0, # Output pacing after the first token
+    "answer_words": 250,       # Length of free-text (doubt assistant) answers
+    "embedding_dim": 384,      # Same as all-MiniLM-L6-v2
+}
+CHARS_PER_TOKEN = 4
+STREAM_CHUNK_CHARS = 200
+
+_calls = itertools.count()
+_stats_lock = threading.Lock()
+_stats = {"calls": 0, "output_chars": 0, "embedded_texts": 0}
+
+def configure(**settings):
+    unknown = set(settings) - set(SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown stub settings: {sorted(unknown)}")
+    SETTINGS.update({k: v for k, v in settings.items() if v is not None})
+
+def get_stats() -> Dict:
+    with _stats_lock:
+        return dict(_stats)
+
+def _count(key: str, amount: int):
+    with _stats_lock:
+        _stats[key] += amount
+
+class StubMessage:
+    def __init__(self, content: str):
+        self.content = content
+
+def _prompt_text(messages) -> str:
+    parts = []
+    for message in messages if isinstance(messages, (list, tuple)) else [messages]:
+        content = getattr(message, "content", message)
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(p.get("text", "") for p in content if isinstance(p, dict))
+    return "\n".join(parts)
+
+def filler(seed: str, count: int) -> str:
+    """Deterministic filler text."""
+    vocabulary = ("attention", "layer", "gradient", "token", "vector", "matrix", "encoder", "decoder",
+                  "softmax", "residual", "embedding", "sequence", "weight", "training", "model", "input")
+    digest = hashlib.sha256(seed.encode("utf-8")).digest()
+    return " ".join(vocabulary[digest[i % len(digest)] % len(vocabulary)] for i in range(count))
+
+def respond(prompt: str) -> str:
+    """The stub's answer to one of the app's prompts."""
+    n = next(_calls)
+    seed = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+
+    blocks = re.findall(r"--- BLOCK (\d+) ---", prompt)
+    if blocks:
+        return json.dumps([f"Summary of block {b}: {filler(seed + b, 40)}" for b in blocks])
+
+    if '"flashcards"' in prompt:
+        title = (re.search(r'titled "(.+?)"', prompt) or [None, "Topic"])[1]
+        return json.dumps({"flashcards": [{
+            "topic": title,
+            "summary": f"- **{title}**: {filler(seed, 30)}\n- **Key idea**: {filler(seed + 'k', 20)}"
+        }]})
+
+    if "Return a JSON array only" in prompt and '"summary"' in prompt:
+        payload = prompt[prompt.rfind("\n\n[") + 2:]
+        try:
+            cards = json.loads(payload)
+        except ValueError:
+            cards = []
+        # Keeps the markdown (and so every bold technical term) of the English card
+        return json.dumps([{"id": c["id"], "summary": c["summary"] + " " + filler(seed, 10)} for c in cards])
+
+    if "Diagnose EACH mistake" in prompt:
+        indexes = sorted({int(i) for i in re.findall(r'"index": (\d+)', prompt)})
+        return json.dumps([{
+            "index": i,
+            "gap": "Concept Gap",
+            "diagnosis": f"Concept Gap: {filler(seed + str(i), 6)}",
+            "explanation": filler(seed + str(i), 40),
+            "practice_question": {"question": f"Practice {i}: {filler(seed, 8)}?", "options": ["A", "B", "C", "D"],
+                                  "correct_answer": "A", "explanation": filler(seed, 12)}
+        } for i in indexes])
+
+    pool = re.search(r"Generate (\d+) (Multiple Choice|Short Answer)", prompt)
+    if pool:
+        count, mcq = int(pool.group(1)), pool.group(2) == "Multiple Choice"
+        questions = []
+        for i in range(count):
+            q = {
+                "id": i + 1,
+                "topic": f"Section {i % 4 + 1}",
+                "difficulty": ("easy", "medium", "hard")[i % 3],
+                # Unique per call, so bank refills are never deduplicated away
+                "question": f"Q{n}.{i}: {filler(seed + str(i), 12)}?",
+                "explanation": filler(seed + str(i), 20),
+                "hints": ["Think about it", "Look at the definition", "It is A"],
+            }
+            if mcq:
+                q.update(options=["A", "B", "C", "D"], correct_answer="A")
+            else:
+                q["type"] = "short_answer"
+            questions.append(q)
+        return json.dumps(questions)
+
+    return filler(seed, SETTINGS["answer_words"])
+
+def _pace(chars: int):
+    if SETTINGS["tokens_per_second"] > 0:
+        time.sleep(chars / CHARS_PER_TOKEN / SETTINGS["tokens_per_second"])
+
+class StubChatModel:
+    """Drop-in for ChatGoogleGenerativeAI: invoke() and stream() with simulated latency."""
+
+    def __init__(self, *args, model: str = "stub", temperature: float = 0.0, **kwargs):
+        self.model = model
+        self.temperature = temperature
+
+    def invoke(self, messages, *args, **kwargs) -> StubMessage:
+        text = respond(_prompt_text(messages))
+        time.sleep(SETTINGS["latency"])
+        _pace(len(text))
+        _count("calls", 1)
+        _count("output_chars", len(text))
+        return StubMessage(text)
+
+    def stream(self, messages, *args, **kwargs) -> Iterator[StubMessage]:
+        text = respond(_prompt_text(messages))
+        _count("calls", 1)
+        _count("output_chars", len(text))
+        time.sleep(SETTINGS["latency"])
+        for i in range(0, len(text), STREAM_CHUNK_CHARS):
+            chunk = text[i:i + STREAM_CHUNK_CHARS]
+            _pace(len(chunk))
+            yield StubMessage(chunk)
+
+def prompt_key(messages) -> str:
+    """Stable key of a prompt, images included, for recorded responses."""
+    contents = [getattr(m, "content", m) for m in (messages if isinstance(messages, (list, tuple)) else [messages])]
+    return hashlib.sha256(json.dumps(contents, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class RecordingChatModel:
+    """Wraps a real chat model and keeps every response by prompt key (see save())."""
+
+    def __init__(self, model):
+        self.model = model
+        self.lock = threading.Lock()
+        self.recordings = {}
+
+    def invoke(self, messages, *args, **kwargs):
+        response = self.model.invoke(messages, *args, **kwargs)
+        with self.lock:
+            self.recordings[prompt_key(messages)] = response.content
+        return response
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.recordings, f, indent=1, sort_keys=True)
+
+class ReplayChatModel(StubChatModel):
+    """Answers from recorded responses; unrecorded prompts get the synthesized stub answer (counted as misses)."""
+
+    def __init__(self, path: str = None):
+        super().__init__()
+        self.recordings = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.recordings = json.load(f)
+        self.hits = 0
+        self.misses = 0
+
+    def invoke(self, messages, *args, **kwargs) -> StubMessage:
+        recorded = self.recordings.get(prompt_key(messages))
+        if recorded is None:
+            self.misses += 1
+            return super().invoke(messages)
+        self.hits += 1
+        time.sleep(SETTINGS["latency"])
+        _pace(len(recorded))
+        _count("calls", 1)
+        _count("output_chars", len(recorded))
+        return StubMessage(recorded)
+
+class FakeEmbeddings:
+    """Drop-in for HuggingFaceEmbeddings: hashed bag-of-words vectors, so similar texts stay close."""
+
+    def __init__(self, *args, **kwargs):
+        self.dim = SETTINGS["embedding_dim"]
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        for word in re.findall(r"\w+", text.lower()):
+            h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[h % self.dim] += 1.0 if h & (1 << 63) else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        _count("embedded_texts", len(texts))
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        _count("embedded_texts", 1)
+        return self._embed(text)
+
+def install(fake_embeddings: bool = True, fake_llm: bool = True, **settings):
+    """Swaps the real clients for the stubs. Call before importing main (or any service module)."""
+    configure(**settings)
+    # Cached Hugging Face models (embedder, hi_res layout model) still load; nothing is downloaded
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    if fake_llm:
+        os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+        import langchain_google_genai
+        langchain_google_genai.ChatGoogleGenerativeAI = StubChatModel
+    if fake_embeddings:
+        import langchain_huggingface
+        langchain_huggingface.HuggingFaceEmbeddings = FakeEmbeddings
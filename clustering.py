@@ -0,0 +1,51 @@
+import numpy as np
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalizes each row so dot products are cosine similarities."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def kmeans(vectors, k: int, iterations: int = 25, seed: int = 0):
+    """
+    Spherical k-means (cosine) with k-means++ seeding, fully vectorized.
+    Returns (labels, centroids). Cost per iteration is one (n x k) matrix product.
+    """
+    X = normalize_rows(np.asarray(vectors, dtype=np.float32))
+    n = X.shape[0]
+    k = max(1, min(k, n))
+    rng = np.random.default_rng(seed)
+
+    # k-means++ seeding on cosine distance
+    centroids = np.empty((k, X.shape[1]), dtype=np.float32)
+    centroids[0] = X[rng.integers(n)]
+    closest = 1.0 - X @ centroids[0]
+    for i in range(1, k):
+        # float64: choice() checks that p sums to 1 within float64 tolerance
+        p = np.clip(closest, 0, None).astype(np.float64) ** 2
+        total = p.sum()
+        idx = rng.choice(n, p=p / total) if total > 0 else rng.integers(n)
+        centroids[i] = X[idx]
+        closest = np.minimum(closest, 1.0 - X @ centroids[i])
+
+    labels = np.zeros(n, dtype=np.int64)
+    for it in range(iterations):
+        new_labels = np.argmax(X @ centroids.T, axis=1)
+        if it > 0 and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, X)
+        counts = np.bincount(labels, minlength=k)
+        empty = counts == 0
+        sums[empty] = centroids[empty]  # Keep empty clusters where they were
+        centroids = normalize_rows(sums)
+
+    return labels, centroids
+
+def assign_to_centroids(vectors, centroids):
+    """Nearest centroid (cosine) for each vector: returns (labels, similarities)."""
+    X = normalize_rows(np.asarray(vectors, dtype=np.float32))
+    sims = X @ np.asarray(centroids, dtype=np.float32).T
+    labels = np.argmax(sims, axis=1)
+    return labels, sims[np.arange(len(labels)), labels]
@@ -0,0 +1,205 @@
+import os
+import glob
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Dict, List
+
+import sqlite_db
+import page_store
+
+# --- CONFIG ---
+DATA_ROOT = "data"
+UPLOAD_ROOT = "uploads"
+CORPUS_DB = os.path.join(DATA_ROOT, "corpus.db")
+REAP_INTERVAL_SECONDS = 24 * 3600
+# Pre-stamp artifacts: flashcard JSON files named by hand (flashcards_v9...), replaced by the content-keyed cache
+LEGACY_ARTIFACTS = [os.path.join(UPLOAD_ROOT, "*", "flashcards_*.json")]
+
+os.makedirs(DATA_ROOT, exist_ok=True)
+
+# Every classroom carries a corpus version that goes up whenever one of its chapters is added,
+# changed or removed, and a content hash per chapter. Derived artifacts are keyed by the chapter
+# hash (or by the version, for whole-session artifacts), so only what depends on a changed chapter
+# is regenerated and the rest of the cache stays warm.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chapters (
+    session_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (session_id, source)
+);
+"""
+
+_hash_cache = {}
+_hash_lock = threading.Lock()
+
+def get_connection() -> sqlite3.Connection:
+    return sqlite_db.get_connection(CORPUS_DB, SCHEMA)
+
+def transaction():
+    return sqlite_db.transaction(get_connection())
+
+def file_hash(path: str) -> str:
+    """SHA-256 of a file, memoized on (path, size, mtime) so each version is read once."""
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    with _hash_lock:
+        if key in _hash_cache:
+            return _hash_cache[key]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    content_hash = digest.hexdigest()
+
+    with _hash_lock:
+        _hash_cache[key] = content_hash
+    return content_hash
+
+def remember_hash(path: str, content_hash: str):
+    """Records a hash computed while the file was written (e.g. during upload), so it isn't read again."""
+    stat = os.stat(path)
+    with _hash_lock:
+        _hash_cache[(path, stat.st_size, stat.st_mtime_ns)] = content_hash
+
+def diff_session(session_id: str, directory_path: str) -> Dict:
+    """
+    Called by ingestion before it indexes anything: compares the upload directory with the recorded
+    chapter hashes. Returns {"version" (the version the session will have), "added", "changed",
+    "removed", "hashes"}; nothing is stored until commit_session.
+    """
+    current = {}
+    if os.path.isdir(directory_path):
+        for filename in os.listdir(directory_path):
+            if filename.lower().endswith(".pdf"):
+                current[filename] = file_hash(os.path.join(directory_path, filename))
+
+    conn = get_connection()
+    row = conn.execute("SELECT version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+    stored = {r["source"]: r["content_hash"] for r in conn.execute(
+        "SELECT source, content_hash FROM chapters WHERE session_id = ?", (session_id,)).fetchall()}
+
+    added = sorted(s for s in current if s not in stored)
+    changed = sorted(s for s in current if s in stored and stored[s] != current[s])
+    removed = sorted(s for s in stored if s not in current)
+    version = row["version"] if row else 0
+    if added or changed or removed or row is None:
+        version += 1
+    return {"version": version, "added": added, "changed": changed, "removed": removed, "hashes": current}
+
+def commit_session(session_id: str, stamp: Dict) -> int:
+    """
+    Called once the new chunks are in the vector store: records the chapter hashes from diff_session
+    and bumps the corpus version, so version-stamped caches never pair the new version with the old index.
+    """
+    added, changed, removed = stamp["added"], stamp["changed"], stamp["removed"]
+    now = time.time()
+    with transaction() as conn:
+        row = conn.execute("SELECT version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        version = row["version"] if row else 0
+        if not (added or changed or removed or row is None):
+            return version
+        # Another ingestion of the same classroom may have committed since the diff
+        version = max(stamp["version"], version + 1)
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, version, updated_at) VALUES (?, ?, ?)",
+            (session_id, version, now)
+        )
+        conn.executemany(
+            """INSERT OR REPLACE INTO chapters (session_id, source, content_hash, version, updated_at)
+               VALUES (?, ?, ?, ?, ?)""",
+            [(session_id, s, stamp["hashes"][s], version, now) for s in added + changed]
+        )
+        conn.executemany("DELETE FROM chapters WHERE session_id = ? AND source = ?",
+                         [(session_id, s) for s in removed])
+
+    print(f"🗂️ Corpus {session_id} v{version}: {len(added)} added, {len(changed)} changed, {len(removed)} removed")
+    return version
+
+def get_version(session_id: str) -> int:
+    """Corpus version of a classroom (0 before its first ingestion)."""
+    row = get_connection().execute("SELECT version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+    return row["version"] if row else 0
+
+def get_chapter_hashes(session_id: str) -> Dict[str, str]:
+    """Chapter filename -> content hash, as of the last ingestion."""
+    rows = get_connection().execute(
+        "SELECT source, content_hash FROM chapters WHERE session_id = ?", (session_id,)).fetchall()
+    return {r["source"]: r["content_hash"] for r in rows}
+
+def list_sessions() -> List[str]:
+    return [r["session_id"] for r in get_connection().execute("SELECT session_id FROM sessions").fetchall()]
+
+def live_file_hashes(session_ids: List[str]) -> set:
+    """Content hashes of every PDF currently in these classrooms' upload directories."""
+    hashes = set()
+    for session_id in session_ids:
+        session_dir = os.path.join(UPLOAD_ROOT, session_id)
+        if os.path.isdir(session_dir):
+            hashes.update(file_hash(os.path.join(session_dir, f)) for f in os.listdir(session_dir)
+                          if f.lower().endswith(".pdf"))
+    return hashes
+
+def remove_legacy_artifacts() -> int:
+    removed = 0
+    for pattern in LEGACY_ARTIFACTS:
+        for path in glob.glob(pattern):
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError as e:
+                print(f"⚠️ Could not remove legacy artifact {path}: {e}")
+    return removed
+
+def reap_stale_artifacts(session_ids: List[str] = None) -> Dict[str, int]:
+    """
+    Garbage-collects derived artifacts whose chapter hash or prompt version is no longer current.
+    With session_ids, only those classrooms' assessment and remedial entries are checked; without,
+    every classroom is, plus the (cross-classroom) flashcard cache and legacy JSON files.
+    """
+    # Imported here: both services import this module
+    import assessment_service
+    import flashcard_service
+
+    full = session_ids is None
+    if full:
+        uploads = [d for d in os.listdir(UPLOAD_ROOT) if os.path.isdir(os.path.join(UPLOAD_ROOT, d))] \
+            if os.path.isdir(UPLOAD_ROOT) else []
+        session_ids = sorted(set(list_sessions()) | set(uploads) | set(assessment_service.list_cached_sessions()))
+
+    removed = {"assessments": 0, "flashcards": 0, "pages": 0, "legacy_files": 0}
+    for session_id in session_ids:
+        removed["assessments"] += assessment_service.reap_stale_assessments(session_id)
+    if full:
+        removed["flashcards"] = flashcard_service.reap_stale_flashcards()
+        removed["pages"] = page_store.reap(live_file_hashes(session_ids))
+        removed["legacy_files"] = remove_legacy_artifacts()
+
+    if any(removed.values()):
+        print(f"🧹 Reaped stale artifacts: {removed}")
+    return removed
+
+def start_reaper(interval: float = REAP_INTERVAL_SECONDS):
+    """Runs a full reap_stale_artifacts at startup and then periodically, on a daemon thread."""
+    def loop():
+        while True:
+            try:
+                reap_stale_artifacts()
+            except Exception as e:
+                print(f"⚠️ Artifact reaper failed: {e}")
+            time.sleep(interval)
+    threading.Thread(target=loop, name="artifact-reaper", daemon=True).start()
+
+if __name__ == "__main__":
+    # Manual full reap: python corpus_store.py
+    print(reap_stale_artifacts())
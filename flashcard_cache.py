@@ -0,0 +1,53 @@
+import os
+import json
+import time
+import sqlite3
+from typing import Dict, Iterable, List, Optional
+
+import sqlite_db
+
+# --- CONFIG ---
+DATA_ROOT = "data"
+FLASHCARD_DB = os.path.join(DATA_ROOT, "flashcard_cache.db")
+
+os.makedirs(DATA_ROOT, exist_ok=True)
+
+# Cards per topic, content-addressed: the same topic text (in any classroom) maps to the same entry
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS topic_cards (
+    topic_hash TEXT NOT NULL,
+    language TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (topic_hash, language, prompt_version)
+);
+"""
+
+def get_connection() -> sqlite3.Connection:
+    return sqlite_db.get_connection(FLASHCARD_DB, SCHEMA)
+
+def get_cards(topic_hash: str, language: str, prompt_version: str) -> Optional[List[Dict]]:
+    row = get_connection().execute(
+        "SELECT payload FROM topic_cards WHERE topic_hash = ? AND language = ? AND prompt_version = ?",
+        (topic_hash, language, prompt_version)
+    ).fetchone()
+    return json.loads(row["payload"]) if row else None
+
+def put_cards(topic_hash: str, language: str, prompt_version: str, topic: str, cards: List[Dict]):
+    get_connection().execute(
+        """INSERT OR REPLACE INTO topic_cards (topic_hash, language, prompt_version, topic, payload, created_at)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        (topic_hash, language, prompt_version, topic, json.dumps(cards, ensure_ascii=False), time.time())
+    )
+
+def reap(keep_topic_hashes: Iterable[str], prompt_version: str) -> int:
+    """Drops cards of topics no classroom contains any more, or from an older prompt."""
+    conn = get_connection()
+    keep = set(keep_topic_hashes)
+    stale = [(r["topic_hash"], r["language"], r["prompt_version"]) for r in conn.execute(
+        "SELECT topic_hash, language, prompt_version FROM topic_cards").fetchall()
+        if r["topic_hash"] not in keep or r["prompt_version"] != prompt_version]
+    conn.executemany("DELETE FROM topic_cards WHERE topic_hash = ? AND language = ? AND prompt_version = ?", stale)
+    return len(stale)
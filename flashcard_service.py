@@ -1,5 +1,10 @@
 import os
+import re
 import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
 from typing import List, Dict
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_chroma import Chroma
@@ -12,6 +17,13 @@ from tenacity import (
     retry_if_exception_type
 )
 from dotenv import load_dotenv
+from json_stream import extract_items, requires
+from rate_limiter import api_semaphore
+import flashcard_cache
+import corpus_store
+import response_cache
+import metrics
+import tracing
 
 load_dotenv(override=True)
 
@@ -19,17 +31,41 @@ load_dotenv(override=True)
 CHROMA_PATH = "./chroma_db"
 LOCAL_EMBEDDINGS = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
 llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.3)
+FLASHCARD_SCHEMA = requires(topic=str, summary=str)
+FLASHCARD_PROMPT_VERSION = "v11" # Bump when the prompt changes; cached topics are then regenerated
+TOPIC_CHAR_BUDGET = 24000 # Per topic (map step), instead of the first 40 chunks of the whole session
+MAX_CARDS_PER_TOPIC = 3
+CANONICAL_LANGUAGE = "english" # Generated from the material; every other language is translated from it
+FLASHCARD_LANGUAGES = ["english", "hindi", "telugu", "hinglish"]
+TRANSLATION_BATCH_SIZE = 8 # Cards per translation call
+# Set FLASHCARD_PREWARM=true to build every language's flashcards right after ingestion
+FLASHCARD_PREWARM = os.getenv("FLASHCARD_PREWARM", "false").lower() == "true"
+RESPONSE_CACHE_MB = int(os.getenv("FLASHCARD_RESPONSE_CACHE_MB", "32"))
+
+# Map step fan-out; actual LLM concurrency is still capped by api_semaphore
+_map_pool = metrics.MeteredThreadPool(max_workers=4, thread_name_prefix="flashcards")
+_topic_locks = {}  # key -> [lock, holders]; dropped once nobody holds or waits on it
+_topic_locks_guard = threading.Lock()
+# Serialized card sets per (session, language), stamped with the corpus version
+_response_cache = response_cache.get_cache("flashcards", RESPONSE_CACHE_MB * 1024 * 1024)
 
 @retry(
     stop=stop_after_attempt(5),
     wait=wait_exponential(multiplier=1, min=2, max=10),
     retry=retry_if_exception_type(Exception),
-    before_sleep=lambda retry_state: print(f"⚠️ API Limit hit (Flashcards). Retrying in {retry_state.next_action.sleep} seconds...")
+    before_sleep=metrics.retry_hook("flashcards", " (Flashcards)")
 )
 def generate_ai_response(messages):
     try:
-        return llm.invoke(messages)
+        # Held per attempt, so retry backoff doesn't block other LLM callers
+        with api_semaphore:
+            start = time.perf_counter()
+            with tracing.span("llm.invoke", subsystem="flashcards"):
+                response = llm.invoke(messages)
+        metrics.record_llm_call("flashcards", messages, response.content, time.perf_counter() - start)
+        return response
     except Exception as e:
+        metrics.inc("cote_llm_errors_total", subsystem="flashcards")
         print(f"DEBUG: API call failed with error: {str(e)}")
         raise e
 
@@ -54,76 +90,267 @@ Rules for your response:
      - *Example (Telugu)*: "Neural Network అనేది ఒక కంప్యూటర్ సిస్టమ్..."
 """
 
-def generate_flashcards(session_id: str, language: str = "english"):
+def get_topic_groups(session_id: str) -> List[Dict]:
     """
-    Generates topic-wise revision summaries from the ingested materials of a session.
+    The session's indexed chunks grouped by (source file, parent_topic), in upload and ingestion order.
+    Each group carries a hash of its chunk contents, which keys its cached cards.
     """
-    cache_name = f"flashcards_v9_{language.lower()}.json"
-    flashcard_cache_path = os.path.join("uploads", session_id, cache_name)
-    
-    # Check if already generated for this language
-    if os.path.exists(flashcard_cache_path):
-        try:
-            with open(flashcard_cache_path, "r", encoding="utf-8") as f:
-                return json.load(f)["flashcards"]
-        except Exception as e:
-            print(f"⚠️ Error reading flashcard cache: {e}")
-
-    # 1. Connect to DB
     db = Chroma(
         persist_directory=CHROMA_PATH,
         embedding_function=LOCAL_EMBEDDINGS,
         collection_name="hackathon_collection"
     )
+    results = db.get(where={"session_id": session_id}, include=["documents", "metadatas"])
 
-    # 2. Retrieve all unique chunks for this session
-    print(f"🔍 Retrieving material for {language} flashcards in session: {session_id}")
-    results = db.get(
-        where={"session_id": session_id},
-        include=["documents"]
+    groups = {}
+    for doc, meta in zip(results.get("documents") or [], results.get("metadatas") or []):
+        meta = meta or {}
+        key = (meta.get("source", ""), meta.get("parent_topic") or "General")
+        group = groups.setdefault(key, {
+            "source": key[0], "topic": key[1], "timestamp": meta.get("timestamp", 0), "documents": []
+        })
+        group["documents"].append(doc)
+
+    ordered = sorted(groups.values(), key=lambda g: g["timestamp"])  # Stable: keeps ingestion order within a file
+    for group in ordered:
+        group["hash"] = hashlib.sha256("\n\n".join(sorted(group["documents"])).encode("utf-8")).hexdigest()
+    return ordered
+
+@contextmanager
+def _topic_lock(key: tuple):
+    with _topic_locks_guard:
+        entry = _topic_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _topic_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _topic_locks[key]
+
+def _script_note(language: str) -> str:
+    if language == "hindi":
+        return "STRICT: Use Devanagari script (हिन्दी) for explanations."
+    if language == "telugu":
+        return "STRICT: Use Telugu script (తెలుగు) ONLY. DO NOT USE ENGLISH ALPHABETS FOR TELUGU SENTENCES."
+    return ""
+
+@tracing.traced("flashcards.topic")
+def generate_topic_cards(group: Dict) -> List[Dict]:
+    """Map step: canonical (English) cards for one topic, from the cache when its chunks haven't changed."""
+    cached = flashcard_cache.get_cards(group["hash"], CANONICAL_LANGUAGE, FLASHCARD_PROMPT_VERSION)
+    metrics.cache_result("flashcard_topics", cached is not None)
+    if cached is not None:
+        return cached
+
+    # Concurrent requests for the same topic wait for one generation instead of paying twice
+    with _topic_lock((group["hash"], CANONICAL_LANGUAGE)):
+        cached = flashcard_cache.get_cards(group["hash"], CANONICAL_LANGUAGE, FLASHCARD_PROMPT_VERSION)
+        if cached is not None:
+            return cached
+
+        context = "\n\n".join(group["documents"])[:TOPIC_CHAR_BUDGET]
+        prompt = (
+            f"The text below is one section of the course material, titled \"{group['topic']}\". "
+            f"Generate revision flashcards for it: one card, or up to {MAX_CARDS_PER_TOPIC} if it clearly covers separate concepts."
+            f"\n\n{context}\n\nOutput language: {CANONICAL_LANGUAGE}."
+        )
+        messages = [
+            SystemMessage(content=FLASHCARD_SYSTEM_PROMPT),
+            HumanMessage(content=prompt)
+        ]
+
+        response = generate_ai_response(messages)
+        cards, complete = extract_items(response.content, "flashcards", FLASHCARD_SCHEMA, key="flashcards")
+        cards = cards[:MAX_CARDS_PER_TOPIC]
+        # Partial results are served but regenerated next time
+        if cards and complete:
+            flashcard_cache.put_cards(group["hash"], CANONICAL_LANGUAGE, FLASHCARD_PROMPT_VERSION, group["topic"], cards)
+        return cards
+
+def technical_terms(card: Dict) -> List[str]:
+    """Terms that must survive translation: the bold key terms of the English summary."""
+    terms = re.findall(r"\*\*(.+?)\*\*", card.get("summary", ""))
+    return sorted({t.strip() for t in terms if re.search(r"[A-Za-z]", t) and len(t.strip()) <= 60})
+
+def missing_terms(english: Dict, translated: Dict) -> List[str]:
+    text = translated.get("summary", "").lower()
+    return [t for t in technical_terms(english) if t.lower() not in text]
+
+def _translate_batch(cards: List[Dict], language: str, strict: bool = False) -> Dict[int, Dict]:
+    """One translation call for a batch of English cards. Returns {index: translated card}."""
+    payload = json.dumps([{"id": i, "topic": c["topic"], "summary": c["summary"]} for i, c in enumerate(cards)],
+                         ensure_ascii=False, indent=2)
+    keep = ""
+    if strict:
+        terms = sorted({t for c in cards for t in technical_terms(c)})
+        keep = f"\nThese terms MUST appear exactly as written (English, Roman script): {', '.join(terms)}"
+    prompt = (
+        f"Translate the \"summary\" of each revision flashcard below into {language}. {_script_note(language)}\n"
+        f"Keep the markdown (bullet points, **bold**), keep every technical term, technical definition and proper noun "
+        f"in English (Roman script), and keep every **bold** term exactly as it is.{keep}\n"
+        f"Return a JSON array only: [{{\"id\": 0, \"summary\": \"...\"}}, ...]\n\n{payload}"
     )
-    
-    docs = results.get("documents", [])
-    if not docs:
+    response = generate_ai_response([HumanMessage(content=prompt)])
+    items, _ = extract_items(response.content, "flashcards.translate", requires(id=int, summary=str))
+    return {item["id"]: {"topic": cards[item["id"]]["topic"], "summary": item["summary"]}
+            for item in items if 0 <= item["id"] < len(cards)}
+
+@tracing.traced("flashcards.translate")
+def translate_topics(groups: List[Dict], english: List[List[Dict]], language: str) -> List[List[Dict]]:
+    """
+    Other languages are translated from the canonical cards (much smaller input than the
+    source chunks), in batches of topics that run concurrently. Cards that drop a technical
+    term are retried once with the terms spelled out; untranslatable cards fall back to English.
+    """
+    results = [None] * len(groups)
+    todo = []  # (topic index, card index, english card)
+    for t, (group, cards) in enumerate(zip(groups, english)):
+        cached = flashcard_cache.get_cards(group["hash"], language, FLASHCARD_PROMPT_VERSION)
+        metrics.cache_result("flashcard_translations", cached is not None)
+        if cached is not None:
+            results[t] = cached
+        else:
+            results[t] = list(cards)
+            todo.extend((t, c, card) for c, card in enumerate(cards))
+    if not todo:
+        return results
+
+    print(f"🌐 Translating {len(todo)} flashcards into {language}...")
+    translated = {}
+
+    def run(batch, strict):
+        try:
+            done = _translate_batch([card for _, _, card in batch], language, strict)
+        except Exception as e:
+            print(f"❌ Flashcard translation batch failed ({language}): {e}")
+            return []
+        return [(batch[i][0], batch[i][1], card) for i, card in done.items()]
+
+    pending, strict = todo, False
+    for _ in range(2):
+        batches = [pending[i:i + TRANSLATION_BATCH_SIZE] for i in range(0, len(pending), TRANSLATION_BATCH_SIZE)]
+        english_by_key = {(t, c): card for t, c, card in pending}
+        retry = []
+        for done in _map_pool.map(tracing.bind(lambda b, s=strict: run(b, s)), batches):
+            for t, c, card in done:
+                if missing_terms(english_by_key[(t, c)], card) and not strict:
+                    retry.append((t, c, english_by_key[(t, c)]))
+                translated[(t, c)] = card
+        # Second pass: only cards that lost terms or never came back
+        pending = retry + [(t, c, card) for t, c, card in pending if (t, c) not in translated]
+        strict = True
+        if not pending:
+            break
+
+    # Still losing terms after the strict retry: the English card is better than a wrong one
+    lost = [(t, c) for t, c, card in todo if (t, c) in translated and missing_terms(card, translated[(t, c)])]
+    for key in lost:
+        translated[key] = dict(english[key[0]][key[1]])
+    if lost:
+        print(f"⚠️ {len(lost)} {language} flashcards kept in English (technical terms lost in translation)")
+
+    for t in {t for t, _, _ in todo}:
+        cards = results[t]
+        complete = all((t, c) in translated for c in range(len(cards)))
+        results[t] = [translated.get((t, c), card) for c, card in enumerate(cards)]
+        if complete:
+            flashcard_cache.put_cards(groups[t]["hash"], language, FLASHCARD_PROMPT_VERSION, groups[t]["topic"], results[t])
+    return results
+
+def merge_cards(groups: List[Dict], card_lists: List[List[Dict]]) -> List[Dict]:
+    """
+    Reduce step: topic order is kept, cards repeating an earlier card's topic in the same chapter are
+    dropped (two chapters' "Introduction" cards are both kept). card_lists runs parallel to groups.
+    """
+    merged, seen = [], set()
+    for group, cards in zip(groups, card_lists):
+        for card in cards:
+            key = (group["source"], card["topic"].strip().lower())
+            if key not in seen:
+                seen.add(key)
+                merged.append(card)
+    return merged
+
+def generate_flashcards(session_id: str, language: str = "english"):
+    """
+    Generates topic-wise revision summaries from the ingested materials of a session.
+    Every topic is covered: English cards are generated per topic in parallel and merged, and a topic is
+    only regenerated when its chunks change (e.g. after a new upload, just the new chapter's topics).
+    Other languages are translated from the English cards.
+    """
+    return _build_flashcards(session_id, language.lower())[0]
+
+def _flashcards_stamp(session_id: str) -> tuple:
+    return (corpus_store.get_version(session_id), FLASHCARD_PROMPT_VERSION)
+
+def flashcards_etag(session_id: str, language: str = "english") -> str:
+    """ETag of the complete card set for the current corpus version (no cards are read)."""
+    return response_cache.make_etag("flashcards", session_id, language.lower(), _flashcards_stamp(session_id))
+
+def get_flashcards_payload(session_id: str, language: str = "english") -> response_cache.Payload:
+    """
+    Serialized flashcards for the API, served from the in-memory response cache while the
+    classroom's corpus version is unchanged. Only complete sets (every topic cached) are kept
+    and carry the version ETag; partial sets get a body-derived one.
+    """
+    language = language.lower()
+    stamp = _flashcards_stamp(session_id)
+    payload = _response_cache.get((session_id, language), stamp)
+    if payload is not None:
+        return payload
+
+    cards, complete = _build_flashcards(session_id, language)
+    body = json.dumps(cards, ensure_ascii=False).encode("utf-8")
+    if cards and complete:
+        payload = response_cache.Payload(body, flashcards_etag(session_id, language))
+        _response_cache.put((session_id, language), stamp, payload)
+        return payload
+    return response_cache.Payload(body, response_cache.make_etag("flashcards", hashlib.sha1(body).hexdigest()))
+
+def _build_flashcards(session_id: str, language: str):
+    """Returns (cards, complete): complete when every topic's cards for this language are in the cache."""
+    print(f"🔍 Retrieving material for {language} flashcards in session: {session_id}")
+    groups = get_topic_groups(session_id)
+    if not groups:
         print(f"⚠️ No documents found for session {session_id}")
-        return []
-
-    # Combine docs (Increase limit to cover more material)
-    full_context = "\n\n".join(docs[:40]) 
-
-    # 3. Generate with AI
-    script_note = ""
-    if language.lower() == "hindi":
-        script_note = "STRICT: Use Devanagari script (हिन्दी) for explanations."
-    elif language.lower() == "telugu":
-        script_note = "STRICT: Use Telugu script (తెలుగు) ONLY. DO NOT USE ENGLISH ALPHABETS FOR TELUGU SENTENCES."
-        
-    lang_instruction = f"Output language: {language}. {script_note} Remember: technical terms in English, explanations in native {language} script."
-    prompt = f"Extract topics and generate revision flashcards from this text:\n\n{full_context}\n\n{lang_instruction}"
-    
-    messages = [
-        SystemMessage(content=FLASHCARD_SYSTEM_PROMPT),
-        HumanMessage(content=prompt)
-    ]
-
-    print(f"🪄 Generating {language} flashcards via AI for session {session_id}...")
-    response = generate_ai_response(messages)
-    
-    try:
-        # Clean response if AI adds markdown
-        clean_content = response.content.replace('```json', '').replace('```', '').strip()
-        data = json.loads(clean_content)
-        
-        # Cache for future use
-        os.makedirs(os.path.dirname(flashcard_cache_path), exist_ok=True)
-        with open(flashcard_cache_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-            
-        return data.get("flashcards", [])
-    except Exception as e:
-        print(f"❌ Failed to parse {language} flashcard JSON: {e}")
-        print(f"RAW CONTENT: {response.content}")
-        return []
+        return [], False
+
+    cached = sum(1 for g in groups if flashcard_cache.get_cards(g["hash"], CANONICAL_LANGUAGE, FLASHCARD_PROMPT_VERSION) is not None)
+    if cached < len(groups):
+        print(f"🪄 Generating flashcards for {len(groups) - cached}/{len(groups)} topics in session {session_id}...")
+
+    def map_topic(group):
+        try:
+            return generate_topic_cards(group)
+        except Exception as e:
+            print(f"❌ Flashcards failed for topic '{group['topic']}': {e}")
+            return []
+
+    english = list(_map_pool.map(tracing.bind(map_topic), groups))
+    cards = english if language == CANONICAL_LANGUAGE else translate_topics(groups, english, language)
+    complete = all(flashcard_cache.get_cards(g["hash"], language, FLASHCARD_PROMPT_VERSION) is not None for g in groups)
+    return merge_cards(groups, cards), complete
+
+def reap_stale_flashcards() -> int:
+    """Drops cached cards of topics no classroom contains any more (chapter replaced or removed)."""
+    db = Chroma(persist_directory=CHROMA_PATH, collection_name="hackathon_collection")
+    metadatas = db.get(include=["metadatas"]).get("metadatas") or []
+    sessions = {m.get("session_id") for m in metadatas if m and m.get("session_id")}
+    if not sessions:
+        return 0 # Empty or unreadable index: nothing to compare against
+    live = {group["hash"] for session_id in sessions for group in get_topic_groups(session_id)}
+    return flashcard_cache.reap(live, FLASHCARD_PROMPT_VERSION)
+
+def prewarm_flashcards(session_id: str, languages: List[str] = None):
+    """Background stage after ingestion: canonical cards first, then every configured language."""
+    for language in [CANONICAL_LANGUAGE] + [l for l in (languages or FLASHCARD_LANGUAGES) if l != CANONICAL_LANGUAGE]:
+        try:
+            generate_flashcards(session_id, language)
+        except Exception as e:
+            print(f"⚠️ Flashcard pre-warm failed for {session_id} ({language}): {e}")
 
 if __name__ == "__main__":
     # Test logic
@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { X, Clock, CheckCircle, AlertCircle, ArrowRight, Eye, Lightbulb } from 'lucide-react';
 import { motion, AnimatePresence } from 'framer-motion';
 import { toast } from 'sonner';
+import { getStudentId, withStudent } from '../student';
 
 interface AssessmentModalProps {
     isOpen: boolean;
@@ -37,6 +38,8 @@ export const AssessmentModal: React.FC<AssessmentModalProps> = ({
 }) => {
     const [loading, setLoading] = useState(false);
     const [questions, setQuestions] = useState<Question[]>([]);
+    const [streaming, setStreaming] = useState(false);
+    const [expectedCount, setExpectedCount] = useState(0);
     const [currentIndex, setCurrentIndex] = useState(0);
     const [userAnswers, setUserAnswers] = useState<Record<string, string>>({});
     const [timer, setTimer] = useState(600); // 10 minutes
@@ -56,6 +59,8 @@ export const AssessmentModal: React.FC<AssessmentModalProps> = ({
         } else {
             // Reset state on close
             setQuestions([]);
+            setStreaming(false);
+            setExpectedCount(0);
             setCurrentIndex(0);
             setUserAnswers({});
             setResult(null);
@@ -90,7 +95,7 @@ export const AssessmentModal: React.FC<AssessmentModalProps> = ({
 
     const loadXP = async () => {
         try {
-            const res = await fetch(`http://localhost:8000/api/progress/${sessionId}`);
+            const res = await fetch(withStudent(`http://localhost:8000/api/progress/${sessionId}`));
             const data = await res.json();
             setUserXP(data.xp || 0);
         } catch (e) {
@@ -118,7 +123,7 @@ export const AssessmentModal: React.FC<AssessmentModalProps> = ({
                 const res = await fetch('http://localhost:8000/api/spend_xp', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ session_id: sessionId, amount: cost })
+                    body: JSON.stringify({ session_id: sessionId, amount: cost, student_id: getStudentId() })
                 });
                 const data = await res.json();
                 if (!data.success) {
@@ -138,24 +143,50 @@ export const AssessmentModal: React.FC<AssessmentModalProps> = ({
 
     const loadAssessment = async () => {
         setLoading(true);
+        setStreaming(true);
         try {
-            const res = await fetch('http://localhost:8000/api/assessment/generate', {
+            // NDJSON stream: the quest starts as soon as the first question arrives
+            const res = await fetch('http://localhost:8000/api/assessment/generate/stream', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ session_id: sessionId, level })
+                body: JSON.stringify({ session_id: sessionId, level, student_id: getStudentId() })
             });
-            const data = await res.json();
-
-            if (data.questions) {
-                setQuestions(data.questions);
+            if (!res.body) throw new Error('No response body');
+
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop() || '';
+                for (const line of lines.filter(l => l.trim())) {
+                    const event = JSON.parse(line);
+                    if (event.type === 'meta') {
+                        setExpectedCount(event.count);
+                    } else if (event.type === 'question') {
+                        setQuestions(prev => [...prev, event.question]);
+                        setLoading(false);
+                    } else if (event.type === 'done') {
+                        setExpectedCount(event.count);
+                    } else if (event.type === 'error') {
+                        toast.error(event.detail || "Failed to load assessment.");
+                    }
+                }
             }
         } catch (error) {
             toast.error("Failed to load assessment.");
         } finally {
+            setStreaming(false);
             setLoading(false);
         }
     };
 
+    // While streaming, count the questions that are still on their way
+    const totalQuestions = streaming ? Math.max(expectedCount, questions.length) : questions.length;
+
     const handleAnswerInitial = (answer: string) => {
         if (result || feedback) return; // Prevent multiple clicks
 
@@ -182,7 +213,7 @@ export const AssessmentModal: React.FC<AssessmentModalProps> = ({
         // Auto-transition
         setTimeout(() => {
             setFeedback(null);
-            if (currentIndex < questions.length - 1) {
+            if (currentIndex < totalQuestions - 1) {
                 setCurrentIndex(prev => prev + 1);
             } else {
                 submitAssessment();
@@ -212,7 +243,8 @@ export const AssessmentModal: React.FC<AssessmentModalProps> = ({
                     level,
                     score,
                     max_score: questions.length,
-                    mistakes: wrongQuestions
+                    mistakes: wrongQuestions,
+                    student_id: getStudentId()
                 })
             });
             const data = await res.json();
@@ -243,7 +275,7 @@ export const AssessmentModal: React.FC<AssessmentModalProps> = ({
                 <div className="p-6 border-b border-border flex items-center justify-between">
                     <div>
                         <h2 className="text-xl font-bold">Level {level} Assessment</h2>
-                        {!result && <p className="text-sm text-muted-foreground">Question {currentIndex + 1} of {questions.length}</p>}
+                        {!result && <p className="text-sm text-muted-foreground">Question {currentIndex + 1} of {totalQuestions}</p>}
                     </div>
                     <div className="flex items-center gap-4">
                         {!result && (
@@ -352,7 +384,13 @@ export const AssessmentModal: React.FC<AssessmentModalProps> = ({
                         </div>
                     ) : (
                         <div className="max-w-2xl mx-auto">
-                            {questions.length > 0 && (
+                            {!questions[currentIndex] && streaming && (
+                                <div className="flex flex-col items-center justify-center h-full gap-4">
+                                    <div className="w-8 h-8 border-4 border-primary border-t-transparent rounded-full animate-spin" />
+                                    <p className="text-muted-foreground">Generating the next question...</p>
+                                </div>
+                            )}
+                            {questions[currentIndex] && (
                                 <AnimatePresence mode='wait'>
                                     <motion.div
                                         key={questions[currentIndex].id}
@@ -467,7 +505,7 @@ export const AssessmentModal: React.FC<AssessmentModalProps> = ({
                             Previous
                         </button>
 
-                        {currentIndex === questions.length - 1 ? (
+                        {currentIndex === totalQuestions - 1 ? (
                             <button
                                 onClick={submitAssessment}
                                 className="px-8 py-3 bg-primary text-primary-foreground rounded-xl font-bold shadow-lg hover:shadow-primary/25 transition-all flex items-center gap-2"
@@ -476,7 +514,7 @@ export const AssessmentModal: React.FC<AssessmentModalProps> = ({
                             </button>
                         ) : (
                             <button
-                                onClick={() => setCurrentIndex(prev => Math.min(questions.length - 1, prev + 1))}
+                                onClick={() => setCurrentIndex(prev => Math.min(totalQuestions - 1, prev + 1))}
                                 disabled={!userAnswers[questions[currentIndex]?.id]}
                                 className="px-6 py-3 bg-foreground text-background rounded-xl font-bold disabled:opacity-50 flex items-center gap-2"
                             >
@@ -5,6 +5,7 @@ import { AssessmentModal } from './AssessmentModal';
 import { RemedialModal } from './RemedialModal';
 import { MistakesView } from './MistakesView';
 import { TeacherAssessmentPreview } from './TeacherAssessmentPreview';
+import { withStudent } from '../student';
 
 interface AssessmentPathViewProps {
     userRole: 'teacher' | 'student' | null;
@@ -17,6 +18,7 @@ interface Progress {
     next_chapter_title?: string;
     cooldown_remaining?: number;
     remedial_plan?: any;
+    remedial_status?: 'pending' | 'ready';
     history: any[];
 }
 
@@ -47,9 +49,16 @@ export const AssessmentPathView: React.FC<AssessmentPathViewProps> = ({ userRole
         }
     }, [selectedClassroom]);
 
+    // Remedial plans are built in the background after a failed attempt: poll until ready
+    useEffect(() => {
+        if (progress?.remedial_status !== 'pending') return;
+        const timeout = setTimeout(fetchProgress, 3000);
+        return () => clearTimeout(timeout);
+    }, [progress]);
+
     const fetchProgress = () => {
         if (!selectedClassroom) return;
-        fetch(`http://localhost:8000/api/progress/${selectedClassroom}`)
+        fetch(withStudent(`http://localhost:8000/api/progress/${selectedClassroom}`))
             .then(res => res.json())
             .then(data => {
                 setProgress(data);
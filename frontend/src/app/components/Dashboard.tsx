@@ -14,6 +14,7 @@ import { Topic } from '../App';
 import { ActivityGraph } from './ActivityGraph';
 import { useActivityTracker } from '../hooks/useActivityTracker';
 import { QuickUploadModal } from './QuickUploadModal';
+import { withStudent } from '../student';
 
 interface DashboardProps {
     topics: Topic[];
@@ -62,7 +63,7 @@ export const Dashboard: React.FC<DashboardProps> = ({
             // For now, checking the first enrolled topic as a demo
             const checkStatus = async () => {
                 try {
-                    const response = await fetch(`http://localhost:8000/api/progress/${topics[0].id}`);
+                    const response = await fetch(withStudent(`http://localhost:8000/api/progress/${topics[0].id}`));
                     const data = await response.json();
                     if (data.status === 'lagging') {
                         setAlertMessage(data.deadline_message);
@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { ArrowLeft, ChevronRight, BrainCircuit, Sparkles, Loader2, Trophy } from 'lucide-react';
 import { motion, AnimatePresence } from 'framer-motion';
 import { toast } from 'sonner';
+import { getStudentId } from '../student';
 
 interface Flashcard {
     topic: string;
@@ -45,7 +46,7 @@ export const FlashcardsView: React.FC<FlashcardsViewProps> = ({ sessionId, langu
                 await fetch('http://localhost:8000/api/add_xp', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ session_id: sessionId, amount: 20 })
+                    body: JSON.stringify({ session_id: sessionId, amount: 20, student_id: getStudentId() })
                 });
                 toast.success("+20 XP for learning!", {
                     icon: <Trophy size={16} className="text-yellow-500" />,
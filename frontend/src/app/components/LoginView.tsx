@@ -1,6 +1,7 @@
 import React, { useState } from 'react';
 import { BookOpen, GraduationCap, ArrowLeft, Lock, User, AlertCircle } from 'lucide-react';
 import { toast } from 'sonner';
+import { setStudentId } from '../student';
 
 interface LoginViewProps {
     onLogin: (role: 'teacher' | 'student') => void;
@@ -35,6 +36,7 @@ export const LoginView: React.FC<LoginViewProps> = ({ onLogin }) => {
 
             if (isValid) {
                 toast.success('Login successful!');
+                if (selectedRole === 'student') setStudentId(normalizedUsername);
                 onLogin(selectedRole!);
             } else {
                 toast.error('Invalid credentials. Hint: use role name as username and "password123"');
@@ -19,6 +19,25 @@ import { toast } from 'sonner';
 
 import { useActivityTracker } from '../hooks/useActivityTracker';
 
+interface OutlineEntry {
+    title: string;
+    section_number: string;
+    page: number;
+}
+
+interface PageText {
+    page: number;
+    text: string;
+}
+
+const PAGES_PER_FETCH = 5;
+
+// http://localhost:8000/uploads/{session}/{file}.pdf -> http://localhost:8000/api/materials/{session}/{file}.pdf
+const materialApiBase = (url: string): string | null => {
+    const match = url?.match(/^(.*)\/uploads\/([^/]+)\/([^/]+)$/);
+    return match ? `${match[1]}/api/materials/${match[2]}/${match[3]}` : null;
+};
+
 interface MaterialViewProps {
     topic: any;
     onBack: () => void;
@@ -53,6 +72,51 @@ export const MaterialView: React.FC<MaterialViewProps> = ({ topic, onBack, userR
     const [assessmentScore, setAssessmentScore] = useState<number | null>(null);
     const [selectedStudentForComment, setSelectedStudentForComment] = useState<any | null>(null);
     const [commentText, setCommentText] = useState('');
+    const [outline, setOutline] = useState<{ page_count: number; outline: OutlineEntry[] } | null>(null);
+    const [pages, setPages] = useState<PageText[]>([]);
+    const [loadingPages, setLoadingPages] = useState(false);
+    const [showFullPdf, setShowFullPdf] = useState(false);
+
+    // Reader: outline + first pages of text (a few KB) instead of the whole PDF
+    const materialBase = activeMaterial ? materialApiBase(activeMaterial.url) : null;
+
+    useEffect(() => {
+        setOutline(null);
+        setPages([]);
+        setShowFullPdf(false);
+        if (view !== 'reading' || !materialBase) return;
+
+        let cancelled = false;
+        fetch(`${materialBase}/outline`)
+            .then(res => (res.ok ? res.json() : null))
+            .then(data => { if (!cancelled && data) setOutline(data); })
+            .catch(err => console.error('Failed to load outline', err));
+        loadPages(1, () => cancelled);
+        return () => { cancelled = true; };
+    }, [view, materialBase]);
+
+    const loadPages = async (start: number, isCancelled: () => boolean = () => false) => {
+        if (!materialBase) return;
+        setLoadingPages(true);
+        try {
+            const res = await fetch(`${materialBase}/pages?start=${start}&end=${start + PAGES_PER_FETCH - 1}`);
+            if (res.ok && !isCancelled()) {
+                const data = await res.json();
+                setPages(prev => [...prev.filter(p => p.page < start), ...data.pages]);
+            }
+        } catch (err) {
+            console.error('Failed to load pages', err);
+        } finally {
+            if (!isCancelled()) setLoadingPages(false);
+        }
+    };
+
+    const jumpToPage = async (page: number) => {
+        if (!pages.some(p => p.page === page)) {
+            await loadPages(Math.max(1, page));
+        }
+        document.getElementById(`material-page-${page}`)?.scrollIntoView({ behavior: 'smooth' });
+    };
 
     const isTeacher = userRole === 'teacher';
 
@@ -481,12 +545,63 @@ export const MaterialView: React.FC<MaterialViewProps> = ({ topic, onBack, userR
                                     <button className="p-2 hover:bg-background rounded-lg text-muted-foreground"><MoreVertical size={16} /></button>
                                 </div>
                             </div>
-                            <div className="flex-1 w-full h-full bg-muted/30">
-                                <iframe
-                                    src={activeMaterial.url}
-                                    className="w-full h-full"
-                                    title="PDF Viewer"
-                                />
+                            <div className="flex-1 w-full h-full bg-muted/30 flex overflow-hidden">
+                                {showFullPdf || !materialBase ? (
+                                    <iframe
+                                        src={materialBase ? `${materialBase}/pdf` : activeMaterial.url}
+                                        className="w-full h-full"
+                                        title="PDF Viewer"
+                                    />
+                                ) : (
+                                    <>
+                                        <aside className="w-64 shrink-0 border-r border-border overflow-y-auto p-4 space-y-1">
+                                            <p className="text-[10px] font-black uppercase tracking-widest text-muted-foreground mb-2">
+                                                Outline{outline ? ` · ${outline.page_count} pages` : ''}
+                                            </p>
+                                            {outline?.outline.map((entry, idx) => (
+                                                <button
+                                                    key={idx}
+                                                    onClick={() => jumpToPage(entry.page)}
+                                                    className="w-full text-left text-sm px-2 py-1.5 rounded-lg hover:bg-background flex justify-between gap-2"
+                                                >
+                                                    <span className="truncate">{entry.title}</span>
+                                                    <span className="text-xs text-muted-foreground shrink-0">p.{entry.page}</span>
+                                                </button>
+                                            ))}
+                                            <button
+                                                onClick={() => setShowFullPdf(true)}
+                                                className="w-full mt-4 text-sm font-bold text-primary hover:underline text-left px-2"
+                                            >
+                                                Open full PDF
+                                            </button>
+                                        </aside>
+                                        <div className="flex-1 overflow-y-auto p-6 space-y-6">
+                                            {pages.map(page => (
+                                                <div key={page.page} id={`material-page-${page.page}`} className="flex gap-4 bg-card border border-border rounded-xl p-4">
+                                                    <img
+                                                        src={`${materialBase}/thumbnails/${page.page}`}
+                                                        alt={`Page ${page.page}`}
+                                                        loading="lazy"
+                                                        className="w-28 shrink-0 self-start rounded border border-border"
+                                                    />
+                                                    <div className="min-w-0">
+                                                        <span className="text-[10px] font-black uppercase tracking-widest text-muted-foreground">Page {page.page}</span>
+                                                        <p className="text-sm whitespace-pre-wrap leading-relaxed mt-1">{page.text}</p>
+                                                    </div>
+                                                </div>
+                                            ))}
+                                            {loadingPages && <p className="text-sm text-muted-foreground">Loading pages...</p>}
+                                            {!loadingPages && outline && pages.length > 0 && pages[pages.length - 1].page < outline.page_count && (
+                                                <button
+                                                    onClick={() => loadPages(pages[pages.length - 1].page + 1)}
+                                                    className="w-full py-3 rounded-xl border border-border text-sm font-bold hover:bg-secondary"
+                                                >
+                                                    Load more pages
+                                                </button>
+                                            )}
+                                        </div>
+                                    </>
+                                )}
                             </div>
                         </div>
                     </div>
@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { motion, AnimatePresence } from 'framer-motion';
 import { AlertCircle, CheckCircle, ChevronRight, MessageSquare, Send, Trash2 } from 'lucide-react';
 import { toast } from 'sonner';
+import { getStudentId, withStudent } from '../student';
 
 interface Mistake {
     question: string;
@@ -20,6 +21,7 @@ interface MistakesViewProps {
 
 export const MistakesView: React.FC<MistakesViewProps> = ({ sessionId, onBack }) => {
     const [mistakes, setMistakes] = useState<Mistake[]>([]);
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
     const [loading, setLoading] = useState(true);
     const [editingComment, setEditingComment] = useState<{ question: string, text: string } | null>(null);
 
@@ -27,12 +29,14 @@ export const MistakesView: React.FC<MistakesViewProps> = ({ sessionId, onBack })
         fetchMistakes();
     }, [sessionId]);
 
-    const fetchMistakes = async () => {
-        setLoading(true);
+    const fetchMistakes = async (cursor: string | null = null) => {
+        if (!cursor) setLoading(true);
         try {
-            const res = await fetch(`http://localhost:8000/api/mistakes/${sessionId}`);
+            const url = `http://localhost:8000/api/mistakes/${sessionId}?limit=20${cursor ? `&cursor=${encodeURIComponent(cursor)}` : ''}`;
+            const res = await fetch(withStudent(url));
             const data = await res.json();
-            setMistakes(data);
+            setMistakes(prev => cursor ? [...prev, ...data.items] : data.items);
+            setNextCursor(data.next_cursor);
         } catch (error) {
             console.error("Failed to fetch mistakes", error);
             toast.error("Failed to load mistakes.");
@@ -50,7 +54,8 @@ export const MistakesView: React.FC<MistakesViewProps> = ({ sessionId, onBack })
                 body: JSON.stringify({
                     session_id: sessionId,
                     question: question,
-                    comment: editingComment.text
+                    comment: editingComment.text,
+                    student_id: getStudentId()
                 })
             });
             if (res.ok) {
@@ -173,6 +178,14 @@ export const MistakesView: React.FC<MistakesViewProps> = ({ sessionId, onBack })
                             </div>
                         </motion.div>
                     ))}
+                    {nextCursor && (
+                        <button
+                            onClick={() => fetchMistakes(nextCursor)}
+                            className="w-full py-3 rounded-2xl border border-dashed border-border text-sm font-bold text-muted-foreground hover:border-primary/50 hover:text-foreground transition-colors"
+                        >
+                            Load more mistakes
+                        </button>
+                    )}
                 </div>
             )}
         </div>
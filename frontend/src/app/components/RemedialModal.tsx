@@ -50,6 +50,12 @@ export const RemedialModal: React.FC<RemedialModalProps> = ({ isOpen, onClose, p
                     </button>
                 </div>
 
+                {plan.status === 'pending' ? (
+                    <div className="p-8 flex flex-col items-center justify-center gap-4 text-center">
+                        <div className="w-10 h-10 border-4 border-red-500 border-t-transparent rounded-full animate-spin" />
+                        <p className="text-muted-foreground">Analyzing your mistakes... your personalised plan will appear here in a moment.</p>
+                    </div>
+                ) : (
                 <div className="p-8 space-y-8">
                     {/* DIAGNOSIS */}
                     <div className="space-y-2">
@@ -124,6 +130,7 @@ export const RemedialModal: React.FC<RemedialModalProps> = ({ isOpen, onClose, p
                         </div>
                     )}
                 </div>
+                )}
             </motion.div>
         </div>
     );
@@ -15,6 +15,7 @@ import { Topic } from '../App';
 import { ActivityGraph } from './ActivityGraph';
 import { useActivityTracker } from '../hooks/useActivityTracker';
 import { TeacherAnalyticsDashboard } from './TeacherAnalyticsDashboard';
+import { withStudent } from '../student';
 
 interface StudentProgressViewProps {
     onCreateClass: (name: string, batch?: string, grade?: string) => string;
@@ -39,9 +40,10 @@ export const StudentProgressView: React.FC<StudentProgressViewProps> = ({ onCrea
     React.useEffect(() => {
         if (userRole === 'student') {
             setLoadingMistakes(true);
-            fetch('http://localhost:8000/api/mistakes/all')
+            // Only the latest few are shown here; the full list is paginated in MistakesView
+            fetch(withStudent('http://localhost:8000/api/mistakes/all?limit=5'))
                 .then(res => res.json())
-                .then(data => setMistakes(data))
+                .then(data => setMistakes(data.items))
                 .catch(err => console.error("Failed to load mistakes", err))
                 .finally(() => setLoadingMistakes(false));
         }
@@ -11,6 +11,7 @@ interface AnalyticsData {
     level_distribution: Record<string, number>;
     stuck_percent: number;
     average_attempts: Record<string, number>;
+    time_at_level?: Record<string, number>;
     common_mistakes: { concept: string; frequency: number }[];
 }
 
@@ -36,7 +37,7 @@ export const TeacherAnalyticsDashboard: React.FC<TeacherAnalyticsDashboardProps>
     if (loading) return <div className="p-8 text-center animate-pulse">Loading class insights...</div>;
     if (!stats) return <div className="p-8 text-center">No data available</div>;
 
-    const maxLevelCount = Math.max(...Object.values(stats.level_distribution));
+    const maxLevelCount = Math.max(...Object.values(stats.level_distribution), 1);
 
     return (
         <div className="space-y-8 animate-in fade-in duration-500">
@@ -66,7 +67,9 @@ export const TeacherAnalyticsDashboard: React.FC<TeacherAnalyticsDashboardProps>
                         <TrendingUp className="text-green-500" size={20} />
                     </div>
                     <p className="text-4xl font-black">{stats.average_attempts['level_2'] || 0}</p>
-                    <p className="text-xs text-muted-foreground mt-2 font-bold uppercase tracking-wider">Attempts per Level</p>
+                    <p className="text-xs text-muted-foreground mt-2 font-bold uppercase tracking-wider">
+                        Attempts per Level · L1 {stats.average_attempts['level_1'] || 0} · L3 {stats.average_attempts['level_3'] || 0}
+                    </p>
                 </div>
             </div>
 
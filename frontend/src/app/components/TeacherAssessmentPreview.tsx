@@ -37,9 +37,25 @@ export const TeacherAssessmentPreview: React.FC<TeacherAssessmentPreviewProps> =
     useEffect(() => {
         const fetchAssessments = async () => {
             try {
-                const res = await fetch(`http://localhost:8000/api/teacher/assessments/${sessionId}`);
-                const data = await res.json();
-                setChapters(data.chapters || []);
+                // Chapters arrive as NDJSON lines as soon as each one is generated. Once the whole preview
+                // is built the server sends it in one piece with an ETag, so repeat loads revalidate (304)
+                const res = await fetch(`http://localhost:8000/api/teacher/assessments/${sessionId}?stream=true`);
+                if (!res.body) throw new Error("No response body");
+                const reader = res.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    const lines = buffer.split('\n');
+                    buffer = lines.pop() || '';
+                    const ready: Chapter[] = lines.filter(l => l.trim()).map(l => JSON.parse(l));
+                    if (ready.length) {
+                        setChapters(prev => [...prev, ...ready].sort((a, b) => a.chapter_index - b.chapter_index));
+                        setLoading(false);
+                    }
+                }
             } catch (e) {
                 toast.error("Failed to load assessments");
             } finally {
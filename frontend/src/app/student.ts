@@ -0,0 +1,14 @@
+// The logged-in student's id, sent as student_id with every progress, assessment and mistakes request
+// so each student gets their own XP, levels and mistakes in a classroom.
+const STORAGE_KEY = 'cote_student_id';
+const DEFAULT_STUDENT = 'default';
+
+export const setStudentId = (studentId: string) => {
+    localStorage.setItem(STORAGE_KEY, studentId);
+};
+
+export const getStudentId = (): string => localStorage.getItem(STORAGE_KEY) || DEFAULT_STUDENT;
+
+// Appends student_id to a URL's query string
+export const withStudent = (url: string): string =>
+    `${url}${url.includes('?') ? '&' : '?'}student_id=${encodeURIComponent(getStudentId())}`;
@@ -0,0 +1,87 @@
+import os
+import re
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+# Conditional GET and byte-range helpers for endpoints that serve versioned content.
+
+CHUNK_BYTES = 256 * 1024
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True when the client's If-None-Match already names this version."""
+    header = request.headers.get("if-none-match", "")
+    return any(tag.strip() in (etag, "*", "W/" + etag) for tag in header.split(","))
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"})
+
+def payload_response(request: Request, payload, cache_control: str = "private, no-cache",
+                     media_type: str = "application/json") -> Response:
+    """
+    A response_cache.Payload (JSON unless media_type says otherwise): 304 when the client's ETag is
+    current, otherwise the body in the best encoding the client accepts (precomputed for cached payloads).
+    """
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if payload.etag:
+        headers["ETag"] = payload.etag
+        if etag_matches(request, payload.etag):
+            return Response(status_code=304, headers=headers)
+    body, encoding = payload.encoded(request.headers.get("accept-encoding", ""))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+def _parse_range(header: Optional[str], size: int):
+    """(start, end) inclusive for a single satisfiable byte range, None for no/unsupported range, False if unsatisfiable."""
+    match = _RANGE.match((header or "").strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None # Absent, multi-range or malformed: serve the whole file
+    if not match.group(1):
+        length = int(match.group(2))
+        return (max(size - length, 0), size - 1) if length else False
+    start = int(match.group(1))
+    end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    return (start, end) if start <= end and start < size else False
+
+def _iter_file(path: str, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(CHUNK_BYTES, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+def file_response(request: Request, path: str, etag: str, media_type: str,
+                  cache_control: str = "private, max-age=0, must-revalidate") -> Response:
+    """
+    Serves a file with an ETag (304 when unchanged) and single byte-range support (206),
+    so PDF viewers can fetch the first pages without downloading the whole file.
+    """
+    if etag_matches(request, etag):
+        return not_modified(etag, cache_control)
+
+    size = os.path.getsize(path)
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+    byte_range = _parse_range(request.headers.get("range"), size)
+    # If-Range: a range is only valid against the version the client already has
+    if_range = request.headers.get("if-range")
+    if byte_range and if_range and if_range != etag:
+        byte_range = None
+
+    if byte_range is False:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(_iter_file(path, 0, size), media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(_iter_file(path, start, end - start + 1), status_code=206,
+                             media_type=media_type, headers=headers)
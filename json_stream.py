@@ -0,0 +1,200 @@
+import re
+import json
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Shared, tolerant parsing of LLM JSON output. Fences, preambles and trailing chatter are
+# ignored, and when the output is cut off, every complete array item is still kept.
+#
+# Outcomes counted per call site:
+#   ok        strict json.loads worked
+#   repaired  parsed after stripping fences / surrounding text, nothing lost
+#   salvaged  output was broken or truncated, complete items were recovered
+#   failed    nothing usable
+# plus dropped_items: items that parsed but failed the call site's schema.
+
+Validator = Callable[[object], bool]
+
+_stats = defaultdict(lambda: {"ok": 0, "repaired": 0, "salvaged": 0, "failed": 0, "dropped_items": 0})
+_stats_lock = threading.Lock()
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)```", re.S)
+_OBJECT_ARRAY = re.compile(r"\[\s*\{")
+_WHITESPACE = re.compile(r"\s*")
+_MISSING = object()
+
+def _record(site: str, outcome: str, dropped: int = 0):
+    with _stats_lock:
+        _stats[site][outcome] += 1
+        _stats[site]["dropped_items"] += dropped
+
+def get_stats() -> Dict[str, Dict[str, int]]:
+    """Parse outcomes per call site since startup."""
+    with _stats_lock:
+        return {site: dict(counts) for site, counts in _stats.items()}
+
+def requires(**fields: type) -> Validator:
+    """Schema check for dict items: requires(question=str, options=list)."""
+    def check(item) -> bool:
+        return isinstance(item, dict) and all(isinstance(item.get(k), t) for k, t in fields.items())
+    return check
+
+def _decode(text: str, objects: bool = False):
+    """
+    Returns (value, outcome) for a complete JSON value somewhere in text, or (_MISSING, None).
+    With objects, only arrays of objects are picked out of surrounding text (not "[3]" in a preamble).
+    """
+    text = (text or "").strip()
+    try:
+        return json.loads(text), "ok"
+    except json.JSONDecodeError:
+        pass
+
+    fence = _FENCE.search(text)
+    if fence:
+        try:
+            return json.loads(fence.group(1).strip()), "repaired"
+        except json.JSONDecodeError:
+            pass
+
+    # First JSON value in the text, ignoring preamble and trailing chatter
+    decoder = json.JSONDecoder()
+    array = _OBJECT_ARRAY.search(text) if objects else None
+    array_start = array.start() if array else (-1 if objects else text.find("["))
+    starts = [i for i in (array_start, text.find("{")) if i >= 0]
+    for start in sorted(starts):
+        try:
+            return decoder.raw_decode(text, start)[0], "repaired"
+        except json.JSONDecodeError:
+            continue
+    return _MISSING, None
+
+def extract_object(text: str, site: str, validate: Optional[Validator] = None) -> Optional[dict]:
+    """One JSON object from an LLM response, or None."""
+    value, outcome = _decode(text)
+    if not isinstance(value, dict):
+        _record(site, "failed")
+        return None
+    if validate and not validate(value):
+        _record(site, "failed", dropped=1)
+        return None
+    _record(site, outcome)
+    return value
+
+def extract_items(text: str, site: str, validate: Optional[Validator] = None,
+                  key: Optional[str] = None, objects: bool = True) -> Tuple[List, bool]:
+    """
+    Items of the JSON array in an LLM response (or of value[key] when the response is an object).
+    Arrays whose first item isn't an object are skipped unless objects=False.
+    Returns (valid items, complete) where complete is False when items had to be salvaged.
+    """
+    value, outcome = _decode(text, objects)
+    if isinstance(value, dict) and key:
+        value = value.get(key)
+    if isinstance(value, list):
+        items = value
+    else:
+        stream = JsonArrayStream(objects=objects)
+        stream.feed(text or "")
+        items = stream.items
+        outcome = "salvaged" if items else "failed"
+
+    valid = [i for i in items if validate is None or validate(i)]
+    _record(site, outcome, dropped=len(items) - len(valid))
+    return valid, outcome in ("ok", "repaired")
+
+class JsonArrayStream:
+    """
+    Incremental parser for an LLM response that contains a JSON array.
+    feed() takes text as it streams in and returns each top-level item (object, array or string)
+    as soon as it is complete. Anything before the first '[' that opens an object (e.g. a ```json
+    fence, or "[3]" in a preamble) is skipped, so for {"key": [...]} responses the items of the
+    first such array are returned. With objects=False the array may hold any items.
+    With a site, close() records the outcome in the shared counters.
+    """
+
+    def __init__(self, site: Optional[str] = None, validate: Optional[Validator] = None, objects: bool = True):
+        self.site = site
+        self.validate = validate
+        self.objects = objects
+        self.buffer = ""
+        self.pos = 0            # Next character to scan
+        self.started = False    # Seen the opening '['
+        self.closed = False     # Seen the matching ']'
+        self.depth = 0          # Nesting depth below the array
+        self.in_string = False
+        self.escape = False
+        self.item_start = None  # Buffer offset of the current top-level item
+        self.items = []
+        self.dropped = 0
+
+    def feed(self, text: str) -> List:
+        if self.closed:
+            return []
+        self.buffer += text
+        completed = []
+        while self.pos < len(self.buffer) and not self.closed:
+            ch = self.buffer[self.pos]
+            if not self.started:
+                if ch == "[":
+                    if self.objects:
+                        match = _WHITESPACE.match(self.buffer, self.pos + 1)
+                        if match.end() == len(self.buffer):
+                            break  # Wait for the first item to tell what this array holds
+                        self.started = self.buffer[match.end()] == "{"
+                    else:
+                        self.started = True
+            elif self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.depth == 0:
+                        self._emit(self.pos, completed)
+            elif ch == '"':
+                self.in_string = True
+                if self.depth == 0:
+                    self.item_start = self.pos
+            elif ch in "{[":
+                if self.depth == 0:
+                    self.item_start = self.pos
+                self.depth += 1
+            elif ch in "}]":
+                if self.depth == 0:
+                    self.closed = ch == "]"
+                else:
+                    self.depth -= 1
+                    if self.depth == 0:
+                        self._emit(self.pos, completed)
+            self.pos += 1
+
+        # Drop text that can no longer be part of an item
+        cut = self.item_start if self.item_start is not None else self.pos
+        if self.started and cut > 0:
+            self.buffer = self.buffer[cut:]
+            self.pos -= cut
+            if self.item_start is not None:
+                self.item_start = 0
+
+        self.items.extend(completed)
+        return completed
+
+    def _emit(self, end: int, completed: List):
+        try:
+            item = json.loads(self.buffer[self.item_start:end + 1])
+        except json.JSONDecodeError:
+            item = _MISSING
+        self.item_start = None
+        if item is _MISSING or (self.validate and not self.validate(item)):
+            self.dropped += 1
+            return
+        completed.append(item)
+
+    def close(self) -> List:
+        """Ends the stream: records the outcome and returns every item."""
+        if self.site:
+            outcome = "ok" if self.closed else ("salvaged" if self.items else "failed")
+            _record(self.site, outcome, dropped=self.dropped)
+        return self.items
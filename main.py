@@ -1,7 +1,6 @@
-from fastapi import FastAPI, UploadFile, File, BackgroundTasks, HTTPException, Form
-from typing import List
+from fastapi import FastAPI, UploadFile, File, BackgroundTasks, HTTPException, Form, Request
+from typing import List, Optional
 import os
-import shutil
 import uuid
 import json # Added json import as it's used later in the code
 
@@ -9,10 +8,24 @@ from ingestion_pipeline import ingest_directory
 from retrieval_service import get_doubt_assistant_response
 
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, Response, StreamingResponse, PlainTextResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 import assessment_service
 import flashcard_service
+import progress_store
+import mistake_clusters
+import json_stream
+import response_cache
+import upload_store
+import page_store
+import http_cache
+import corpus_store
+import metrics
+import tracing
+from progress_store import DEFAULT_STUDENT
 
 app = FastAPI()
 
@@ -29,17 +42,92 @@ app.add_middleware(
 # CONFIG
 # ----------------------------
 UPLOAD_ROOT = "uploads"
-ALLOWED_EXTENSIONS = {".pdf"}
+UPLOAD_PATHS = {"/upload", "/upload_review"}
+MAX_PAGES_PER_REQUEST = 20
+MATERIAL_CACHE_CONTROL = "private, max-age=0, must-revalidate" # Filenames can be re-uploaded with new content
+POLL_CACHE_CONTROL = "private, no-cache" # Always revalidate; unchanged polls get a 304
 
 os.makedirs(UPLOAD_ROOT, exist_ok=True)
 
 app.mount("/uploads", StaticFiles(directory=UPLOAD_ROOT), name="uploads")
 
+# ----------------------------
+# BACKGROUND JOBS
+# ----------------------------
+@app.on_event("startup")
+async def start_background_jobs():
+    # Periodically pack old progress events into compressed segments
+    progress_store.start_compactor()
+    # Periodically re-cluster class-wide mistakes into misconception concepts
+    mistake_clusters.start_clusterer()
+    # Periodically garbage-collect artifacts of replaced chapters and old prompt versions
+    corpus_store.start_reaper()
+
 # ----------------------------
 # HELPERS
 # ----------------------------
-def is_allowed_file(filename: str) -> bool:
-    return any(filename.lower().endswith(ext) for ext in ALLOWED_EXTENSIONS)
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Rejects oversized uploads from the Content-Length header, before the body is read."""
+    if request.url.path in UPLOAD_PATHS:
+        length = request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > upload_store.MAX_REQUEST_BYTES:
+            return JSONResponse(status_code=413, content={
+                "detail": f"Upload larger than {upload_store.MAX_REQUEST_BYTES // (1024 * 1024)} MB"
+            })
+    return await call_next(request)
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Opt-in tracing: "X-Trace: 1" records a span tree of the request to tracing.TRACE_DIR,
+    "X-Trace: profile" adds sampled stacks. Needs TRACE_TOKEN set and sent as X-Trace-Token.
+    Streamed bodies are traced up to the response headers.
+    """
+    mode = tracing.requested_mode(request.headers)
+    if mode is None:
+        return await call_next(request)
+    with tracing.start_trace(f"{request.method} {request.url.path}", profile=mode == "profile") as trace:
+        response = await call_next(request)
+    response.headers["X-Trace-Id"] = trace.id
+    return response
+
+def ingest_and_prepare(session_dir: str, trace: str = ""):
+    """Ingests the session, then pre-generates every chapter's assessments (and optionally flashcards) so students start warm."""
+    mode = tracing.job_mode(trace)
+    if mode:
+        with tracing.start_trace(f"ingest {os.path.basename(session_dir)}", profile=mode == "profile"):
+            return _ingest_and_prepare(session_dir)
+    return _ingest_and_prepare(session_dir)
+
+def _ingest_and_prepare(session_dir: str):
+    metrics.add_gauge("cote_jobs_active", 1, kind="ingestion")
+    try:
+        with metrics.timed("ingest_job"):
+            ingest_directory(session_dir)
+        # Only the changed chapters' artifacts go stale; everything else stays cached
+        with tracing.span("reap_stale_artifacts"):
+            corpus_store.reap_stale_artifacts([os.path.basename(session_dir)])
+        with tracing.span("pregenerate_assessments"):
+            assessment_service.pregenerate_session_assessments(os.path.basename(session_dir))
+        if flashcard_service.FLASHCARD_PREWARM:
+            with tracing.span("prewarm_flashcards"):
+                flashcard_service.prewarm_flashcards(os.path.basename(session_dir))
+    finally:
+        metrics.add_gauge("cote_jobs_active", -1, kind="ingestion")
+
+def _parse_metrics():
+    return {(("site", site), ("outcome", outcome)): count
+            for site, counts in json_stream.get_stats().items() for outcome, count in counts.items()}
+
+def _response_cache_metrics():
+    return {(("cache", name), ("result", result)): stats[result]
+            for name, stats in response_cache.get_stats().items() for result in ("hits", "misses", "stale", "evictions")}
+
+metrics.register_collector("cote_llm_parse_total", "counter", "LLM output parse outcomes per call site", _parse_metrics)
+metrics.register_collector("cote_response_cache_total", "counter", "Response cache lookups and evictions", _response_cache_metrics)
+metrics.register_collector("cote_response_cache_bytes", "gauge", "Memory used by each response cache",
+                           lambda: {(("cache", name),): stats["bytes"] for name, stats in response_cache.get_stats().items()})
 
 # ----------------------------
 # STATUS ENDPOINTS
@@ -60,6 +148,21 @@ async def root():
 async def health_check():
     return {"status": "healthy", "service": "study-assistant-ingestion"}
 
+@app.get("/stats/llm_parsing")
+async def llm_parsing_stats():
+    """Per call site: LLM outputs parsed cleanly, repaired, salvaged or failed, and items dropped by schema checks."""
+    return json_stream.get_stats()
+
+@app.get("/stats/response_cache")
+async def response_cache_stats():
+    """Per in-memory response cache: entries, bytes used, hits, misses and hit ratio."""
+    return response_cache.get_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint: stage latencies, LLM calls and tokens, retries, rate-limit waits, caches, queues."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # ----------------------------
 # DOUBT ASSISTANT ENDPOINT
 # ----------------------------
@@ -71,7 +174,8 @@ async def ask_question(session_id: str, query: str, language: str = "english"):
     Endpoint for the Student Portal Doubt Assistant.
     """
     try:
-        response = get_doubt_assistant_response(query, session_id, language)
+        # The LLM call blocks for seconds; off the event loop so other requests keep being served
+        response = await run_in_threadpool(get_doubt_assistant_response, query, session_id, language)
         return {"response": response}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -80,51 +184,85 @@ async def ask_question(session_id: str, query: str, language: str = "english"):
 # UPLOAD ENDPOINT
 # ----------------------------
 
+def request_too_large(session_dir: str, trace: str, saved_files: List[str]) -> JSONResponse:
+    """413 naming the per-request limit. Files stored earlier in the request are kept and still ingested."""
+    limit_mb = upload_store.MAX_REQUEST_BYTES // (1024 * 1024)
+    print(f"🚫 Upload over the {limit_mb} MB request limit; kept {len(saved_files)} file(s)")
+    return JSONResponse(
+        status_code=413,
+        content={"detail": f"Upload larger than the {limit_mb} MB per-request limit", "uploaded_files": saved_files},
+        background=BackgroundTask(ingest_and_prepare, session_dir, trace) if saved_files else None
+    )
+
 @app.post("/upload")
 async def upload_files(
     files: List[UploadFile] = File(...),
     session_id: str = Form("default"),
+    trace: str = Form(""), # "1" or "profile": trace this ingestion job (needs trace_token)
+    trace_token: str = Form(""),
     background_tasks: BackgroundTasks = BackgroundTasks()
 ):
     if not files:
         raise HTTPException(status_code=400, detail="No files uploaded")
+    trace = trace if tracing.authorized(trace_token) else ""
 
     # Use provided session_id or 'default'
-    session_dir = os.path.join(UPLOAD_ROOT, session_id)
-
-    os.makedirs(session_dir, exist_ok=True)
+    try:
+        session_dir = upload_store.session_dir_for(session_id)
+    except upload_store.UploadRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     saved_files = []
+    unchanged_files = []
     rejected_files = []
 
+    # Per-request limit, also for bodies sent without a Content-Length
+    budget = upload_store.MAX_REQUEST_BYTES
     for file in files:
-        if not is_allowed_file(file.filename):
+        if budget <= 0:
+            return request_too_large(session_dir, trace, saved_files)
+        try:
+            filename = upload_store.safe_filename(file.filename)
+            # Chunked copy + hashing off the event loop
+            saved = await run_in_threadpool(upload_store.save_pdf, file.file, session_dir, filename,
+                                            min(upload_store.MAX_FILE_BYTES, budget))
+            budget -= saved["size"]
+        except upload_store.UploadTooLarge as e:
+            if budget < upload_store.MAX_FILE_BYTES: # The request's remaining budget was the tighter limit
+                return request_too_large(session_dir, trace, saved_files)
+            print(f"🚫 Upload rejected: {e}")
+            rejected_files.append(file.filename)
+            continue
+        except upload_store.UploadRejected as e:
+            print(f"🚫 Upload rejected: {e}")
             rejected_files.append(file.filename)
             continue
-
-        file_path = os.path.join(session_dir, file.filename)
-
-        try:
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-
-            saved_files.append(file.filename)
-
         except Exception as e:
             raise HTTPException(
                 status_code=500,
                 detail=f"Failed to save file {file.filename}: {str(e)}"
             )
+        (saved_files if saved["changed"] else unchanged_files).append(saved["filename"])
 
-    if not saved_files:
+    if not saved_files and not unchanged_files:
         raise HTTPException(
             status_code=400,
             detail="No valid PDF files were uploaded"
         )
 
+    # Identical re-uploads are neither rewritten nor re-ingested
+    if not saved_files:
+        return {
+            "session_id": session_id,
+            "status": "unchanged",
+            "uploaded_files": [],
+            "unchanged_files": unchanged_files,
+            "rejected_files": rejected_files
+        }
+
     # Trigger ingestion in background
     try:
-        background_tasks.add_task(ingest_directory, session_dir)
+        background_tasks.add_task(ingest_and_prepare, session_dir, trace)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -135,9 +273,81 @@ async def upload_files(
         "session_id": session_id,
         "status": "processing",
         "uploaded_files": saved_files,
+        "unchanged_files": unchanged_files,
         "rejected_files": rejected_files
     }
 
+# ----------------------------
+# MATERIAL READER ENDPOINTS
+# ----------------------------
+# Page text, thumbnails and outline of an uploaded PDF, so the reader is usable before
+# (or without) downloading the whole file. Everything is keyed by the PDF's content hash.
+
+def resolve_material(session_id: str, filename: str):
+    """(path, content hash) of an uploaded PDF, or 404."""
+    try:
+        path = os.path.join(upload_store.session_dir_for(session_id), upload_store.safe_filename(filename))
+    except upload_store.UploadRejected as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Material not found")
+    return path, corpus_store.file_hash(path)
+
+def json_with_etag(request: Request, data, etag: str) -> Response:
+    payload = response_cache.Payload(json.dumps(data).encode("utf-8"), etag)
+    return http_cache.payload_response(request, payload, MATERIAL_CACHE_CONTROL)
+
+@app.get("/api/materials/{session_id}/{filename}/outline")
+async def get_material_outline(request: Request, session_id: str, filename: str):
+    """Page count and topic outline ({title, section_number, page}) of a PDF."""
+    path, content_hash = await run_in_threadpool(resolve_material, session_id, filename)
+    etag = f'"{content_hash}-outline"'
+    if http_cache.etag_matches(request, etag):
+        return http_cache.not_modified(etag, MATERIAL_CACHE_CONTROL)
+    document = await run_in_threadpool(page_store.ensure_document, path, content_hash)
+    return json_with_etag(request, {"filename": os.path.basename(path), **document}, etag)
+
+@app.get("/api/materials/{session_id}/{filename}/pages")
+async def get_material_pages(request: Request, session_id: str, filename: str, start: int = 1, end: Optional[int] = None):
+    """Extracted text of pages start..end (inclusive, at most MAX_PAGES_PER_REQUEST)."""
+    path, content_hash = await run_in_threadpool(resolve_material, session_id, filename)
+    document = await run_in_threadpool(page_store.ensure_document, path, content_hash)
+    start = max(start, 1)
+    end = min(end or start, start + MAX_PAGES_PER_REQUEST - 1, document["page_count"])
+    etag = f'"{content_hash}-p{start}-{end}"'
+    if http_cache.etag_matches(request, etag):
+        return http_cache.not_modified(etag, MATERIAL_CACHE_CONTROL)
+    pages = await run_in_threadpool(page_store.get_pages, content_hash, start, end)
+    return json_with_etag(request, {"page_count": document["page_count"], "pages": pages}, etag)
+
+@app.get("/api/materials/{session_id}/{filename}/pages/{page}")
+async def get_material_page(request: Request, session_id: str, filename: str, page: int):
+    """Extracted text of a single page."""
+    return await get_material_pages(request, session_id, filename, page, page)
+
+@app.get("/api/materials/{session_id}/{filename}/thumbnails/{page}")
+async def get_material_thumbnail(request: Request, session_id: str, filename: str, page: int):
+    """Small JPEG of one page, rendered at ingestion (or now, for older uploads)."""
+    path, content_hash = await run_in_threadpool(resolve_material, session_id, filename)
+    if page < 1:
+        raise HTTPException(status_code=404, detail="Page not found")
+    etag = f'"{content_hash}-t{page}"'
+    if http_cache.etag_matches(request, etag):
+        return http_cache.not_modified(etag, MATERIAL_CACHE_CONTROL)
+    try:
+        thumbnail = await run_in_threadpool(page_store.ensure_thumbnail, path, content_hash, page)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=f"Thumbnail unavailable: {e}")
+    if thumbnail is None:
+        raise HTTPException(status_code=404, detail="Page not found")
+    return http_cache.file_response(request, thumbnail, etag, "image/jpeg", MATERIAL_CACHE_CONTROL)
+
+@app.get("/api/materials/{session_id}/{filename}/pdf")
+async def get_material_pdf(request: Request, session_id: str, filename: str):
+    """The raw PDF with ETag and byte-range support (viewers can load the first pages first)."""
+    path, content_hash = await run_in_threadpool(resolve_material, session_id, filename)
+    return http_cache.file_response(request, path, f'"{content_hash}"', "application/pdf", MATERIAL_CACHE_CONTROL)
+
 # ----------------------------
 # ASSESSMENT ENDPOINTS
 # ----------------------------
@@ -145,6 +355,7 @@ async def upload_files(
 class AssessmentRequest(BaseModel):
     session_id: str
     level: int
+    student_id: str = DEFAULT_STUDENT
 
 class SubmitRequest(BaseModel):
     session_id: str
@@ -152,6 +363,7 @@ class SubmitRequest(BaseModel):
     score: int
     max_score: int
     mistakes: List[dict] = []
+    student_id: str = DEFAULT_STUDENT
 
 @app.get("/api/classrooms")
 async def get_classrooms():
@@ -170,83 +382,117 @@ async def get_classrooms():
 async def generate_assessment_endpoint(request: AssessmentRequest):
     """Generate or retrieve an assessment for a specific level."""
     from assessment_service import generate_assessment
-    result = generate_assessment(request.session_id, request.level)
+    # Off the event loop: this may wait on an in-flight generation for the same chapter
+    result = await run_in_threadpool(generate_assessment, request.session_id, request.level, request.student_id)
     if "error" in result:
         raise HTTPException(status_code=500, detail=result["error"])
     return result
 
+@app.post("/api/assessment/generate/stream")
+async def stream_assessment_endpoint(request: AssessmentRequest):
+    """
+    Same as /api/assessment/generate, as NDJSON events (meta, question..., done | error)
+    so the first question can be shown before the whole set is generated.
+    """
+    from assessment_service import stream_assessment
+    events = (json.dumps(event) + "\n" for event in stream_assessment(request.session_id, request.level, request.student_id))
+    return StreamingResponse(events, media_type="application/x-ndjson")
+
 @app.post("/api/assessment/submit")
 async def submit_assessment_endpoint(request: SubmitRequest):
     """Submit results and calculate XP/Unlocks."""
     from assessment_service import submit_assessment_result
-    result = submit_assessment_result(
+    # SQLite writes can wait on busy_timeout; keep them off the event loop
+    result = await run_in_threadpool(
+        submit_assessment_result,
         request.session_id, 
         request.level, 
         request.score, 
         request.max_score,
-        request.mistakes
+        request.mistakes,
+        student_id=request.student_id
     )
     return result
 
 @app.get("/api/mistakes/{session_id}")
-async def get_mistakes_endpoint(session_id: str):
-    """Get list of mistakes for a student in a specific classroom."""
+async def get_mistakes_endpoint(request: Request, session_id: str, student_id: str = DEFAULT_STUDENT,
+                                cursor: Optional[str] = None, limit: int = 50, level: Optional[int] = None,
+                                chapter: Optional[int] = None):
+    """
+    Get a page of mistakes for a student in a specific classroom ("all" = every classroom).
+    Pass next_cursor back as cursor for the following page.
+    """
     from assessment_service import get_mistakes
-    return get_mistakes(session_id)
+    etag = await run_in_threadpool(assessment_service.mistakes_etag, session_id, student_id, cursor, limit, level, chapter)
+    if http_cache.etag_matches(request, etag):
+        return http_cache.not_modified(etag, POLL_CACHE_CONTROL)
+    try:
+        page = await run_in_threadpool(get_mistakes, session_id, student_id, cursor, limit, level, chapter)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return http_cache.payload_response(request, response_cache.Payload(json.dumps(page).encode("utf-8"), etag),
+                                       POLL_CACHE_CONTROL)
 
 class CommentRequest(BaseModel):
     session_id: str
     question: str
     comment: str
+    student_id: str = DEFAULT_STUDENT
 
 @app.post("/api/mistakes/comment")
 async def add_mistake_comment(request: CommentRequest):
     """Add or update a comment on a specific mistake."""
     from assessment_service import update_mistake_comment
-    success = update_mistake_comment(request.session_id, request.question, request.comment)
+    success = await run_in_threadpool(update_mistake_comment, request.session_id, request.question,
+                                      request.comment, request.student_id)
     if not success:
         raise HTTPException(status_code=404, detail="Mistake not found")
     return {"status": "success"}
 
 @app.get("/api/progress/{session_id}")
-async def get_progress_endpoint(session_id: str):
+async def get_progress_endpoint(request: Request, session_id: str, student_id: str = DEFAULT_STUDENT):
     """Get current XP and unlocked levels for a student in a specific classroom."""
     from assessment_service import get_progress
-    return get_progress(session_id)
+    # Unchanged polls are answered from the revision alone, without building the progress view
+    etag = await run_in_threadpool(assessment_service.progress_etag, session_id, student_id)
+    if etag and http_cache.etag_matches(request, etag):
+        return http_cache.not_modified(etag, POLL_CACHE_CONTROL)
+    progress = await run_in_threadpool(get_progress, session_id, student_id)
+    return http_cache.payload_response(request, response_cache.Payload(json.dumps(progress).encode("utf-8"), etag),
+                                       POLL_CACHE_CONTROL)
+
+@app.get("/api/progress/{session_id}/history")
+async def get_history_endpoint(session_id: str, student_id: str = DEFAULT_STUDENT,
+                               cursor: Optional[int] = None, limit: int = 50, type: Optional[str] = None):
+    """Full attempt and XP history for a student, newest first. Pass next_cursor to get the next page."""
+    from assessment_service import get_history
+    return await run_in_threadpool(get_history, session_id, student_id, cursor, limit, type)
 
 @app.get("/api/flashcards/{session_id}")
-async def get_flashcards(session_id: str, language: str = "english"):
+async def get_flashcards(request: Request, session_id: str, language: str = "english"):
     """Get topic-wise revision flashcards with language support."""
     try:
-        cards = flashcard_service.generate_flashcards(session_id, language)
-        return cards
+        etag = await run_in_threadpool(flashcard_service.flashcards_etag, session_id, language)
+        if http_cache.etag_matches(request, etag):
+            return http_cache.not_modified(etag, POLL_CACHE_CONTROL)
+        payload = await run_in_threadpool(flashcard_service.get_flashcards_payload, session_id, language)
+        return http_cache.payload_response(request, payload, POLL_CACHE_CONTROL)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 class XPRequest(BaseModel):
     session_id: str
     amount: int
+    student_id: str = DEFAULT_STUDENT
 
 @app.post("/api/add_xp")
 async def add_xp(request: XPRequest):
     """Manually add XP to a student (e.g. for viewing flashcards)."""
     try:
-        progress = assessment_service.load_user_progress()
-        if request.session_id not in progress:
-            # Initialize if not exists
-            progress[request.session_id] = {
-                "xp": 0,
-                "mistakes": [],
-                "history": [],
-                "unlocked_level": 1
-            }
-        
-        progress[request.session_id]["xp"] += request.amount
-        assessment_service.save_user_progress(progress)
-        
+        new_total = await run_in_threadpool(assessment_service.add_xp, request.session_id, request.amount, request.student_id)
         return {
             "success": True,
-            "new_total": progress[request.session_id]["xp"]
+            "new_total": new_total
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -255,7 +501,7 @@ async def add_xp(request: XPRequest):
 async def spend_xp_endpoint(request: XPRequest):
     """Spend XP for hints or other items."""
     from assessment_service import spend_xp
-    success = spend_xp(request.session_id, request.amount)
+    success = await run_in_threadpool(spend_xp, request.session_id, request.amount, request.student_id)
     if not success:
          return {"success": False, "message": "Insufficient XP"}
     return {"success": True}
@@ -264,13 +510,26 @@ async def spend_xp_endpoint(request: XPRequest):
 async def get_teacher_analytics_endpoint(session_id: str):
     """Get class-wide analytics for a specific classroom."""
     from assessment_service import get_teacher_analytics
-    return get_teacher_analytics(session_id)
+    return await run_in_threadpool(get_teacher_analytics, session_id)
 
 @app.get("/api/teacher/assessments/{session_id}")
-async def get_teacher_assessments_endpoint(session_id: str):
-    """Get all assessments organized by chapter and quest level for teacher preview."""
-    from assessment_service import get_all_assessments_for_teacher
-    return get_all_assessments_for_teacher(session_id)
+async def get_teacher_assessments_endpoint(request: Request, session_id: str, stream: bool = False):
+    """
+    Get all assessments organized by chapter and quest level for teacher preview.
+    With ?stream=true, each chapter is sent as one NDJSON line as soon as it is ready.
+    """
+    etag = await run_in_threadpool(assessment_service.teacher_assessments_etag, session_id, stream)
+    if http_cache.etag_matches(request, etag):
+        return http_cache.not_modified(etag, POLL_CACHE_CONTROL)
+    if stream:
+        # A complete preview built earlier is sent in one piece (with its ETag); otherwise chapters stream as generated
+        payload = await run_in_threadpool(assessment_service.get_cached_teacher_assessments_stream, session_id)
+        if payload is not None:
+            return http_cache.payload_response(request, payload, POLL_CACHE_CONTROL, media_type="application/x-ndjson")
+        return StreamingResponse(assessment_service.iter_teacher_assessments_stream(session_id),
+                                 media_type="application/x-ndjson")
+    payload = await run_in_threadpool(assessment_service.get_teacher_assessments_payload, session_id)
+    return http_cache.payload_response(request, payload, POLL_CACHE_CONTROL)
 
 # ----------------------------
 # TEACHER REVIEW ENDPOINT
@@ -303,13 +562,19 @@ async def upload_review(
     session_id: str = Form(...),
     assessment_focus: str = Form(""),
     student_gaps: str = Form(""),
-    file: UploadFile = File(None)
+    file: UploadFile = File(None),
+    trace: str = Form(""), # "1" or "profile": trace the ingestion job (needs trace_token)
+    trace_token: str = Form("")
 ):
     """
     Endpoint for teachers to send feedback including documents.
     Triggers RAG ingestion in the background.
     """
-    session_dir = os.path.join(UPLOAD_ROOT, session_id)
+    trace = trace if tracing.authorized(trace_token) else ""
+    try:
+        session_dir = upload_store.session_dir_for(session_id)
+    except upload_store.UploadRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
     os.makedirs(session_dir, exist_ok=True)
     
     review_data = {
@@ -320,17 +585,21 @@ async def upload_review(
     }
 
     if file:
-        file_path = os.path.join(session_dir, "teacher_review_document.pdf")
         try:
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            
+            saved = await run_in_threadpool(upload_store.save_pdf, file.file, session_dir, "teacher_review_document.pdf")
+
             review_data["has_document"] = True
-            review_data["document_path"] = file_path
-            
-            # Trigger ingestion for RAG
-            background_tasks.add_task(ingest_directory, session_dir)
-            
+            review_data["document_path"] = os.path.join(session_dir, saved["filename"])
+
+            # Trigger ingestion for RAG (not needed when the same document was sent again), with the
+            # same reap and question-bank pre-generation as /upload
+            if saved["changed"]:
+                background_tasks.add_task(ingest_and_prepare, session_dir, trace)
+
+        except upload_store.UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except upload_store.UploadRejected as e:
+            raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to save review document: {str(e)}")
 
@@ -0,0 +1,217 @@
+import time
+import threading
+import concurrent.futures
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+import tracing
+
+# In-process metrics in the Prometheus text format, served by GET /metrics.
+# Recording is a dict update under a lock, so the hooks stay on in production.
+#
+#   cote_stage_seconds{stage}                 histogram: partition, topic_mapping, chunking, summarization,
+#                                             embedding, vector_write, retrieval, query_embedding, generation
+#   cote_llm_call_seconds{subsystem}          histogram per LLM call
+#   cote_llm_calls_total{subsystem}           counters, plus estimated tokens, retries and errors
+#   cote_rate_limit_wait_seconds_total        time spent waiting for api_semaphore
+#   cote_cache_requests_total{cache,result}   hit / miss per cache
+# plus gauges and counters collected at scrape time (queue depths, parse outcomes...).
+
+# --- CONFIG ---
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+CHARS_PER_TOKEN = 4 # Token estimate; Gemini doesn't report usage on every call path
+
+HELP = {
+    "cote_stage_seconds": "Duration of pipeline stages",
+    "cote_llm_call_seconds": "Duration of LLM calls",
+    "cote_llm_calls_total": "LLM calls",
+    "cote_llm_tokens_estimated_total": "Estimated LLM tokens (characters / 4)",
+    "cote_llm_retries_total": "LLM calls retried after an error (rate limits included)",
+    "cote_llm_errors_total": "LLM calls that raised",
+    "cote_rate_limit_wait_seconds_total": "Time spent waiting for the shared LLM concurrency limit",
+    "cote_cache_requests_total": "Cache lookups by result",
+    "cote_jobs_active": "Background jobs queued or running",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_lock = threading.Lock()
+_counters = defaultdict(float)  # (name, labels) -> value
+_gauges = defaultdict(float)    # (name, labels) -> value
+_histograms = {}                # (name, labels) -> [bucket counts..., +Inf count, sum]
+_collectors = []                # (name, type, help, fn() -> {labels dict as tuple: value})
+
+def _labels(labels: Dict) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def inc(name: str, value: float = 1.0, **labels):
+    with _lock:
+        _counters[(name, _labels(labels))] += value
+
+def add_gauge(name: str, delta: float, **labels):
+    with _lock:
+        _gauges[(name, _labels(labels))] += delta
+
+def observe(name: str, seconds: float, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        hist[bisect_left(BUCKETS, seconds)] += 1
+        hist[-1] += seconds
+
+@contextmanager
+def timed(stage: str):
+    """with metrics.timed("partition"): ... records cote_stage_seconds{stage="partition"} (and a span when tracing)."""
+    start = time.perf_counter()
+    try:
+        with tracing.span(stage):
+            yield
+    finally:
+        observe("cote_stage_seconds", time.perf_counter() - start, stage=stage)
+
+def estimate_tokens(content) -> int:
+    """Works on strings, LangChain messages and multimodal content lists (text parts only)."""
+    if content is None:
+        return 0
+    if isinstance(content, str):
+        return len(content) // CHARS_PER_TOKEN
+    if isinstance(content, dict):
+        return estimate_tokens(content.get("text"))
+    if isinstance(content, (list, tuple)):
+        return sum(estimate_tokens(part) for part in content)
+    return estimate_tokens(getattr(content, "content", None))
+
+def record_llm_call(subsystem: str, messages, response_text, seconds: float):
+    observe("cote_llm_call_seconds", seconds, subsystem=subsystem)
+    inc("cote_llm_calls_total", subsystem=subsystem)
+    inc("cote_llm_tokens_estimated_total", estimate_tokens(messages), subsystem=subsystem, direction="input")
+    inc("cote_llm_tokens_estimated_total", estimate_tokens(response_text), subsystem=subsystem, direction="output")
+
+def retry_hook(subsystem: str, label: str = "") -> Callable:
+    """tenacity before_sleep: counts the retry and keeps the usual log line."""
+    def before_sleep(retry_state):
+        inc("cote_llm_retries_total", subsystem=subsystem)
+        print(f"⚠️ API Limit hit{label}. Retrying in {retry_state.next_action.sleep} seconds...")
+    return before_sleep
+
+def cache_result(cache: str, hit: bool):
+    inc("cote_cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+def register_collector(name: str, kind: str, help_text: str, fn: Callable[[], Dict[Labels, float]]):
+    """Values read at scrape time: fn returns {labels: value}, labels as ((key, value), ...)."""
+    _collectors.append((name, kind, help_text, fn))
+
+class MeteredThreadPool(concurrent.futures.ThreadPoolExecutor):
+    """
+    ThreadPoolExecutor that reports its queue depth (tasks submitted but not started yet) as
+    cote_queue_depth{pool=thread_name_prefix}. Counted at submit and start, not read from the executor's internals.
+    """
+
+    def __init__(self, max_workers: int = None, thread_name_prefix: str = "", **kwargs):
+        super().__init__(max_workers=max_workers, thread_name_prefix=thread_name_prefix, **kwargs)
+        self.queued = 0
+        self._queued_lock = threading.Lock()
+        register_collector("cote_queue_depth", "gauge", "Tasks waiting in background pools",
+                           lambda: {(("pool", thread_name_prefix),): self.queued})
+
+    def _dequeue(self):
+        with self._queued_lock:
+            self.queued -= 1
+
+    def submit(self, fn, /, *args, **kwargs):
+        started = threading.Event()
+
+        def run():
+            started.set()
+            self._dequeue()
+            return fn(*args, **kwargs)
+
+        with self._queued_lock:
+            self.queued += 1
+        try:
+            future = super().submit(run)
+        except BaseException:
+            self._dequeue()
+            raise
+        # Cancelled before starting (cancel(), shutdown(cancel_futures=True)): never ran, so never dequeued
+        future.add_done_callback(lambda f: None if started.is_set() else self._dequeue())
+        return future
+
+class TimedEmbeddings:
+    """Wraps a LangChain embeddings object so every embedding call is timed under `stage`."""
+
+    def __init__(self, embeddings, stage: str = "embedding"):
+        self.embeddings = embeddings
+        self.stage = stage
+        self.seconds = 0.0 # Total embedding time through this wrapper
+
+    def _timed(self, fn, arg):
+        start = time.perf_counter()
+        try:
+            return fn(arg)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.seconds += elapsed
+            observe("cote_stage_seconds", elapsed, stage=self.stage)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._timed(self.embeddings.embed_documents, texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._timed(self.embeddings.embed_query, text)
+
+def _format_labels(labels: Labels, extra: Tuple = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {k: list(v) for k, v in _histograms.items()}
+
+    lines = []
+    for kind, values in (("counter", counters), ("gauge", gauges)):
+        by_name = defaultdict(list)
+        for (name, labels), value in values.items():
+            by_name[name].append((labels, value))
+        for name in sorted(by_name):
+            lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{_format_labels(labels)} {value:g}" for labels, value in sorted(by_name[name])]
+
+    hist_by_name = defaultdict(list)
+    for (name, labels), hist in histograms.items():
+        hist_by_name[name].append((labels, hist))
+    for name in sorted(hist_by_name):
+        lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"]
+        for labels, hist in sorted(hist_by_name[name]):
+            cumulative = 0
+            for bound, count in zip(list(BUCKETS) + ["+Inf"], hist[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {hist[-1]:g}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+
+    collected = defaultdict(lambda: {"kind": None, "help": None, "values": {}})
+    for name, kind, help_text, fn in list(_collectors):
+        try:
+            values = fn()
+        except Exception as e:
+            print(f"⚠️ Metrics collector {name} failed: {e}")
+            continue
+        entry = collected[name]
+        entry["kind"], entry["help"] = kind, help_text
+        entry["values"].update(values)
+    for name in sorted(collected):
+        entry = collected[name]
+        lines += [f"# HELP {name} {entry['help']}", f"# TYPE {name} {entry['kind']}"]
+        lines += [f"{name}{_format_labels(labels)} {value:g}" for labels, value in sorted(entry["values"].items())]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,293 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import Dict, List
+
+import numpy as np
+
+import progress_store
+import sqlite_db
+import metrics
+from clustering import kmeans, assign_to_centroids
+
+# --- CONFIG ---
+DATA_ROOT = "data"
+CLUSTER_DB = os.path.join(DATA_ROOT, "mistake_clusters.db")
+CHROMA_PATH = "./chroma_db"
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBED_BATCH_SIZE = 256
+MIN_QUESTIONS_TO_CLUSTER = 4
+MAX_CLUSTERS = 12
+RECLUSTER_RATIO = 0.25  # Full re-clustering once this share of questions was only assigned incrementally
+CLUSTER_INTERVAL_SECONDS = 6 * 3600
+
+os.makedirs(DATA_ROOT, exist_ok=True)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vectors (
+    question_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    PRIMARY KEY (question_hash, model)
+);
+CREATE TABLE IF NOT EXISTS clusters (
+    session_id TEXT NOT NULL,
+    cluster_id INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    centroid BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    frequency INTEGER NOT NULL DEFAULT 0,
+    questions INTEGER NOT NULL DEFAULT 0,
+    example TEXT,
+    example_misses INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (session_id, cluster_id)
+);
+CREATE TABLE IF NOT EXISTS members (
+    session_id TEXT NOT NULL,
+    question_hash TEXT NOT NULL,
+    cluster_id INTEGER NOT NULL,
+    similarity REAL NOT NULL,
+    misses INTEGER NOT NULL DEFAULT 0,
+    incremental INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (session_id, question_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_members_cluster ON members(session_id, cluster_id);
+"""
+
+_embeddings = None
+_embeddings_lock = threading.Lock()
+# New mistakes are embedded and assigned off the submit path
+_assign_pool = metrics.MeteredThreadPool(max_workers=1, thread_name_prefix="mistake-assign")
+
+def get_connection() -> sqlite3.Connection:
+    return sqlite_db.get_connection(CLUSTER_DB, SCHEMA)
+
+def transaction():
+    return sqlite_db.transaction(get_connection())
+
+def get_embeddings():
+    """Same local MiniLM model as ingestion, loaded on first use (analytics reads never need it)."""
+    global _embeddings
+    with _embeddings_lock:
+        if _embeddings is None:
+            from langchain_huggingface import HuggingFaceEmbeddings
+            _embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    return _embeddings
+
+def _to_blob(vector) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+def _from_blob(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=np.float32)
+
+def get_vectors(questions: List[Dict]) -> Dict[str, np.ndarray]:
+    """
+    Embeddings for {question_hash, question} rows. Cached per normalized question,
+    so each distinct question is embedded once across all classrooms.
+    """
+    conn = get_connection()
+    vectors = {}
+    for q in questions:
+        row = conn.execute(
+            "SELECT vector FROM vectors WHERE question_hash = ? AND model = ?", (q["question_hash"], EMBEDDING_MODEL)
+        ).fetchone()
+        if row is not None:
+            vectors[q["question_hash"]] = _from_blob(row["vector"])
+
+    missing = [q for q in questions if q["question_hash"] not in vectors]
+    for start in range(0, len(missing), EMBED_BATCH_SIZE):
+        batch = missing[start:start + EMBED_BATCH_SIZE]
+        embedded = get_embeddings().embed_documents([q["question"] for q in batch])
+        with transaction() as conn:
+            for q, vector in zip(batch, embedded):
+                conn.execute(
+                    "INSERT OR REPLACE INTO vectors (question_hash, model, vector) VALUES (?, ?, ?)",
+                    (q["question_hash"], EMBEDDING_MODEL, _to_blob(vector))
+                )
+                vectors[q["question_hash"]] = np.asarray(vector, dtype=np.float32)
+    if missing:
+        print(f"🧠 Embedded {len(missing)} new mistake questions")
+    return vectors
+
+def _label_clusters(session_id: str, centroids: np.ndarray, fallbacks: List[str]) -> List[str]:
+    """Each cluster is named after the parent_topic of the indexed chunk closest to its centroid."""
+    labels = list(fallbacks)
+    try:
+        from langchain_chroma import Chroma
+        db = Chroma(persist_directory=CHROMA_PATH, collection_name="hackathon_collection")
+        for i, centroid in enumerate(centroids):
+            docs = db.similarity_search_by_vector(centroid.tolist(), k=1, filter={"session_id": session_id})
+            if docs and docs[0].metadata.get("parent_topic"):
+                labels[i] = docs[0].metadata["parent_topic"]
+    except Exception as e:
+        print(f"⚠️ Cluster labelling fell back to question text for {session_id}: {e}")
+    return labels
+
+def cluster_session(session_id: str) -> int:
+    """Batch job: re-clusters every missed question of a classroom. Returns the number of clusters."""
+    questions = progress_store.get_question_misses(session_id)
+    if len(questions) < MIN_QUESTIONS_TO_CLUSTER:
+        return 0
+
+    vectors = get_vectors(questions)
+    hashes = [q["question_hash"] for q in questions]
+    X = np.stack([vectors[h] for h in hashes])
+    # Clusters group questions by concept; how often each was missed is stored with them
+    k = max(1, min(MAX_CLUSTERS, int(np.sqrt(len(hashes) / 2))))
+    labels, centroids = kmeans(X, k)
+    _, sims = assign_to_centroids(X, centroids)
+
+    # Fallback label: the most-missed question of the cluster
+    fallbacks, tops = [], []
+    for c in range(len(centroids)):
+        members = [q for q, label in zip(questions, labels) if label == c]
+        top = max(members, key=lambda q: q["misses"]) if members else {"question": "Other", "misses": 0}
+        tops.append((sum(q["misses"] for q in members), len(members), top))
+        fallbacks.append(top["question"][:50] + ("..." if len(top["question"]) > 50 else ""))
+    names = _label_clusters(session_id, centroids, fallbacks)
+
+    now = time.time()
+    with transaction() as conn:
+        conn.execute("DELETE FROM clusters WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM members WHERE session_id = ?", (session_id,))
+        conn.executemany(
+            """INSERT INTO clusters (session_id, cluster_id, label, centroid, created_at,
+                                     frequency, questions, example, example_misses)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            [(session_id, c, names[c], _to_blob(centroids[c]), now, frequency, count, top["question"], top["misses"])
+             for c, (frequency, count, top) in enumerate(tops)]
+        )
+        conn.executemany(
+            "INSERT INTO members (session_id, question_hash, cluster_id, similarity, misses) VALUES (?, ?, ?, ?, ?)",
+            [(session_id, q["question_hash"], int(label), float(sim), q["misses"])
+             for q, label, sim in zip(questions, labels, sims)]
+        )
+    print(f"🧩 Clustered {len(hashes)} missed questions of {session_id} into {len(centroids)} concepts")
+    return len(centroids)
+
+def assign_new_mistakes(session_id: str, mistakes: List[Dict]):
+    """
+    Puts newly missed questions into the nearest existing cluster instead of re-clustering,
+    and carries the new miss counts of all these questions into the stored cluster totals.
+    """
+    questions = {}
+    for m in mistakes:
+        if m.get("question"):
+            qhash = progress_store.question_hash(m["question"])
+            questions[qhash] = {"question_hash": qhash, "question": m["question"]}
+    if not questions:
+        return
+
+    placeholders = ",".join("?" * len(questions))
+    known = {r["question_hash"] for r in get_connection().execute(
+        f"SELECT question_hash FROM members WHERE session_id = ? AND question_hash IN ({placeholders})",
+        (session_id, *questions)
+    ).fetchall()}
+    new = [q for h, q in questions.items() if h not in known]
+    vectors = get_vectors(new) if new else {}  # Cached either way, so the next batch run doesn't embed them again
+    misses = progress_store.get_miss_counts(session_id, list(questions))
+
+    # Re-read clusters and members under the write lock so a concurrent re-clustering can't be double-counted
+    with transaction() as conn:
+        centroid_rows = conn.execute(
+            "SELECT cluster_id, centroid FROM clusters WHERE session_id = ? ORDER BY cluster_id", (session_id,)
+        ).fetchall()
+        if not centroid_rows:
+            return
+        members = {r["question_hash"]: r for r in conn.execute(
+            f"SELECT question_hash, cluster_id, misses FROM members WHERE session_id = ? AND question_hash IN ({placeholders})",
+            (session_id, *questions)
+        ).fetchall()}
+        new = [q for h, q in questions.items() if h not in members and h in vectors]
+        if new:
+            centroids = np.stack([_from_blob(r["centroid"]) for r in centroid_rows])
+            labels, sims = assign_to_centroids(np.stack([vectors[q["question_hash"]] for q in new]), centroids)
+            conn.executemany(
+                """INSERT INTO members (session_id, question_hash, cluster_id, similarity, misses, incremental)
+                   VALUES (?, ?, ?, ?, 0, 1)""",
+                [(session_id, q["question_hash"], centroid_rows[int(label)]["cluster_id"], float(sim))
+                 for q, label, sim in zip(new, labels, sims)]
+            )
+            members.update({q["question_hash"]: {"cluster_id": centroid_rows[int(label)]["cluster_id"], "misses": 0}
+                            for q, label in zip(new, labels)})
+
+        for qhash, member in members.items():
+            count = misses.get(qhash, 0)
+            if count == member["misses"]:
+                continue
+            conn.execute(
+                "UPDATE members SET misses = ? WHERE session_id = ? AND question_hash = ?", (count, session_id, qhash)
+            )
+            conn.execute(
+                """UPDATE clusters SET frequency = frequency + ?, questions = questions + ?,
+                          example = CASE WHEN ? > example_misses THEN ? ELSE example END,
+                          example_misses = MAX(example_misses, ?)
+                   WHERE session_id = ? AND cluster_id = ?""",
+                (count - member["misses"], int(count > 0) - int(member["misses"] > 0),
+                 count, questions[qhash]["question"], count, session_id, member["cluster_id"])
+            )
+
+def queue_new_mistakes(session_id: str, mistakes: List[Dict]):
+    def run():
+        try:
+            assign_new_mistakes(session_id, mistakes)
+        except Exception as e:
+            print(f"⚠️ Mistake cluster assignment failed for {session_id}: {e}")
+    _assign_pool.submit(run)
+
+def get_top_concepts(session_id: str, limit: int = 5) -> List[Dict]:
+    """
+    Materialized clusters with true frequencies (total misses of their questions).
+    Reads only the stored cluster totals; no member scan or embedding work.
+    """
+    rows = get_connection().execute(
+        """SELECT label, frequency, questions, example, example_misses FROM clusters
+           WHERE session_id = ? AND frequency > 0""", (session_id,)
+    ).fetchall()
+
+    # Clusters whose nearest chunk shares a topic are one concept for the teacher
+    merged = {}
+    for r in rows:
+        m = merged.setdefault(r["label"], {"concept": r["label"], "frequency": 0, "questions": 0,
+                                           "example": None, "_top": 0})
+        m["frequency"] += r["frequency"]
+        m["questions"] += r["questions"]
+        if r["example_misses"] > m["_top"]:
+            m["_top"], m["example"] = r["example_misses"], r["example"]
+
+    concepts = sorted(merged.values(), key=lambda e: e["frequency"], reverse=True)
+    for e in concepts:
+        del e["_top"]
+    return concepts[:limit]
+
+def needs_reclustering(session_id: str) -> bool:
+    row = get_connection().execute(
+        "SELECT COUNT(*) AS total, COALESCE(SUM(incremental), 0) AS incremental FROM members WHERE session_id = ?",
+        (session_id,)
+    ).fetchone()
+    if row["total"] == 0:
+        return len(progress_store.get_question_misses(session_id)) >= MIN_QUESTIONS_TO_CLUSTER
+    return row["incremental"] > RECLUSTER_RATIO * row["total"]
+
+def cluster_all_sessions(force: bool = False) -> int:
+    done = 0
+    for session_id in progress_store.list_sessions():
+        try:
+            if force or needs_reclustering(session_id):
+                done += 1 if cluster_session(session_id) else 0
+        except Exception as e:
+            print(f"⚠️ Mistake clustering failed for {session_id}: {e}")
+    return done
+
+def start_clusterer(interval: float = CLUSTER_INTERVAL_SECONDS):
+    """Runs cluster_all_sessions at startup and then periodically, on a daemon thread."""
+    def loop():
+        while True:
+            cluster_all_sessions()
+            time.sleep(interval)
+    threading.Thread(target=loop, name="mistake-clusterer", daemon=True).start()
+
+if __name__ == "__main__":
+    # Manual batch run: python mistake_clusters.py
+    cluster_all_sessions(force=True)
@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+import sqlite_db
+from topic_mapper import group_elements_by_topic
+
+# --- CONFIG ---
+DATA_ROOT = "data"
+PAGES_DB = os.path.join(DATA_ROOT, "pages.db")
+THUMBNAIL_DIR = os.path.join(DATA_ROOT, "thumbnails")
+THUMBNAIL_WIDTH = 240
+THUMBNAIL_QUALITY = 70
+
+os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+
+# Per-page text and topic outline of every PDF, keyed by its content hash (like the other caches),
+# so the reader can show a chapter after a few kilobytes instead of downloading the whole file.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    content_hash TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (content_hash, page)
+);
+CREATE TABLE IF NOT EXISTS documents (
+    content_hash TEXT PRIMARY KEY,
+    page_count INTEGER NOT NULL,
+    outline TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+_extract_locks = {}
+_extract_locks_guard = threading.Lock()
+
+def get_connection() -> sqlite3.Connection:
+    return sqlite_db.get_connection(PAGES_DB, SCHEMA)
+
+def transaction():
+    return sqlite_db.transaction(get_connection())
+
+def _page_of(element) -> int:
+    return getattr(element.metadata, "page_number", None) or 1
+
+def record_document(content_hash: str, elements: List, topics: Optional[List[Dict]] = None):
+    """
+    Stores page texts and the topic outline from partition output (ingestion already has both).
+    Outline entries: {"title", "section_number", "page"} where page is the topic's first page.
+    """
+    texts = defaultdict(list)
+    for el in elements:
+        text = (el.text or "").strip()
+        if text:
+            texts[_page_of(el)].append(text)
+    page_count = max([_page_of(el) for el in elements] or [0])
+
+    topics = topics if topics is not None else group_elements_by_topic(elements)
+    outline = [{
+        "title": t["title"],
+        "section_number": t.get("section_number", ""),
+        "page": _page_of(t["elements"][0]) if t["elements"] else 1
+    } for t in topics]
+
+    with transaction() as conn:
+        conn.execute("DELETE FROM pages WHERE content_hash = ?", (content_hash,))
+        conn.executemany(
+            "INSERT INTO pages (content_hash, page, text) VALUES (?, ?, ?)",
+            [(content_hash, page, "\n\n".join(texts.get(page, []))) for page in range(1, page_count + 1)]
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO documents (content_hash, page_count, outline, created_at) VALUES (?, ?, ?, ?)",
+            (content_hash, page_count, json.dumps(outline), time.time())
+        )
+
+def get_document(content_hash: str) -> Optional[Dict]:
+    row = get_connection().execute(
+        "SELECT page_count, outline FROM documents WHERE content_hash = ?", (content_hash,)).fetchone()
+    if row is None:
+        return None
+    return {"page_count": row["page_count"], "outline": json.loads(row["outline"])}
+
+def get_pages(content_hash: str, start: int, end: int) -> List[Dict]:
+    rows = get_connection().execute(
+        "SELECT page, text FROM pages WHERE content_hash = ? AND page BETWEEN ? AND ? ORDER BY page",
+        (content_hash, start, end)
+    ).fetchall()
+    return [{"page": r["page"], "text": r["text"]} for r in rows]
+
+def ensure_document(pdf_path: str, content_hash: str) -> Dict:
+    """
+    The stored document, extracting it now (fast partition) for PDFs ingested before pages were recorded.
+    Blocking: run it off the event loop.
+    """
+    document = get_document(content_hash)
+    if document is not None:
+        return document
+    with _extract_locks_guard:
+        lock = _extract_locks.setdefault(content_hash, threading.Lock())
+    with lock:
+        document = get_document(content_hash)
+        if document is None:
+            from unstructured.partition.pdf import partition_pdf # Only needed for this one-off backfill
+            print(f"📄 Extracting pages of {pdf_path}")
+            record_document(content_hash, partition_pdf(filename=pdf_path, strategy="fast"))
+            document = get_document(content_hash)
+    return document
+
+def thumbnail_path(content_hash: str, page: int) -> str:
+    return os.path.join(THUMBNAIL_DIR, content_hash, f"{page}.jpg")
+
+def render_thumbnails(pdf_path: str, content_hash: str, first_page: int = 1, last_page: Optional[int] = None) -> int:
+    """Renders small JPEG thumbnails for a page range (all pages by default). Returns how many were written."""
+    from pdf2image import convert_from_path # Poppler-backed, installed with unstructured[pdf]
+    images = convert_from_path(pdf_path, size=(THUMBNAIL_WIDTH, None), first_page=first_page, last_page=last_page)
+    os.makedirs(os.path.join(THUMBNAIL_DIR, content_hash), exist_ok=True)
+    for offset, image in enumerate(images):
+        path = thumbnail_path(content_hash, first_page + offset)
+        tmp_path = path + ".part"
+        image.convert("RGB").save(tmp_path, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+        os.replace(tmp_path, path)
+    return len(images)
+
+def ensure_thumbnail(pdf_path: str, content_hash: str, page: int) -> Optional[str]:
+    """Path of a page thumbnail, rendering just that page if it isn't cached. None if the page doesn't exist."""
+    path = thumbnail_path(content_hash, page)
+    if not os.path.exists(path):
+        render_thumbnails(pdf_path, content_hash, page, page)
+    return path if os.path.exists(path) else None
+
+def reap(keep_hashes: Iterable[str]) -> int:
+    """Drops pages and thumbnails of PDFs no classroom contains any more."""
+    keep = set(keep_hashes)
+    conn = get_connection()
+    stale = [r["content_hash"] for r in conn.execute("SELECT content_hash FROM documents").fetchall()
+             if r["content_hash"] not in keep]
+    with transaction() as conn:
+        for content_hash in stale:
+            conn.execute("DELETE FROM pages WHERE content_hash = ?", (content_hash,))
+            conn.execute("DELETE FROM documents WHERE content_hash = ?", (content_hash,))
+    for name in os.listdir(THUMBNAIL_DIR):
+        if name not in keep:
+            shutil.rmtree(os.path.join(THUMBNAIL_DIR, name), ignore_errors=True)
+    return len(stale)
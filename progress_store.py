@@ -0,0 +1,968 @@
+import os
+import re
+import json
+import time
+import zlib
+import uuid
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import sqlite_db
+
+# --- CONFIG ---
+DATA_ROOT = "data"
+PROGRESS_DIR = os.path.join(DATA_ROOT, "progress")  # One SQLite shard per classroom
+LEGACY_PROGRESS_FILE = os.path.join(DATA_ROOT, "user_progress.json")
+LEGACY_IMPORT_MARKER = os.path.join(PROGRESS_DIR, "_legacy_import.json")
+SHARD_INDEX_DB = os.path.join(DATA_ROOT, "progress_shards.db")  # session_id -> shard file, for listing
+DEFAULT_STUDENT = "default"
+MAX_OPEN_SHARDS = 64  # Per thread
+EVENT_RETENTION_SECONDS = 30 * 24 * 3600  # Older events are packed into compressed segments
+COMPACTION_INTERVAL_SECONDS = 3600
+LEGACY_IMPORT_RETRY_SECONDS = 60
+DAY_SECONDS = 24 * 3600  # Time-at-level is bucketed by the day a student reached their position
+
+os.makedirs(PROGRESS_DIR, exist_ok=True)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS progress (
+    student_id TEXT PRIMARY KEY,
+    xp INTEGER NOT NULL DEFAULT 0,
+    unlocked_level INTEGER NOT NULL DEFAULT 1,
+    current_chapter_index INTEGER NOT NULL DEFAULT 0,
+    retry_available_at REAL,
+    remedial_plan TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_event_id INTEGER NOT NULL DEFAULT 0,
+    position_since REAL,
+    revision INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_progress_position ON progress(current_chapter_index, unlocked_level);
+CREATE TABLE IF NOT EXISTS position_counts (
+    current_chapter_index INTEGER NOT NULL,
+    unlocked_level INTEGER NOT NULL,
+    students INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (current_chapter_index, unlocked_level)
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    student_id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    level INTEGER,
+    score INTEGER,
+    max_score INTEGER,
+    passed INTEGER,
+    xp_delta INTEGER NOT NULL DEFAULT 0,
+    data TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_student ON events(student_id, id);
+CREATE INDEX IF NOT EXISTS idx_events_created ON events(created_at);
+CREATE TABLE IF NOT EXISTS event_segments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    student_id TEXT NOT NULL,
+    first_event_id INTEGER NOT NULL,
+    last_event_id INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    payload BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_segments_student ON event_segments(student_id, last_event_id);
+CREATE TABLE IF NOT EXISTS mistakes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    student_id TEXT NOT NULL,
+    question_hash TEXT NOT NULL,
+    question TEXT NOT NULL,
+    correct_answer TEXT,
+    explanation TEXT,
+    user_answer TEXT,
+    level INTEGER,
+    chapter_index INTEGER,
+    comments TEXT NOT NULL DEFAULT '',
+    timestamp TEXT,
+    UNIQUE(student_id, question_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_mistakes_student ON mistakes(student_id, id);
+CREATE INDEX IF NOT EXISTS idx_mistakes_filter ON mistakes(student_id, level, chapter_index, id);
+CREATE TABLE IF NOT EXISTS question_misses (
+    question_hash TEXT PRIMARY KEY,
+    question TEXT NOT NULL,
+    misses INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_question_misses_count ON question_misses(misses DESC);
+CREATE TABLE IF NOT EXISTS level_attempts (
+    level INTEGER PRIMARY KEY,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    passes INTEGER NOT NULL DEFAULT 0,
+    students INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS student_level_attempts (
+    student_id TEXT NOT NULL,
+    chapter_index INTEGER NOT NULL,
+    level INTEGER NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (student_id, chapter_index, level)
+);
+CREATE TABLE IF NOT EXISTS position_entries (
+    current_chapter_index INTEGER NOT NULL,
+    unlocked_level INTEGER NOT NULL,
+    entered_day INTEGER NOT NULL,
+    students INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (current_chapter_index, unlocked_level, entered_day)
+);
+"""
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    session_id TEXT PRIMARY KEY,
+    shard TEXT NOT NULL
+);
+"""
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+_index_backfilled = False
+_legacy_lock = threading.RLock()  # Re-entered: the import itself opens shards through get_connection
+_legacy_checked = False
+_legacy_running = False
+_legacy_retry_at = 0.0
+# Writes per student committed by this process, for cross-classroom ETags that mustn't open every shard
+PROCESS_TOKEN = uuid.uuid4().hex
+_student_writes = {}
+_student_writes_lock = threading.Lock()
+
+def shard_path(session_id: str) -> str:
+    """Classroom ids are short slugs; anything else is hashed so it can't escape PROGRESS_DIR."""
+    if re.fullmatch(r"[A-Za-z0-9_\-]{1,64}", session_id):
+        name = session_id
+    else:
+        name = "h_" + hashlib.sha1(session_id.encode("utf-8")).hexdigest()
+    return os.path.join(PROGRESS_DIR, f"{name}.db")
+
+def get_connection(session_id: str) -> sqlite3.Connection:
+    """Returns this thread's connection to the classroom shard, creating the schema on first use."""
+    _import_legacy_once()
+    path = shard_path(session_id)
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = OrderedDict()
+
+    conn = conns.get(path)
+    if conn is not None:
+        conns.move_to_end(path)
+        return conn
+
+    conn = sqlite_db.connect(path)  # Cached here rather than in sqlite_db: open shards are bounded per thread
+    if path not in _schema_ready:
+        with _schema_lock:
+            conn.executescript(SCHEMA)
+            _register_shard(session_id, path)
+            _schema_ready.add(path)
+    conns[path] = conn
+    if len(conns) > MAX_OPEN_SHARDS:
+        _, oldest = conns.popitem(last=False)
+        oldest.close()
+    return conn
+
+def normalize_question(text: str) -> str:
+    """Case, whitespace and trailing punctuation differences don't make a new mistake."""
+    return re.sub(r"\s+", " ", (text or "").strip().lower()).rstrip(" ?.!:")
+
+def question_hash(text: str) -> str:
+    return hashlib.sha1(normalize_question(text).encode("utf-8")).hexdigest()
+
+@contextmanager
+def transaction(session_id: str):
+    """Write transaction on one classroom shard. Students whose revision it bumps are counted once it commits."""
+    _local.touched = touched = set()
+    try:
+        with sqlite_db.transaction(get_connection(session_id)) as conn:
+            yield conn
+    finally:
+        _local.touched = None
+    with _student_writes_lock:
+        for student_id in touched:
+            _student_writes[student_id] = _student_writes.get(student_id, 0) + 1
+
+def _mark_written(student_id: str):
+    touched = getattr(_local, "touched", None)
+    if touched is not None:
+        touched.add(student_id)
+
+def _index_connection() -> sqlite3.Connection:
+    return sqlite_db.get_connection(SHARD_INDEX_DB, INDEX_SCHEMA)
+
+def _register_shard(session_id: str, path: str):
+    _index_connection().execute(
+        "INSERT OR IGNORE INTO shards (session_id, shard) VALUES (?, ?)", (session_id, os.path.basename(path))
+    )
+
+def _backfill_index():
+    """
+    Indexes shards created before the index existed. Slug shards are named after their classroom;
+    a hashed shard's classroom can't be recovered from its name, so it is reported instead.
+    """
+    global _index_backfilled
+    if _index_backfilled:
+        return
+    with _schema_lock:
+        if _index_backfilled:
+            return
+        conn = _index_connection()
+        indexed = {r["shard"] for r in conn.execute("SELECT shard FROM shards").fetchall()}
+        for name in os.listdir(PROGRESS_DIR):
+            if not name.endswith(".db") or name in indexed:
+                continue
+            if re.fullmatch(r"h_[0-9a-f]{40}\.db", name):
+                print(f"⚠️ Progress shard {name} has no index entry; its classroom id is unknown")
+                continue
+            conn.execute("INSERT OR IGNORE INTO shards (session_id, shard) VALUES (?, ?)", (name[:-3], name))
+        _index_backfilled = True
+
+def list_sessions() -> List[str]:
+    """Classrooms that have a progress shard, slug or hashed, from the shard index."""
+    _import_legacy_once()
+    _backfill_index()
+    rows = _index_connection().execute("SELECT session_id FROM shards ORDER BY session_id").fetchall()
+    return [r["session_id"] for r in rows]
+
+def _now() -> str:
+    return str(time.time())
+
+def _bump_position(conn: sqlite3.Connection, chapter_index: int, level: int, delta: int):
+    conn.execute(
+        """INSERT INTO position_counts (current_chapter_index, unlocked_level, students) VALUES (?, ?, ?)
+           ON CONFLICT(current_chapter_index, unlocked_level) DO UPDATE SET students = students + excluded.students""",
+        (chapter_index, level, delta)
+    )
+
+def _bump_entry(conn: sqlite3.Connection, chapter_index: int, level: int, since: float, delta: int):
+    conn.execute(
+        """INSERT INTO position_entries (current_chapter_index, unlocked_level, entered_day, students) VALUES (?, ?, ?, ?)
+           ON CONFLICT(current_chapter_index, unlocked_level, entered_day) DO UPDATE SET students = students + excluded.students""",
+        (chapter_index, level, int(since // DAY_SECONDS), delta)
+    )
+
+def _move_position(conn: sqlite3.Connection, student_id: str, old: Optional[tuple], new: tuple,
+                   old_since: Optional[float], now: float):
+    """Keeps position_counts and the time-at-level rollup in step with a student's (chapter, level)."""
+    if old is not None:
+        _bump_position(conn, old[0], old[1], -1)
+        if old_since is not None:
+            _bump_entry(conn, old[0], old[1], old_since, -1)
+    _bump_position(conn, new[0], new[1], 1)
+    _bump_entry(conn, new[0], new[1], now, 1)
+    conn.execute("UPDATE progress SET position_since = ? WHERE student_id = ?", (now, student_id))
+
+def _count_attempt(conn: sqlite3.Connection, student_id: str, chapter_index: int, level: int, passed: bool):
+    """Attempts-per-level rollup; `students` counts distinct (student, chapter) pairs that tried the level."""
+    cur = conn.execute(
+        "INSERT OR IGNORE INTO student_level_attempts (student_id, chapter_index, level) VALUES (?, ?, ?)",
+        (student_id, chapter_index, level)
+    )
+    conn.execute(
+        "UPDATE student_level_attempts SET attempts = attempts + 1 WHERE student_id = ? AND chapter_index = ? AND level = ?",
+        (student_id, chapter_index, level)
+    )
+    conn.execute(
+        """INSERT INTO level_attempts (level, attempts, passes, students) VALUES (?, 1, ?, ?)
+           ON CONFLICT(level) DO UPDATE SET attempts = attempts + 1, passes = passes + excluded.passes,
+               students = students + excluded.students""",
+        (level, int(bool(passed)), cur.rowcount)
+    )
+
+def _ensure_row(conn: sqlite3.Connection, student_id: str):
+    cur = conn.execute("INSERT OR IGNORE INTO progress (student_id) VALUES (?)", (student_id,))
+    if cur.rowcount == 1:
+        _move_position(conn, student_id, None, (0, 1), None, time.time())
+
+def _insert_mistake(conn: sqlite3.Connection, student_id: str, m: Dict, level, chapter_index,
+                    comments: str, timestamp: str) -> bool:
+    """Deduplicates on UNIQUE(student_id, question_hash): one index probe per mistake."""
+    qhash = question_hash(m["question"])
+    cur = conn.execute(
+        """INSERT OR IGNORE INTO mistakes
+           (student_id, question_hash, question, correct_answer, explanation, user_answer,
+            level, chapter_index, comments, timestamp)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        (student_id, qhash, m["question"], m.get("correct_answer"), m.get("explanation"),
+         m.get("user_answer"), level, chapter_index, comments, timestamp)
+    )
+    if cur.rowcount != 1:
+        return False
+    # Counts distinct students who missed the question
+    conn.execute(
+        """INSERT INTO question_misses (question_hash, question, misses) VALUES (?, ?, 1)
+           ON CONFLICT(question_hash) DO UPDATE SET misses = misses + 1""",
+        (qhash, m["question"])
+    )
+    return True
+
+def _append_event(conn: sqlite3.Connection, student_id: str, event_type: str, xp_delta: int = 0,
+                  level: int = None, score: int = None, max_score: int = None, passed: bool = None,
+                  data: Dict = None, created_at: float = None) -> int:
+    """Appends to the student's log and advances the snapshot's event pointer. Never updates old events."""
+    cur = conn.execute(
+        """INSERT INTO events (student_id, type, level, score, max_score, passed, xp_delta, data, created_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        (student_id, event_type, level, score, max_score, None if passed is None else int(passed),
+         xp_delta, json.dumps(data) if data is not None else None,
+         time.time() if created_at is None else created_at)
+    )
+    conn.execute(
+        "UPDATE progress SET last_event_id = ?, attempts = attempts + ?, revision = revision + 1 WHERE student_id = ?",
+        (cur.lastrowid, 1 if event_type == "attempt" else 0, student_id)
+    )
+    _mark_written(student_id)
+    return cur.lastrowid
+
+def _touch(conn: sqlite3.Connection, student_id: str):
+    """Bumps the student's revision for writes that don't log an event (comments, plans, cooldown cleanup)."""
+    conn.execute("UPDATE progress SET revision = revision + 1 WHERE student_id = ?", (student_id,))
+    _mark_written(student_id)
+
+def _row_to_state(row: sqlite3.Row) -> Dict:
+    state = {
+        "xp": row["xp"],
+        "unlocked_level": row["unlocked_level"],
+        "current_chapter_index": row["current_chapter_index"],
+        "attempts": row["attempts"],
+    }
+    if row["retry_available_at"] is not None:
+        state["retry_available_at"] = row["retry_available_at"]
+    if row["remedial_plan"] is not None:
+        state["remedial_plan"] = json.loads(row["remedial_plan"])
+    return state
+
+def _mistake_to_dict(row: sqlite3.Row) -> Dict:
+    return {
+        "id": row["id"],
+        "question_hash": row["question_hash"],
+        "question": row["question"],
+        "correct_answer": row["correct_answer"],
+        "explanation": row["explanation"],
+        "user_answer": row["user_answer"],
+        "level": row["level"],
+        "chapter_index": row["chapter_index"],
+        "comments": row["comments"],
+        "timestamp": row["timestamp"],
+    }
+
+def _event_to_dict(row) -> Dict:
+    """Works for sqlite rows and for the plain dicts stored in compacted segments."""
+    event = {
+        "id": row["id"],
+        "type": row["type"],
+        "xp_delta": row["xp_delta"],
+        "timestamp": str(row["created_at"]),
+    }
+    if row["type"] == "attempt":
+        event.update({
+            "level": row["level"],
+            "score": row["score"],
+            "max_score": row["max_score"],
+            "passed": bool(row["passed"]),
+            "xp_gained": row["xp_delta"],
+        })
+    if row["data"]:
+        event["data"] = json.loads(row["data"])
+    return event
+
+# --- PER-STUDENT READS ---
+
+def get_state(session_id: str, student_id: str = DEFAULT_STUDENT) -> Optional[Dict]:
+    """Returns a student's progress row in a classroom (no history or mistakes), or None."""
+    row = get_connection(session_id).execute(
+        "SELECT * FROM progress WHERE student_id = ?", (student_id,)
+    ).fetchone()
+    return _row_to_state(row) if row else None
+
+def get_revision(session_id: str, student_id: str = DEFAULT_STUDENT) -> Optional[Dict]:
+    """
+    Cheap version check for polling: {"revision", "retry_available_at", "remedial_status"}, or None.
+    The revision goes up on every write to the student's progress, log, mistakes or plan.
+    """
+    row = get_connection(session_id).execute(
+        """SELECT revision, retry_available_at, json_extract(remedial_plan, '$.status') AS remedial_status
+           FROM progress WHERE student_id = ?""", (student_id,)
+    ).fetchone()
+    return dict(row) if row else None
+
+def get_process_revision(student_id: str = DEFAULT_STUDENT) -> tuple:
+    """
+    Version of the student's data across every classroom without opening the shards: writes this
+    process has committed for them, tagged with the process. Assumes one server process owns the
+    store (as the in-memory response caches already do); a restart changes every tag.
+    """
+    with _student_writes_lock:
+        return (PROCESS_TOKEN, _student_writes.get(student_id, 0))
+
+def get_recent_attempts(session_id: str, student_id: str = DEFAULT_STUDENT, limit: int = 10) -> List[Dict]:
+    """Latest attempts, oldest first. Bounded, so dashboards never deserialize the full log."""
+    page = get_history_page(session_id, student_id, limit=limit, event_type="attempt")
+    return list(reversed(page["items"]))
+
+def _segment_events(conn: sqlite3.Connection, student_id: str, before_id: Optional[int]):
+    """Yields compacted events newest first, starting below before_id."""
+    query = "SELECT payload FROM event_segments WHERE student_id = ?"
+    params = [student_id]
+    if before_id is not None:
+        query += " AND first_event_id < ?"
+        params.append(before_id)
+    for seg in conn.execute(query + " ORDER BY last_event_id DESC", params).fetchall():
+        for e in reversed(json.loads(zlib.decompress(seg["payload"]))):
+            if before_id is None or e["id"] < before_id:
+                yield e
+
+def get_history_page(session_id: str, student_id: str = DEFAULT_STUDENT, cursor: Optional[int] = None,
+                     limit: int = 50, event_type: Optional[str] = None) -> Dict:
+    """
+    Newest-first page of the student's event log, hot rows first and then compacted segments.
+    `cursor` is the `next_cursor` of the previous page (an event id, exclusive).
+    """
+    conn = get_connection(session_id)
+    query = "SELECT * FROM events WHERE student_id = ?"
+    params = [student_id]
+    if cursor is not None:
+        query += " AND id < ?"
+        params.append(cursor)
+    if event_type:
+        query += " AND type = ?"
+        params.append(event_type)
+    rows = conn.execute(query + " ORDER BY id DESC LIMIT ?", params + [limit + 1]).fetchall()
+    items = [_event_to_dict(r) for r in rows]
+
+    if len(items) <= limit:
+        before = items[-1]["id"] if items else cursor
+        for e in _segment_events(conn, student_id, before):
+            if event_type and e["type"] != event_type:
+                continue
+            items.append(_event_to_dict(e))
+            if len(items) > limit:
+                break
+
+    has_more = len(items) > limit
+    items = items[:limit]
+    return {
+        "items": items,
+        "next_cursor": items[-1]["id"] if has_more and items else None
+    }
+
+def iter_events(session_id: str, student_id: str = DEFAULT_STUDENT):
+    """Full log, oldest first (segments, then hot rows). For replay and exports."""
+    return _iter_events(get_connection(session_id), student_id)
+
+def _iter_events(conn: sqlite3.Connection, student_id: str):
+    for seg in conn.execute(
+        "SELECT payload FROM event_segments WHERE student_id = ? ORDER BY first_event_id", (student_id,)
+    ).fetchall():
+        for e in json.loads(zlib.decompress(seg["payload"])):
+            yield _event_to_dict(e)
+    for r in conn.execute("SELECT * FROM events WHERE student_id = ? ORDER BY id", (student_id,)).fetchall():
+        yield _event_to_dict(r)
+
+def get_mistakes(session_id: str, student_id: str = DEFAULT_STUDENT) -> List[Dict]:
+    """Every mistake of a student in one classroom, oldest first. API paths use get_mistakes_page."""
+    rows = get_connection(session_id).execute(
+        "SELECT * FROM mistakes WHERE student_id = ? ORDER BY id", (student_id,)
+    ).fetchall()
+    return [_mistake_to_dict(r) for r in rows]
+
+def _query_mistakes(session_id: str, student_id: str, before_id: Optional[int], limit: int,
+                    level: Optional[int], chapter_index: Optional[int]) -> List[Dict]:
+    query = "SELECT * FROM mistakes WHERE student_id = ?"
+    params = [student_id]
+    if level is not None:
+        query += " AND level = ?"
+        params.append(level)
+    if chapter_index is not None:
+        query += " AND chapter_index = ?"
+        params.append(chapter_index)
+    if before_id is not None:
+        query += " AND id < ?"
+        params.append(before_id)
+    rows = get_connection(session_id).execute(query + " ORDER BY id DESC LIMIT ?", params + [limit]).fetchall()
+    return [_mistake_to_dict(r) for r in rows]
+
+def get_mistakes_page(session_id: str, student_id: str = DEFAULT_STUDENT, cursor: Optional[int] = None,
+                      limit: int = 50, level: Optional[int] = None, chapter_index: Optional[int] = None) -> Dict:
+    """Newest-first page of a student's mistakes in one classroom. `cursor` is the previous page's next_cursor."""
+    items = _query_mistakes(session_id, student_id, cursor, limit + 1, level, chapter_index)
+    has_more = len(items) > limit
+    items = items[:limit]
+    return {"items": items, "next_cursor": items[-1]["id"] if has_more else None}
+
+def get_all_mistakes_page(student_id: str = DEFAULT_STUDENT, cursor: Optional[str] = None, limit: int = 50,
+                          level: Optional[int] = None, chapter_index: Optional[int] = None) -> Dict:
+    """
+    A student's mistakes across classroom shards, shard by shard (newest first within each).
+    The cursor is "<session_id>:<mistake id>"; only shards from the cursor's onwards are touched.
+    """
+    start_session, before_id = None, None
+    if cursor:
+        start_session, _, last_id = cursor.rpartition(":")
+        if not start_session or not (last_id.isascii() and last_id.isdigit()):
+            raise ValueError(f"Invalid cursor: {cursor!r}")
+        before_id = int(last_id)
+
+    items = []
+    for session_id in list_sessions():
+        if start_session is not None and session_id < start_session:
+            continue
+        shard_cursor = before_id if session_id == start_session else None
+        for m in _query_mistakes(session_id, student_id, shard_cursor, limit + 1 - len(items), level, chapter_index):
+            m["session_id"] = session_id
+            items.append(m)
+        if len(items) > limit:
+            break
+
+    has_more = len(items) > limit
+    items = items[:limit]
+    next_cursor = f"{items[-1]['session_id']}:{items[-1]['id']}" if has_more else None
+    return {"items": items, "next_cursor": next_cursor}
+
+# --- CLASS-WIDE INDEXES ---
+
+def count_students(session_id: str) -> int:
+    row = get_connection(session_id).execute(
+        "SELECT COALESCE(SUM(students), 0) AS n FROM position_counts"
+    ).fetchone()
+    return row["n"]
+
+def get_position_counts(session_id: str) -> List[Dict]:
+    """Students per (chapter, level). Maintained on write, so this is O(chapters), not O(students)."""
+    rows = get_connection(session_id).execute(
+        "SELECT * FROM position_counts WHERE students > 0 ORDER BY current_chapter_index, unlocked_level"
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+def get_students_at_level(session_id: str, chapter_index: int, level: int,
+                          limit: int = 100, offset: int = 0) -> List[str]:
+    rows = get_connection(session_id).execute(
+        """SELECT student_id FROM progress WHERE current_chapter_index = ? AND unlocked_level = ?
+           ORDER BY student_id LIMIT ? OFFSET ?""",
+        (chapter_index, level, limit, offset)
+    ).fetchall()
+    return [r["student_id"] for r in rows]
+
+def count_students_on_chapters(session_id: str, chapter_indices: List[int]) -> int:
+    """Used for "past deadline": callers pass the chapters whose deadline has expired."""
+    if not chapter_indices:
+        return 0
+    placeholders = ",".join("?" for _ in chapter_indices)
+    row = get_connection(session_id).execute(
+        f"SELECT COALESCE(SUM(students), 0) AS n FROM position_counts WHERE current_chapter_index IN ({placeholders})",
+        list(chapter_indices)
+    ).fetchone()
+    return row["n"]
+
+def get_students_on_chapters(session_id: str, chapter_indices: List[int],
+                             limit: int = 100, offset: int = 0) -> List[str]:
+    if not chapter_indices:
+        return []
+    placeholders = ",".join("?" for _ in chapter_indices)
+    rows = get_connection(session_id).execute(
+        f"""SELECT student_id FROM progress WHERE current_chapter_index IN ({placeholders})
+            ORDER BY student_id LIMIT ? OFFSET ?""",
+        list(chapter_indices) + [limit, offset]
+    ).fetchall()
+    return [r["student_id"] for r in rows]
+
+def get_most_missed_questions(session_id: str, limit: int = 10) -> List[Dict]:
+    rows = get_connection(session_id).execute(
+        "SELECT question_hash, question, misses FROM question_misses ORDER BY misses DESC LIMIT ?", (limit,)
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+def get_question_misses(session_id: str) -> List[Dict]:
+    """Every missed question in the classroom with its miss count (one row per distinct question)."""
+    rows = get_connection(session_id).execute(
+        "SELECT question_hash, question, misses FROM question_misses WHERE misses > 0"
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+def get_miss_counts(session_id: str, question_hashes: List[str]) -> Dict[str, int]:
+    """Miss counts of just these questions (primary-key lookups)."""
+    if not question_hashes:
+        return {}
+    rows = get_connection(session_id).execute(
+        f"SELECT question_hash, misses FROM question_misses WHERE question_hash IN ({','.join('?' * len(question_hashes))})",
+        list(question_hashes)
+    ).fetchall()
+    return {r["question_hash"]: r["misses"] for r in rows}
+
+def get_level_attempt_stats(session_id: str) -> List[Dict]:
+    """Per level: attempts, passes and how many (student, chapter) pairs attempted it."""
+    rows = get_connection(session_id).execute("SELECT * FROM level_attempts ORDER BY level").fetchall()
+    return [dict(r) for r in rows]
+
+def get_time_at_position(session_id: str) -> List[Dict]:
+    """
+    Students per (chapter, level, day they reached it). Rows grow with positions x days,
+    not with class size, so callers can bucket time-at-level cheaply.
+    """
+    rows = get_connection(session_id).execute(
+        "SELECT * FROM position_entries WHERE students > 0 ORDER BY current_chapter_index, unlocked_level, entered_day"
+    ).fetchall()
+    return [{**dict(r), "entered_at": r["entered_day"] * DAY_SECONDS} for r in rows]
+
+# --- ATOMIC WRITES ---
+
+def add_xp(session_id: str, amount: int, student_id: str = DEFAULT_STUDENT) -> int:
+    """Atomically increments XP (creating the row if needed) and returns the new total."""
+    with transaction(session_id) as conn:
+        _ensure_row(conn, student_id)
+        conn.execute("UPDATE progress SET xp = xp + ? WHERE student_id = ?", (amount, student_id))
+        _append_event(conn, student_id, "xp_grant", xp_delta=amount)
+        return conn.execute("SELECT xp FROM progress WHERE student_id = ?", (student_id,)).fetchone()["xp"]
+
+def spend_xp(session_id: str, amount: int, student_id: str = DEFAULT_STUDENT) -> bool:
+    """Atomically decrements XP only if the balance covers it."""
+    with transaction(session_id) as conn:
+        cur = conn.execute(
+            "UPDATE progress SET xp = xp - ? WHERE student_id = ? AND xp >= ?",
+            (amount, student_id, amount)
+        )
+        if cur.rowcount != 1:
+            return False
+        _append_event(conn, student_id, "xp_spend", xp_delta=-amount)
+        return True
+
+def record_attempt(session_id: str, level: int, score: int, max_score: int, passed: bool,
+                   xp_gained: int, mistakes: List[Dict] = None, remedial_plan: Dict = None,
+                   retry_available_at: float = None, student_id: str = DEFAULT_STUDENT) -> Dict:
+    """
+    Applies one assessment submission in a single transaction:
+    XP, level unlocks / chapter advance, cooldown, attempt event, new mistakes and class indexes.
+    Returns the updated progress state.
+    """
+    with transaction(session_id) as conn:
+        _ensure_row(conn, student_id)
+        row = conn.execute("SELECT * FROM progress WHERE student_id = ?", (student_id,)).fetchone()
+        old_position = (row["current_chapter_index"], row["unlocked_level"])
+        unlocked_level = row["unlocked_level"]
+        chapter_index = row["current_chapter_index"]
+
+        if passed:
+            if level in (1, 2) and unlocked_level < level + 1:
+                unlocked_level = level + 1
+            elif level == 3:
+                # Chapter mastered: move to next chapter, reset level to 1
+                chapter_index += 1
+                unlocked_level = 1
+            conn.execute(
+                """UPDATE progress SET xp = xp + ?, unlocked_level = ?, current_chapter_index = ?,
+                   retry_available_at = NULL, remedial_plan = NULL WHERE student_id = ?""",
+                (xp_gained, unlocked_level, chapter_index, student_id)
+            )
+            if (chapter_index, unlocked_level) != old_position:
+                _move_position(conn, student_id, old_position, (chapter_index, unlocked_level),
+                               row["position_since"], time.time())
+        else:
+            conn.execute(
+                "UPDATE progress SET retry_available_at = ?, remedial_plan = COALESCE(?, remedial_plan) WHERE student_id = ?",
+                (retry_available_at, json.dumps(remedial_plan) if remedial_plan else None, student_id)
+            )
+
+        now = _now()
+        _append_event(conn, student_id, "attempt", xp_delta=xp_gained if passed else 0,
+                      level=level, score=score, max_score=max_score, passed=passed)
+        _count_attempt(conn, student_id, old_position[0], level, passed)
+        for m in mistakes or []:
+            _insert_mistake(conn, student_id, m, level, old_position[0], "", now)
+
+        row = conn.execute("SELECT * FROM progress WHERE student_id = ?", (student_id,)).fetchone()
+        return _row_to_state(row)
+
+def update_mistake_comment(session_id: str, question_text: str, comment: str,
+                           student_id: str = DEFAULT_STUDENT) -> bool:
+    """Looks the mistake up by its normalized-question hash (unique index), not by scanning."""
+    with transaction(session_id) as conn:
+        cur = conn.execute(
+            "UPDATE mistakes SET comments = ? WHERE student_id = ? AND question_hash = ?",
+            (comment, student_id, question_hash(question_text))
+        )
+        if cur.rowcount > 0:
+            _touch(conn, student_id)
+        return cur.rowcount > 0
+
+def set_remedial_plan(session_id: str, plan_id: str, plan: Dict, student_id: str = DEFAULT_STUDENT) -> bool:
+    """
+    Replaces the pending remedial plan `plan_id` with the finished one.
+    No-op if the student has since passed, retried or let the cooldown expire.
+    """
+    with transaction(session_id) as conn:
+        cur = conn.execute(
+            """UPDATE progress SET remedial_plan = ?
+               WHERE student_id = ? AND json_extract(remedial_plan, '$.plan_id') = ?""",
+            (json.dumps(plan), student_id, plan_id)
+        )
+        if cur.rowcount > 0:
+            _touch(conn, student_id)
+        return cur.rowcount > 0
+
+def clear_cooldown(session_id: str, student_id: str = DEFAULT_STUDENT):
+    """Drops an expired cooldown together with its remedial plan."""
+    with transaction(session_id) as conn:
+        conn.execute(
+            "UPDATE progress SET retry_available_at = NULL, remedial_plan = NULL, revision = revision + 1 WHERE student_id = ?",
+            (student_id,)
+        )
+        _mark_written(student_id)
+
+# --- LEGACY DOCUMENT VIEW ---
+
+def load_all() -> Dict:
+    """
+    Builds {session_id: {student_id: {...}}} for every shard.
+    O(total students): only for exports and tooling.
+    """
+    progress = {}
+    for session_id in list_sessions():
+        conn = get_connection(session_id)
+        students = {}
+        for row in conn.execute("SELECT * FROM progress").fetchall():
+            data = _row_to_state(row)
+            data["history"] = [e for e in iter_events(session_id, row["student_id"]) if e["type"] == "attempt"]
+            data["mistakes"] = get_mistakes(session_id, row["student_id"])
+            students[row["student_id"]] = data
+        progress[session_id] = students
+    return progress
+
+def _write_student(conn: sqlite3.Connection, student_id: str, data: Dict):
+    old = conn.execute(
+        "SELECT current_chapter_index, unlocked_level FROM progress WHERE student_id = ?", (student_id,)
+    ).fetchone()
+    if old:
+        _bump_position(conn, old["current_chapter_index"], old["unlocked_level"], -1)
+    remedial_plan = data.get("remedial_plan")
+    chapter_index = data.get("current_chapter_index", 0)
+    unlocked_level = data.get("unlocked_level", 1)
+    conn.execute(
+        """INSERT INTO progress (student_id, xp, unlocked_level, current_chapter_index, retry_available_at, remedial_plan)
+           VALUES (?, ?, ?, ?, ?, ?)
+           ON CONFLICT(student_id) DO UPDATE SET xp = excluded.xp, unlocked_level = excluded.unlocked_level,
+               current_chapter_index = excluded.current_chapter_index,
+               retry_available_at = excluded.retry_available_at, remedial_plan = excluded.remedial_plan,
+               attempts = 0, last_event_id = 0""",
+        (student_id, data.get("xp", 0), unlocked_level, chapter_index,
+         data.get("retry_available_at"), json.dumps(remedial_plan) if remedial_plan else None)
+    )
+    _bump_position(conn, chapter_index, unlocked_level, 1)
+
+    # Rewritten log: the given attempts, then a checkpoint pinning the imported totals
+    conn.execute("DELETE FROM events WHERE student_id = ?", (student_id,))
+    conn.execute("DELETE FROM event_segments WHERE student_id = ?", (student_id,))
+    for h in data.get("history", []):
+        _append_event(conn, student_id, "attempt", xp_delta=h.get("xp_gained", 0),
+                      level=h.get("level"), score=h.get("score"), max_score=h.get("max_score"),
+                      passed=bool(h.get("passed")), created_at=_as_float(h.get("timestamp")))
+    _append_event(conn, student_id, "checkpoint", data={
+        "xp": data.get("xp", 0), "unlocked_level": unlocked_level, "current_chapter_index": chapter_index
+    })
+
+    for r in conn.execute("SELECT question_hash FROM mistakes WHERE student_id = ?", (student_id,)).fetchall():
+        conn.execute("UPDATE question_misses SET misses = misses - 1 WHERE question_hash = ?", (r["question_hash"],))
+    conn.execute("DELETE FROM mistakes WHERE student_id = ?", (student_id,))
+    for m in data.get("mistakes", []):
+        _insert_mistake(conn, student_id, m, m.get("level"), m.get("chapter_index"),
+                        m.get("comments") or "", str(m.get("timestamp", "0")))
+
+def _as_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def save_all(progress: Dict):
+    """Replaces the given students wholesale ({session_id: {student_id: {...}}}). Prefer the row-level writers above."""
+    for session_id, students in progress.items():
+        with transaction(session_id) as conn:
+            for student_id, data in students.items():
+                if isinstance(data, dict):
+                    _write_student(conn, student_id, data)
+            _rebuild_rollups(conn)
+
+# --- SNAPSHOT MAINTENANCE ---
+
+def replay_snapshot(session_id: str, student_id: str = DEFAULT_STUDENT) -> Dict:
+    """Rebuilds XP / level / chapter from the log. Used to audit the incrementally maintained snapshot."""
+    state = {"xp": 0, "unlocked_level": 1, "current_chapter_index": 0, "attempts": 0}
+    for e in iter_events(session_id, student_id):
+        if e["type"] == "checkpoint":
+            state.update(e["data"])
+            continue
+        state["xp"] += e["xp_delta"]
+        if e["type"] == "attempt":
+            state["attempts"] += 1
+            if e["passed"]:
+                if e["level"] in (1, 2) and state["unlocked_level"] < e["level"] + 1:
+                    state["unlocked_level"] = e["level"] + 1
+                elif e["level"] == 3:
+                    state["current_chapter_index"] += 1
+                    state["unlocked_level"] = 1
+    return state
+
+def _rebuild_rollups(conn: sqlite3.Connection):
+    """
+    Recomputes every class-wide rollup of a shard from the progress rows, the event log and mistakes.
+    Runs inside the caller's transaction.
+    """
+    for table in ("position_counts", "position_entries", "level_attempts", "student_level_attempts", "question_misses"):
+        conn.execute(f"DELETE FROM {table}")
+
+    now = time.time()
+    for row in conn.execute("SELECT * FROM progress").fetchall():
+        student_id = row["student_id"]
+        position = (0, 1)
+        since = None
+        for e in _iter_events(conn, student_id):
+            at = _as_float(e["timestamp"]) or now
+            since = at if since is None else since
+            if e["type"] == "checkpoint":
+                new_position = (e["data"].get("current_chapter_index", 0), e["data"].get("unlocked_level", 1))
+            elif e["type"] == "attempt":
+                _count_attempt(conn, student_id, position[0], e["level"], e["passed"])
+                new_position = position
+                if e["passed"]:
+                    if e["level"] in (1, 2) and position[1] < e["level"] + 1:
+                        new_position = (position[0], e["level"] + 1)
+                    elif e["level"] == 3:
+                        new_position = (position[0] + 1, 1)
+            else:
+                continue
+            if new_position != position:
+                position, since = new_position, at
+
+        # The snapshot is authoritative; if the log disagrees, keep whatever entry time we had
+        snapshot = (row["current_chapter_index"], row["unlocked_level"])
+        if position != snapshot or since is None:
+            since = row["position_since"] or now
+        conn.execute("UPDATE progress SET position_since = ? WHERE student_id = ?", (since, student_id))
+        _bump_position(conn, snapshot[0], snapshot[1], 1)
+        _bump_entry(conn, snapshot[0], snapshot[1], since, 1)
+
+    conn.execute(
+        """INSERT INTO question_misses (question_hash, question, misses)
+           SELECT question_hash, MIN(question), COUNT(*) FROM mistakes GROUP BY question_hash"""
+    )
+
+def rebuild_rollups(session_id: str):
+    """Backfill job for one classroom's analytics rollups."""
+    with transaction(session_id) as conn:
+        _rebuild_rollups(conn)
+
+def rebuild_all_rollups() -> int:
+    sessions = list_sessions()
+    for session_id in sessions:
+        rebuild_rollups(session_id)
+    print(f"📊 Rebuilt analytics rollups for {len(sessions)} classrooms")
+    return len(sessions)
+
+def compact_events(session_id: str, older_than: float = None) -> int:
+    """
+    Packs each student's events older than the retention window into one compressed segment.
+    Totals are unaffected (the snapshot already includes them) and history pagination reads segments.
+    Returns the number of events compacted.
+    """
+    cutoff = time.time() - EVENT_RETENTION_SECONDS if older_than is None else older_than
+    compacted = 0
+    with transaction(session_id) as conn:
+        students = [r["student_id"] for r in conn.execute(
+            "SELECT DISTINCT student_id FROM events WHERE created_at < ?", (cutoff,)
+        ).fetchall()]
+        for student_id in students:
+            rows = conn.execute(
+                "SELECT * FROM events WHERE student_id = ? AND created_at < ? ORDER BY id", (student_id, cutoff)
+            ).fetchall()
+            payload = zlib.compress(json.dumps([dict(r) for r in rows]).encode("utf-8"))
+            conn.execute(
+                """INSERT INTO event_segments (student_id, first_event_id, last_event_id, count, payload)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (student_id, rows[0]["id"], rows[-1]["id"], len(rows), payload)
+            )
+            conn.execute(
+                "DELETE FROM events WHERE student_id = ? AND id <= ? AND created_at < ?",
+                (student_id, rows[-1]["id"], cutoff)
+            )
+            compacted += len(rows)
+    return compacted
+
+def compact_all_sessions() -> int:
+    total = 0
+    for session_id in list_sessions():
+        try:
+            total += compact_events(session_id)
+        except Exception as e:
+            print(f"⚠️ Event compaction failed for {session_id}: {e}")
+    if total:
+        print(f"🗜️ Compacted {total} progress events")
+    return total
+
+def start_compactor(interval: float = COMPACTION_INTERVAL_SECONDS):
+    """Runs compact_all_sessions at startup and then periodically, on a daemon thread."""
+    def loop():
+        while True:
+            try:
+                compact_all_sessions()
+            except Exception as e:
+                print(f"⚠️ Event compaction failed: {e}")
+            time.sleep(interval)
+    threading.Thread(target=loop, name="progress-compactor", daemon=True).start()
+
+# --- ONE-SHOT IMPORT ---
+
+def import_legacy(force: bool = False) -> int:
+    """
+    Imports classroom-keyed progress (user_progress.json) as each classroom's DEFAULT_STUDENT.
+    Returns the number of classrooms imported (0 if already done or nothing to import).
+    """
+    if os.path.exists(LEGACY_IMPORT_MARKER) and not force:
+        return 0
+
+    legacy = {}
+    if os.path.exists(LEGACY_PROGRESS_FILE):
+        with open(LEGACY_PROGRESS_FILE, "r") as f:
+            legacy.update({k: v for k, v in json.load(f).items() if isinstance(v, dict)})
+
+    save_all({session_id: {DEFAULT_STUDENT: data} for session_id, data in legacy.items()})
+
+    with open(LEGACY_IMPORT_MARKER, "w") as f:
+        json.dump({"sessions": len(legacy), "at": time.time()}, f)
+    if legacy:
+        print(f"📦 Imported {len(legacy)} classrooms into {PROGRESS_DIR}")
+    return len(legacy)
+
+def _import_legacy_once():
+    """
+    Runs import_legacy before the first shard access. A failed import is logged, not raised into the
+    request that triggered it, and retried after LEGACY_IMPORT_RETRY_SECONDS.
+    """
+    global _legacy_checked, _legacy_running, _legacy_retry_at
+    if _legacy_checked:
+        return
+    with _legacy_lock:
+        if _legacy_checked or _legacy_running or time.time() < _legacy_retry_at:
+            return
+        _legacy_running = True
+        try:
+            import_legacy()
+            _legacy_checked = True
+        except Exception as e:
+            _legacy_retry_at = time.time() + LEGACY_IMPORT_RETRY_SECONDS
+            print(f"⚠️ Legacy progress import failed, retrying in {LEGACY_IMPORT_RETRY_SECONDS}s: {e}")
+        finally:
+            _legacy_running = False
+
+if __name__ == "__main__":
+    import sys
+    if "--rebuild-rollups" in sys.argv:
+        # Analytics backfill: python progress_store.py --rebuild-rollups
+        rebuild_all_rollups()
+    else:
+        # Manual re-import: python progress_store.py
+        import_legacy(force=True)
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import random
+import sqlite3
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+import sqlite_db
+from progress_store import question_hash
+
+# --- CONFIG ---
+DATA_ROOT = "data"
+BANK_DB = os.path.join(DATA_ROOT, "question_bank.db")
+
+os.makedirs(DATA_ROOT, exist_ok=True)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    chapter_hash TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    prompt_version TEXT NOT NULL,
+    topic TEXT NOT NULL DEFAULT '',
+    difficulty TEXT NOT NULL DEFAULT '',
+    question_hash TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    provisional INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    UNIQUE(session_id, chapter_hash, level, prompt_version, question_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_items_bank ON items(session_id, chapter_hash, level, prompt_version, topic, difficulty);
+CREATE TABLE IF NOT EXISTS served (
+    student_id TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+    served_at REAL NOT NULL,
+    PRIMARY KEY (student_id, item_id)
+);
+"""
+
+# A bank is identified by (session_id, chapter_hash, level, prompt_version)
+BankKey = Tuple[str, str, int, str]
+
+def get_connection() -> sqlite3.Connection:
+    return sqlite_db.get_connection(BANK_DB, SCHEMA)
+
+def transaction():
+    return sqlite_db.transaction(get_connection())
+
+def add_items(key: BankKey, items: List[Dict], provisional: bool = False) -> int:
+    """
+    Adds generated questions to a bank, skipping ones it already holds. Returns how many were new.
+    Provisional items (generated before the chapter was indexed) are dropped as soon as a regular pool arrives.
+    """
+    added = 0
+    with transaction() as conn:
+        if not provisional and any(isinstance(item, dict) and item.get("question") for item in items):
+            cur = conn.execute(
+                """DELETE FROM items WHERE session_id = ? AND chapter_hash = ? AND level = ? AND prompt_version = ?
+                   AND provisional = 1""", key
+            )
+            if cur.rowcount:
+                conn.execute("DELETE FROM served WHERE item_id NOT IN (SELECT id FROM items)")
+        for item in items:
+            if not isinstance(item, dict) or not item.get("question"):
+                continue
+            cur = conn.execute(
+                """INSERT OR IGNORE INTO items
+                   (session_id, chapter_hash, level, prompt_version, topic, difficulty, question_hash, payload,
+                    provisional, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (*key, str(item.get("topic") or ""), str(item.get("difficulty") or ""),
+                 question_hash(item["question"]), json.dumps(item), int(provisional), time.time())
+            )
+            added += cur.rowcount
+    return added
+
+def count_items(key: BankKey) -> int:
+    return get_connection().execute(
+        """SELECT COUNT(*) AS n FROM items
+           WHERE session_id = ? AND chapter_hash = ? AND level = ? AND prompt_version = ?""", key
+    ).fetchone()["n"]
+
+def is_provisional(key: BankKey) -> bool:
+    """True while the bank still holds questions generated from the raw PDF instead of the index."""
+    return get_connection().execute(
+        """SELECT 1 FROM items WHERE session_id = ? AND chapter_hash = ? AND level = ? AND prompt_version = ?
+           AND provisional = 1 LIMIT 1""", key
+    ).fetchone() is not None
+
+def get_items(key: BankKey) -> List[Dict]:
+    rows = get_connection().execute(
+        """SELECT payload FROM items
+           WHERE session_id = ? AND chapter_hash = ? AND level = ? AND prompt_version = ? ORDER BY id""", key
+    ).fetchall()
+    return [json.loads(r["payload"]) for r in rows]
+
+def session_revision(session_id: str, prompt_version: str) -> Tuple:
+    """Changes whenever a bank of the session gains or loses items: ((chapter_hash, level, count, max id), ...)."""
+    rows = get_connection().execute(
+        """SELECT chapter_hash, level, COUNT(*) AS n, MAX(id) AS last FROM items
+           WHERE session_id = ? AND prompt_version = ? GROUP BY chapter_hash, level ORDER BY chapter_hash, level""",
+        (session_id, prompt_version)
+    ).fetchall()
+    return tuple((r["chapter_hash"], r["level"], r["n"], r["last"]) for r in rows)
+
+def count_unseen(key: BankKey, student_id: str) -> int:
+    return get_connection().execute(
+        """SELECT COUNT(*) AS n FROM items i
+           LEFT JOIN served s ON s.item_id = i.id AND s.student_id = ?
+           WHERE i.session_id = ? AND i.chapter_hash = ? AND i.level = ? AND i.prompt_version = ?
+             AND s.item_id IS NULL""", (student_id, *key)
+    ).fetchone()["n"]
+
+def sample_for_student(key: BankKey, student_id: str, count: int, balance_topics: bool = True,
+                       exclude: Iterable[str] = ()) -> List[Dict]:
+    """
+    Draws `count` questions without replacement, preferring ones the student has never been served
+    (then the least recently served). With balance_topics, picks rotate across topics.
+    Question hashes in `exclude` are never picked (e.g. already streamed in this attempt).
+    The draw is recorded so the next attempt gets different questions.
+    """
+    exclude = set(exclude)
+    with transaction() as conn:
+        rows = conn.execute(
+            """SELECT i.id, i.topic, i.question_hash, i.payload, s.served_at FROM items i
+               LEFT JOIN served s ON s.item_id = i.id AND s.student_id = ?
+               WHERE i.session_id = ? AND i.chapter_hash = ? AND i.level = ? AND i.prompt_version = ?""",
+            (student_id, *key)
+        ).fetchall()
+        rows = [r for r in rows if r["question_hash"] not in exclude]
+
+        unseen = [r for r in rows if r["served_at"] is None]
+        seen = sorted((r for r in rows if r["served_at"] is not None), key=lambda r: r["served_at"])
+
+        picked = _pick(unseen, count, balance_topics)
+        if len(picked) < count:
+            picked += seen[:count - len(picked)]
+
+        now = time.time()
+        conn.executemany(
+            "INSERT OR REPLACE INTO served (student_id, item_id, served_at) VALUES (?, ?, ?)",
+            [(student_id, r["id"], now) for r in picked]
+        )
+    return [json.loads(r["payload"]) for r in picked]
+
+def mark_served(key: BankKey, student_id: str, questions: List[Dict]):
+    """Records questions handed out outside sample_for_student (streamed straight from generation)."""
+    hashes = [question_hash(q["question"]) for q in questions if q.get("question")]
+    if not hashes:
+        return
+    now = time.time()
+    with transaction() as conn:
+        conn.executemany(
+            """INSERT OR REPLACE INTO served (student_id, item_id, served_at)
+               SELECT ?, id, ? FROM items
+               WHERE session_id = ? AND chapter_hash = ? AND level = ? AND prompt_version = ? AND question_hash = ?""",
+            [(student_id, now, *key, h) for h in hashes]
+        )
+
+def _pick(rows: List, count: int, balance_topics: bool) -> List:
+    rows = list(rows)
+    random.shuffle(rows)
+    if not balance_topics:
+        return rows[:count]
+
+    by_topic = defaultdict(list)
+    for r in rows:
+        by_topic[r["topic"]].append(r)
+    queues = list(by_topic.values())
+    random.shuffle(queues)
+
+    picked = []
+    while len(picked) < count and any(queues):
+        for queue in queues:
+            if queue and len(picked) < count:
+                picked.append(queue.pop())
+    return picked
+
+def list_sessions() -> List[str]:
+    return [r["session_id"] for r in get_connection().execute("SELECT DISTINCT session_id FROM items").fetchall()]
+
+def reap(session_id: str, keep_chapter_hashes: List[str], prompt_version: str) -> int:
+    """Drops banks of chapter versions no longer in the session, or from an older prompt, with their served rows."""
+    placeholders = ",".join("?" * len(keep_chapter_hashes)) or "''"
+    with transaction() as conn:
+        cur = conn.execute(
+            f"""DELETE FROM items WHERE session_id = ?
+                AND (chapter_hash NOT IN ({placeholders}) OR prompt_version != ?)""",
+            (session_id, *keep_chapter_hashes, prompt_version)
+        )
+        if cur.rowcount:
+            conn.execute("DELETE FROM served WHERE item_id NOT IN (SELECT id FROM items)")
+    return cur.rowcount
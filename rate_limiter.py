@@ -0,0 +1,52 @@
+import time
+import threading
+
+import metrics
+import tracing
+
+class _MeteredSemaphore(threading.BoundedSemaphore):
+    """BoundedSemaphore that reports how long callers wait for a slot and how many are waiting."""
+
+    def __init__(self, value: int):
+        super().__init__(value)
+        self.limit = value
+        self.waiting = 0
+        self.in_use = 0
+        self._counts_lock = threading.Lock()
+
+    def _count(self, waiting: int = 0, in_use: int = 0):
+        with self._counts_lock:
+            self.waiting += waiting
+            self.in_use += in_use
+
+    def acquire(self, blocking=True, timeout=None):
+        start = time.perf_counter()
+        self._count(waiting=1)
+        try:
+            with tracing.span("rate_limit.wait"):
+                acquired = super().acquire(blocking, timeout)
+        finally:
+            self._count(waiting=-1)
+        if acquired:
+            self._count(in_use=1)
+            metrics.inc("cote_rate_limit_wait_seconds_total", time.perf_counter() - start)
+        return acquired
+
+    def release(self, n=1):
+        self._count(in_use=-n)
+        super().release(n)
+
+    # threading.Semaphore binds __enter__ to its own acquire, so route `with` through ours
+    def __enter__(self):
+        return self.acquire()
+
+# Global semaphore to limit TOTAL concurrent API calls across ingestion, assessments and flashcards.
+# Tier 1 has 2000 RPM but 1M TPM. Keeping this low prevents hitting the TPM limit with large chunks.
+api_semaphore = _MeteredSemaphore(3)
+# Note: Google's 429 error is often wrapped in an InternalServerError or similar in LangChain,
+# but we can retry on general exceptions if they look like rate limits.
+
+metrics.register_collector("cote_llm_slots", "gauge", "Shared LLM concurrency slots",
+                           lambda: {(("state", "in_use"),): api_semaphore.in_use,
+                                    (("state", "waiting"),): api_semaphore.waiting,
+                                    (("state", "limit"),): api_semaphore.limit})
@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+import sqlite_db
+from progress_store import question_hash
+
+# --- CONFIG ---
+DATA_ROOT = "data"
+REMEDIAL_DB = os.path.join(DATA_ROOT, "remedial_cache.db")
+
+os.makedirs(DATA_ROOT, exist_ok=True)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS diagnoses (
+    session_id TEXT NOT NULL,
+    chapter_hash TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    question_hash TEXT NOT NULL,
+    answer_hash TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (session_id, chapter_hash, prompt_version, question_hash, answer_hash)
+);
+CREATE TABLE IF NOT EXISTS plans (
+    session_id TEXT NOT NULL,
+    chapter_hash TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    set_hash TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (session_id, chapter_hash, prompt_version, set_hash)
+);
+"""
+
+# Entries are scoped to one version of a chapter's assessment: (session_id, chapter_hash, prompt_version).
+# A re-uploaded chapter or a new prompt version gets a new scope, so old plans are never served for it.
+Scope = Tuple[str, str, str]
+
+def get_connection() -> sqlite3.Connection:
+    return sqlite_db.get_connection(REMEDIAL_DB, SCHEMA)
+
+def transaction():
+    return sqlite_db.transaction(get_connection())
+
+def mistake_key(mistake: Dict) -> Tuple[str, str]:
+    """(question hash, wrong-answer hash), both on normalized text."""
+    return question_hash(mistake.get("question") or ""), question_hash(str(mistake.get("user_answer") or ""))
+
+def mistake_set_hash(mistakes: List[Dict]) -> str:
+    """Order-independent hash of a set of (question, wrong answer) pairs."""
+    pairs = sorted({f"{q}:{a}" for q, a in (mistake_key(m) for m in mistakes)})
+    return hashlib.sha1("|".join(pairs).encode("utf-8")).hexdigest()
+
+def get_plan(scope: Scope, set_hash: str) -> Optional[Dict]:
+    conn = get_connection()
+    row = conn.execute(
+        """SELECT payload FROM plans
+           WHERE session_id = ? AND chapter_hash = ? AND prompt_version = ? AND set_hash = ?""",
+        (*scope, set_hash)
+    ).fetchone()
+    if row is None:
+        return None
+    conn.execute(
+        """UPDATE plans SET hits = hits + 1
+           WHERE session_id = ? AND chapter_hash = ? AND prompt_version = ? AND set_hash = ?""",
+        (*scope, set_hash)
+    )
+    return json.loads(row["payload"])
+
+def put_plan(scope: Scope, set_hash: str, plan: Dict):
+    get_connection().execute(
+        """INSERT OR REPLACE INTO plans (session_id, chapter_hash, prompt_version, set_hash, payload, created_at)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        (*scope, set_hash, json.dumps(plan), time.time())
+    )
+
+def get_diagnoses(scope: Scope, mistakes: List[Dict]) -> Dict[Tuple[str, str], Dict]:
+    """Cached per-question diagnoses for these mistakes, by mistake_key."""
+    found = {}
+    with transaction() as conn:
+        for key in {mistake_key(m) for m in mistakes}:
+            row = conn.execute(
+                """SELECT payload FROM diagnoses WHERE session_id = ? AND chapter_hash = ? AND prompt_version = ?
+                   AND question_hash = ? AND answer_hash = ?""",
+                (*scope, *key)
+            ).fetchone()
+            if row is not None:
+                found[key] = json.loads(row["payload"])
+                conn.execute(
+                    """UPDATE diagnoses SET hits = hits + 1 WHERE session_id = ? AND chapter_hash = ?
+                       AND prompt_version = ? AND question_hash = ? AND answer_hash = ?""",
+                    (*scope, *key)
+                )
+    return found
+
+def put_diagnoses(scope: Scope, diagnoses: Dict[Tuple[str, str], Dict]):
+    now = time.time()
+    with transaction() as conn:
+        conn.executemany(
+            """INSERT OR REPLACE INTO diagnoses
+               (session_id, chapter_hash, prompt_version, question_hash, answer_hash, payload, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            [(*scope, *key, json.dumps(d), now) for key, d in diagnoses.items()]
+        )
+
+def invalidate(session_id: str, keep_chapter_hashes: List[str], prompt_version: Optional[str] = None) -> int:
+    """Drops entries for chapter versions that are no longer part of the session (and, given one, other prompt versions)."""
+    placeholders = ",".join("?" * len(keep_chapter_hashes)) or "''"
+    removed = 0
+    with transaction() as conn:
+        for table in ("diagnoses", "plans"):
+            cur = conn.execute(
+                f"""DELETE FROM {table} WHERE session_id = ?
+                    AND (chapter_hash NOT IN ({placeholders}) OR prompt_version != COALESCE(?, prompt_version))""",
+                (session_id, *keep_chapter_hashes, prompt_version)
+            )
+            removed += cur.rowcount
+    return removed
@@ -0,0 +1,150 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+try:
+    import brotli # Optional: without it responses are only gzip-compressed
+except ImportError:
+    brotli = None
+
+# In-memory LRU of pre-serialized JSON responses for the hot read endpoints.
+# Every entry carries the stamp it was built from (corpus version, bank revision...);
+# a lookup with a different stamp is a miss and drops the entry, so nothing stale is served.
+# Hits return the stored bytes as-is: no SQLite/Chroma reads, no json.loads, no json.dumps,
+# and cached entries keep their compressed variants, so compression is paid once per version.
+
+ENTRY_OVERHEAD_BYTES = 200 # Rough per-entry cost of the key, stamp and bookkeeping
+COMPRESS_MIN_BYTES = 1024 # Smaller bodies aren't worth compressing
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+def make_etag(*parts) -> str:
+    """Strong ETag derived from version parts (stamps, revisions), not from the body."""
+    return '"' + hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:24] + '"'
+
+class Payload:
+    """A serialized JSON body, its ETag and its compressed variants (built on first use)."""
+
+    def __init__(self, body: bytes, etag: str):
+        self.body = body
+        self.etag = etag
+        self.encodings = {}
+
+    def _compress(self, encoding: str) -> bytes:
+        if encoding not in self.encodings:
+            if encoding == "br":
+                self.encodings[encoding] = brotli.compress(self.body, quality=BROTLI_QUALITY)
+            else:
+                self.encodings[encoding] = gzip.compress(self.body, GZIP_LEVEL)
+        return self.encodings[encoding]
+
+    def precompress(self) -> "Payload":
+        """Builds every variant up front (for cached payloads, which are served many times)."""
+        if len(self.body) >= COMPRESS_MIN_BYTES:
+            self._compress("gzip")
+            if brotli is not None:
+                self._compress("br")
+        return self
+
+    def encoded(self, accept_encoding: str) -> Tuple[bytes, Optional[str]]:
+        """(bytes, Content-Encoding or None) for the client's Accept-Encoding header."""
+        if len(self.body) < COMPRESS_MIN_BYTES:
+            return self.body, None
+        accepted = set()
+        for part in (accept_encoding or "").lower().split(","):
+            name, _, params = part.strip().partition(";")
+            if params.replace(" ", "") not in ("q=0", "q=0.0"):
+                accepted.add(name)
+        if brotli is not None and "br" in accepted:
+            return self._compress("br"), "br"
+        if "gzip" in accepted:
+            return self._compress("gzip"), "gzip"
+        return self.body, None
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(v) for v in self.encodings.values())
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+class ResponseLRU:
+    """Size-bounded (by bytes) LRU: key -> (stamp, Payload)."""
+
+    def __init__(self, name: str, max_bytes: int):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, stamp: Hashable) -> Optional[Payload]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] != stamp:
+                self._drop(key)
+                self.stale += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, stamp: Hashable, payload: Payload):
+        payload.precompress()
+        cost = payload.size + ENTRY_OVERHEAD_BYTES
+        if cost > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (stamp, payload)
+            self.size += cost
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+
+    def _drop(self, key: Hashable):
+        _, payload = self.entries.pop(key)
+        self.size -= payload.size + ENTRY_OVERHEAD_BYTES
+
+    def stats(self) -> Dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+def get_cache(name: str, max_bytes: int) -> ResponseLRU:
+    """Named cache, created on first use (one per endpoint family)."""
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = ResponseLRU(name, max_bytes)
+        return _caches[name]
+
+def get_stats() -> Dict[str, Dict]:
+    """Hit ratio and memory use per cache since startup."""
+    with _caches_lock:
+        caches = list(_caches.values())
+    return {cache.name: cache.stats() for cache in caches}
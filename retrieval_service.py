@@ -1,5 +1,6 @@
 import os
 import json
+import time
 from typing import List, Dict
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_chroma import Chroma
@@ -12,6 +13,8 @@ from tenacity import (
     retry_if_exception_type
 )
 from dotenv import load_dotenv
+import metrics
+import tracing
 
 load_dotenv(override=True)
 
@@ -25,12 +28,17 @@ llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.2)
     stop=stop_after_attempt(5),
     wait=wait_exponential(multiplier=1, min=2, max=10),
     retry=retry_if_exception_type(Exception),
-    before_sleep=lambda retry_state: print(f"⚠️ API Limit hit (Retrieval). Retrying in {retry_state.next_action.sleep} seconds...")
+    before_sleep=metrics.retry_hook("retrieval", " (Retrieval)")
 )
 def generate_ai_response(messages):
     try:
-        return llm.invoke(messages)
+        start = time.perf_counter()
+        with tracing.span("llm.invoke", subsystem="retrieval"):
+            response = llm.invoke(messages)
+        metrics.record_llm_call("retrieval", messages, response.content, time.perf_counter() - start)
+        return response
     except Exception as e:
+        metrics.inc("cote_llm_errors_total", subsystem="retrieval")
         print(f"DEBUG: API call failed with error: {str(e)}")
         # If it's a 429, we want to know the EXACT message (e.g., TPM, RPM, or Account limit)
         raise e
@@ -55,6 +63,7 @@ Rules for your response:
 9. **Analogies**: Always provide at least one analogy for complex concepts.
 """
 
+@tracing.traced("get_doubt_assistant_response")
 def get_doubt_assistant_response(query: str, session_id: str, language: str = "english"):
     """
     Main retrieval pipeline for the Doubt Assistant.
@@ -62,30 +71,33 @@ def get_doubt_assistant_response(query: str, session_id: str, language: str = "e
     # 1. Connect to DB
     db = Chroma(
         persist_directory=CHROMA_PATH,
-        embedding_function=LOCAL_EMBEDDINGS,
+        # Query embedding is reported apart from the MMR search itself
+        embedding_function=metrics.TimedEmbeddings(LOCAL_EMBEDDINGS, "query_embedding"),
         collection_name="hackathon_collection"
     )
 
     # 3. Retrieve context from Vector DB
     print(f"🔍 Searching ChromaDB for session: {session_id} with query: {query}")
-    results = db.max_marginal_relevance_search(
-        query, 
-        k=8, 
-        fetch_k=20, 
-        lambda_mult=0.5, 
-        filter={"session_id": session_id}
-    )
+    with metrics.timed("retrieval"):
+        results = db.max_marginal_relevance_search(
+            query, 
+            k=8, 
+            fetch_k=20, 
+            lambda_mult=0.5, 
+            filter={"session_id": session_id}
+        )
     print(f"📊 Found {len(results)} chunks in ChromaDB")
     
     if not results:
         # Fallback to general search if no session-specific data
         print("⚠️ No session-specific results found. Checking without filter...")
-        results = db.max_marginal_relevance_search(
-            query,
-            k=5,
-            fetch_k=10,
-            lambda_mult=0.5
-        )
+        with metrics.timed("retrieval"):
+            results = db.max_marginal_relevance_search(
+                query,
+                k=5,
+                fetch_k=10,
+                lambda_mult=0.5
+            )
         print(f"📊 Found {len(results)} chunks in Global fallback")
         
         if not results:
@@ -140,7 +152,8 @@ def get_doubt_assistant_response(query: str, session_id: str, language: str = "e
         HumanMessage(content=student_prompt)
     ]
 
-    response = generate_ai_response(messages)
+    with metrics.timed("generation"):
+        response = generate_ai_response(messages)
     return response.content
 
 if __name__ == "__main__":
@@ -0,0 +1,49 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# --- CONFIG ---
+BUSY_TIMEOUT_SECONDS = 30
+
+# Every SQLite store (progress shards, question bank, caches, corpus, pages) goes through here, so
+# they all get the same pragmas, busy timeout and transaction handling: one connection per thread
+# per database file, WAL so readers never block the writer, and autocommit outside transaction().
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+def connect(path: str) -> sqlite3.Connection:
+    """A new connection with the shared settings. Callers that cache connections themselves use this."""
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_SECONDS * 1000}")
+    return conn
+
+def get_connection(path: str, schema: str = "") -> sqlite3.Connection:
+    """This thread's connection to the database at path, running `schema` once per process."""
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = connect(path)
+    if schema and path not in _schema_ready:
+        with _schema_lock:
+            if path not in _schema_ready:
+                conn.executescript(schema)
+                _schema_ready.add(path)
+    return conn
+
+@contextmanager
+def transaction(conn: sqlite3.Connection):
+    """Write transaction. BEGIN IMMEDIATE takes the write lock up front so read-modify-write never races."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
@@ -0,0 +1,234 @@
+import os
+import sys
+import hmac
+import json
+import time
+import uuid
+import threading
+import functools
+import contextvars
+from collections import defaultdict
+from typing import Callable, Dict, Optional
+
+# Opt-in span tracer: a request (X-Trace header) or an ingestion job (trace flag) records a tree
+# of timed spans across the service modules and writes it to TRACE_DIR as JSON, optionally with
+# sampled stacks of the threads involved in folded format (flamegraph.pl / speedscope input).
+# With no trace active, span() is one ContextVar lookup returning a shared no-op.
+
+# --- CONFIG ---
+TRACE_DIR = os.getenv("TRACE_DIR", os.path.join("data", "traces"))
+TRACE_TOKEN = os.getenv("TRACE_TOKEN", "") # Clients can only turn tracing on (X-Trace, upload trace field) with this token
+TRACE_INGESTION = os.getenv("TRACE_INGESTION", "") # "1" or "profile": trace every ingestion job
+MAX_TRACE_FILES = int(os.getenv("MAX_TRACE_FILES", "200")) # Oldest traces are deleted beyond this
+SAMPLE_INTERVAL = 0.005 # Profiler sampling period (seconds)
+MODES = ("1", "profile")
+
+_current = contextvars.ContextVar("trace_span", default=None)
+
+class _Noop:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _Noop()
+
+class Trace:
+    def __init__(self, name: str, profile: bool):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.profile = profile
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+        self.threads = set()
+        self.samples = defaultdict(int)
+        self.finished = False
+        self.root = None
+
+class _Span:
+    def __init__(self, trace: Trace, parent: Optional["_Span"], name: str, attrs: Dict):
+        self.trace = trace
+        self.parent = parent
+        self.name = name
+        self.attrs = attrs
+        self.children = []
+        self.start = 0.0
+        self.duration = None
+        self.error = None
+        self.thread = None
+        self.token = None
+
+    def set(self, **attrs):
+        """Adds attributes to the span once known (result sizes, cache hits...)."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.thread = threading.current_thread().name
+        with self.trace.lock:
+            self.trace.threads.add(threading.get_ident())
+            if self.parent is not None:
+                self.parent.children.append(self)
+        self.token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        _current.reset(self.token)
+        return False
+
+    def to_dict(self) -> Dict:
+        data = {
+            "name": self.name,
+            "start_ms": round((self.start - self.trace.start) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "thread": self.thread,
+        }
+        if self.attrs:
+            data["attrs"] = {k: v if isinstance(v, (int, float, bool, type(None))) else str(v) for k, v in self.attrs.items()}
+        if self.error:
+            data["error"] = self.error
+        if self.children:
+            data["children"] = [c.to_dict() for c in sorted(self.children, key=lambda c: c.start)]
+        return data
+
+def span(name: str, **attrs):
+    """with tracing.span("chapter.partition", file=...): ... (a no-op unless a trace is active)."""
+    parent = _current.get()
+    if parent is None or parent.trace.finished:
+        return _NOOP
+    return _Span(parent.trace, parent, name, attrs)
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Decorator: the whole call is a span (not for generators, which return before running)."""
+    def decorate(fn):
+        label = name or f"{fn.__module__}.{fn.__name__}"
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return fn(*args, **kwargs)
+            with span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def bind(fn: Callable) -> Callable:
+    """Carries the current span into pool threads: pool.submit(tracing.bind(fn), ...)."""
+    parent = _current.get()
+    if parent is None:
+        return fn
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        token = _current.set(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+def authorized(token: Optional[str]) -> bool:
+    """Client-requested tracing is off unless TRACE_TOKEN is configured and matched."""
+    return bool(TRACE_TOKEN) and hmac.compare_digest(token or "", TRACE_TOKEN)
+
+def requested_mode(headers) -> Optional[str]:
+    """Trace mode asked for by a request ("1" or "profile") with a valid X-Trace-Token, or None."""
+    mode = (headers.get("x-trace") or "").strip().lower()
+    if mode not in MODES or not authorized(headers.get("x-trace-token")):
+        return None
+    return mode
+
+def job_mode(flag: str = "") -> Optional[str]:
+    """Trace mode for a background job: its own flag, else TRACE_INGESTION."""
+    for mode in (flag, TRACE_INGESTION):
+        if (mode or "").strip().lower() in MODES:
+            return mode.strip().lower()
+    return None
+
+class start_trace:
+    """
+    with tracing.start_trace("POST /api/assessment/generate", profile=True) as trace: ...
+    Spans opened inside (and in pool threads via bind) form the tree; on exit the trace is
+    written to TRACE_DIR/<id>.json (+ <id>.folded when profiling).
+    """
+
+    def __init__(self, name: str, profile: bool = False, **attrs):
+        self.trace = Trace(name, profile)
+        self.root = _Span(self.trace, None, name, attrs)
+        self.trace.root = self.root
+        self.stop = threading.Event()
+        self.sampler = None
+
+    def __enter__(self) -> Trace:
+        self.root.__enter__()
+        if self.trace.profile:
+            self.sampler = threading.Thread(target=_sample, args=(self.trace, self.stop), daemon=True,
+                                            name=f"trace-sampler-{self.trace.id}")
+            self.sampler.start()
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        self.root.__exit__(exc_type, exc, tb)
+        self.trace.finished = True
+        if self.sampler is not None:
+            self.stop.set()
+            self.sampler.join()
+        try:
+            path = write_trace(self.trace)
+            print(f"🧭 Trace {self.trace.id} ({self.trace.name}, {self.root.duration:.2f}s) written to {path}")
+        except Exception as e:
+            print(f"⚠️ Failed to write trace {self.trace.id}: {e}")
+        return False
+
+def _sample(trace: Trace, stop: threading.Event):
+    """Sampling profiler: stacks of the threads that took part in the trace, every SAMPLE_INTERVAL."""
+    names = {}
+    while not stop.wait(SAMPLE_INTERVAL):
+        frames = sys._current_frames()
+        with trace.lock:
+            thread_ids = list(trace.threads)
+        for ident in thread_ids:
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            if ident not in names:
+                thread = threading._active.get(ident)
+                names[ident] = thread.name if thread else str(ident)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(names[ident])
+            trace.samples[";".join(reversed(stack))] += 1
+
+def write_trace(trace: Trace) -> str:
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(trace.started_at))
+    base = os.path.join(TRACE_DIR, f"{stamp}-{trace.id}")
+    with open(base + ".json", "w") as f:
+        json.dump({
+            "trace_id": trace.id,
+            "name": trace.name,
+            "started_at": trace.started_at,
+            "profiled": trace.profile,
+            "sample_interval_ms": SAMPLE_INTERVAL * 1000 if trace.profile else None,
+            "root": trace.root.to_dict()
+        }, f, indent=2)
+    if trace.profile:
+        with open(base + ".folded", "w") as f:
+            for stack, count in sorted(trace.samples.items()):
+                f.write(f"{stack} {count}\n")
+    _prune()
+    return base + ".json"
+
+def _prune():
+    traces = sorted(name for name in os.listdir(TRACE_DIR) if name.endswith(".json"))
+    for name in traces[:max(len(traces) - MAX_TRACE_FILES, 0)]:
+        for ext in (".json", ".folded"):
+            path = os.path.join(TRACE_DIR, name[:-len(".json")] + ext)
+            if os.path.exists(path):
+                os.remove(path)
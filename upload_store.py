@@ -0,0 +1,76 @@
+import os
+import re
+import hashlib
+import tempfile
+from typing import BinaryIO, Dict
+
+import corpus_store
+
+# --- CONFIG ---
+UPLOAD_ROOT = "uploads"
+CHUNK_BYTES = 1024 * 1024
+MAX_FILE_BYTES = int(os.getenv("MAX_UPLOAD_FILE_MB", "50")) * 1024 * 1024
+MAX_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_MB", "200")) * 1024 * 1024
+PDF_MAGIC = b"%PDF-"
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+class UploadRejected(Exception):
+    """The file was not stored (not a PDF, too large...). The message is safe to show to the client."""
+
+class UploadTooLarge(UploadRejected):
+    """The file went over the size limit it was saved with."""
+
+def session_dir_for(session_id: str) -> str:
+    """The classroom's upload directory; session ids are used as directory names, so they are restricted."""
+    if not _SESSION_ID.match(session_id or ""):
+        raise UploadRejected(f"Invalid session id: {session_id!r}")
+    return os.path.join(UPLOAD_ROOT, session_id)
+
+def safe_filename(filename: str) -> str:
+    """On-disk name for a client-supplied filename: no directories, no hidden files, only plain characters."""
+    name = re.split(r"[\\/]", filename or "")[-1]
+    name = re.sub(r"[^\w .()-]", "_", name).strip(" .")
+    stem, ext = os.path.splitext(name)
+    if not stem or ext.lower() != ".pdf":
+        raise UploadRejected(f"Not a PDF file name: {filename!r}")
+    return stem[:120] + ".pdf"
+
+def save_pdf(source: BinaryIO, session_dir: str, filename: str, max_bytes: int = MAX_FILE_BYTES) -> Dict:
+    """
+    Streams an uploaded PDF to a temp file in session_dir in chunks, hashing it on the way, then
+    renames it into place atomically. Blocking: run it off the event loop.
+    A file whose content is unchanged is not rewritten: returns {"filename", "sha256", "size", "changed"}.
+    """
+    head = source.read(len(PDF_MAGIC))
+    if head != PDF_MAGIC:
+        raise UploadRejected(f"{filename} is not a PDF")
+
+    os.makedirs(session_dir, exist_ok=True)
+    digest = hashlib.sha256(head)
+    size = len(head)
+    fd, tmp_path = tempfile.mkstemp(dir=session_dir, prefix=".upload-", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(head)
+            for block in iter(lambda: source.read(CHUNK_BYTES), b""):
+                size += len(block)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"{filename} is larger than {max_bytes // (1024 * 1024)} MB")
+                digest.update(block)
+                out.write(block)
+
+        sha256 = digest.hexdigest()
+        target = os.path.join(session_dir, filename)
+        # Only the same file name counts as the same upload: a fixed name like the review document
+        # must never resolve to a chapter that happens to have the same bytes
+        if os.path.isfile(target) and corpus_store.file_hash(target) == sha256:
+            os.remove(tmp_path)
+            return {"filename": filename, "sha256": sha256, "size": size, "changed": False}
+
+        os.replace(tmp_path, target)
+        corpus_store.remember_hash(target, sha256)
+        return {"filename": filename, "sha256": sha256, "size": size, "changed": True}
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise